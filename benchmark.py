@@ -0,0 +1,579 @@
+"""Offline, reproducible benchmarks for the download pipeline.
+
+A local HTTP server serves synthetic media (a plain file, an audio track and
+HLS/DASH streams with fragments) and DownloadWorker fetches it through
+yt-dlp's generic extractor, so results depend only on this machine and the
+code under test. FFmpeg is needed for every scenario except the plain file.
+
+Usage:
+    python benchmark.py -o results.json
+    python benchmark.py --repeat 5 --rate 4M --only plain hls
+    python benchmark.py -o new.json --compare old.json
+    python benchmark.py --only soak --soak-jobs 5000 -o soak.json
+
+Results are written as JSON; --compare prints the change of every median
+against a previous run, e.g. one made on another commit.
+
+The soak test is not part of the default run: it pushes thousands of small
+jobs through the main window and samples RSS, threads, Qt objects and live
+DownloadWorker instances, so leaks show up as growth in its second half.
+"""
+import os
+import sys
+import tempfile
+
+# The app keeps caches, journals and downloads under the home directory.
+# Point it at a throwaway one before importing it so real data is never touched.
+BENCH_HOME = tempfile.mkdtemp(prefix="hb_benchmark_")
+os.environ["HOME"] = os.environ["USERPROFILE"] = BENCH_HOME
+
+import argparse
+import datetime
+import gc
+import http.server
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import engine
+from engine import DownloadWorker, JobStatus, TurboTuner
+from storage import APP_DATA_FOLDER, HostTuning
+
+ROOT_FOLDER = Path(__file__).resolve().parent
+CONTENT_TYPES = {
+    ".mp4": "video/mp4",
+    ".m4a": "audio/mp4",
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+    ".mpd": "application/dash+xml",
+    ".m4s": "video/iso.segment",
+}
+SERVER_BLOCK_SIZE = 64 * 1024
+GUI_PROBE_INTERVAL_MS = 5
+SOAK_FILE_SIZE = 64 * 1024
+SOAK_FEED_INTERVAL_MS = 50
+# Every Nth soak job asks for a missing file, every Mth is cancelled while queued
+SOAK_FAILURE_EVERY = 10
+SOAK_CANCEL_EVERY = 25
+# Longer than the update check's own timeout, so it stalls for the whole startup
+STARTUP_STALL_SECONDS = 30
+# How long the stalled run stays up, so the check is in flight before the app quits
+STARTUP_STALL_EXIT_MS = 3000
+SOAK_GROWTH_KEYS = ("rss_mb", "threads", "qt_objects", "widgets", "queue_rows", "jobs_in_memory",
+                    "live_workers")
+
+# name -> (path on the server, media type, quality, format, needs FFmpeg)
+SCENARIOS: Dict[str, Tuple[str, str, str, str, bool]] = {
+    "plain": ("plain.mp4", "Vídeo", "Melhor", "MP4", False),
+    "audio": ("clip.m4a", "Áudio", "192k", "MP3", True),
+    "hls": ("hls/index.m3u8", "Vídeo", "Melhor", "MP4", True),
+    "dash": ("dash/manifest.mpd", "Vídeo", "Melhor", "MP4", True),
+}
+
+
+class MediaRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Serves files from server.root with Range support and an optional per-connection rate.
+
+    A ?rate=BYTES query parameter overrides the server-wide rate for one request and
+    ?delay=SECONDS holds the response back, as a stalled remote server would.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        parts = urlparse(self.path)
+        delay = float(parse_qs(parts.query).get("delay", [0])[0])
+        if delay:
+            self.server.stalled += 1
+            time.sleep(delay)
+        path = (self.server.root / parts.path.lstrip("/")).resolve()
+        if self.server.root not in path.parents or not path.is_file():
+            self.send_error(404)
+            return
+
+        size = path.stat().st_size
+        start, end = 0, size - 1
+        byte_range = self.headers.get("Range", "")
+        if byte_range.startswith("bytes="):
+            first, _, last = byte_range[6:].partition("-")
+            start = int(first or 0)
+            end = min(int(last), size - 1) if last else size - 1
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPES.get(path.suffix, "application/octet-stream"))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+
+        rate = float(parse_qs(parts.query).get("rate", [self.server.rate or 0])[0])
+        remaining = end - start + 1
+        try:
+            with open(path, "rb") as file:
+                file.seek(start)
+                while remaining > 0:
+                    chunk = file.read(min(SERVER_BLOCK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+                    if rate:
+                        time.sleep(len(chunk) / rate)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format: str, *args) -> None:
+        """Keep request logs out of the benchmark output."""
+
+
+class MediaServer(http.server.ThreadingHTTPServer):
+    """Local HTTP server for the synthetic media, running on a background thread."""
+
+    daemon_threads = True
+
+    def __init__(self, root: Path, rate: Optional[float] = None):
+        super().__init__(("127.0.0.1", 0), MediaRequestHandler)
+        self.root = root.resolve()
+        self.rate = rate
+        self.stalled = 0
+        threading.Thread(target=self.serve_forever, daemon=True, name="MediaServer").start()
+
+    def handle_error(self, request, client_address) -> None:
+        """Ignore clients dropping kept-alive connections, as cancelled jobs do."""
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def url(self, path: str) -> str:
+        """Absolute URL of a served file."""
+        return f"http://127.0.0.1:{self.server_address[1]}/{path}"
+
+
+class TimedWorker(DownloadWorker):
+    """DownloadWorker that timestamps its first byte and the end of its transfer."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.first_byte: Optional[float] = None
+        self.transfer_done: Optional[float] = None
+
+    def _progress_hook(self, d: Dict) -> None:
+        super()._progress_hook(d)
+        now = time.perf_counter()
+        if self.first_byte is None and self.downloaded_bytes:
+            self.first_byte = now
+        if self.transfer_done is None and self.finishing:
+            self.transfer_done = now
+
+
+def build_media(root: Path, size: int, duration: int, ffmpeg: Optional[str]) -> None:
+    """Write the synthetic media served during the run."""
+    root.mkdir(parents=True, exist_ok=True)
+    with open(root / "plain.mp4", "wb") as file:
+        for _ in range(size // (1024 * 1024)):
+            file.write(os.urandom(1024 * 1024))
+
+    if ffmpeg is None:
+        return
+
+    video = ["-f", "lavfi", "-i", f"testsrc2=size=640x360:rate=25:duration={duration}",
+             "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+             "-c:v", "libx264", "-preset", "ultrafast", "-b:v", "4M", "-g", "50",
+             "-c:a", "aac", "-b:a", "128k"]
+    (root / "hls").mkdir(exist_ok=True)
+    (root / "dash").mkdir(exist_ok=True)
+    commands = [
+        ["-f", "lavfi", "-i", f"sine=frequency=440:duration={duration * 2}",
+         "-c:a", "aac", "-b:a", "128k", str(root / "clip.m4a")],
+        [*video, "-f", "hls", "-hls_time", "2", "-hls_playlist_type", "vod",
+         "-hls_segment_filename", str(root / "hls" / "seg%03d.ts"), str(root / "hls" / "index.m3u8")],
+        [*video, "-f", "dash", "-seg_duration", "2", "-use_template", "1", "-use_timeline", "0",
+         str(root / "dash" / "manifest.mpd")],
+    ]
+    for command in commands:
+        subprocess.run([ffmpeg, "-y", "-hide_banner", "-loglevel", "error", *command], check=True)
+
+
+def run_job(url: str, media_type: str, quality: str, fmt: str, output: Path,
+            turbo: Optional[TurboTuner]) -> Dict:
+    """Download one URL end to end and return its timings."""
+    engine.DOWNLOADS_FOLDER = output
+    job = TimedWorker(url, media_type, quality, fmt, False, quiet=True, turbo=turbo)
+    start = time.perf_counter()
+    job.run()
+    end = time.perf_counter()
+
+    result = {"status": job.status, "bytes": job.downloaded_bytes, "e2e": end - start}
+    if job.status != JobStatus.DONE:
+        result["message"] = job.message
+    if job.first_byte is not None and job.transfer_done is not None:
+        transfer = job.transfer_done - job.first_byte
+        result.update({
+            "ttfb": job.first_byte - start,
+            "transfer": transfer,
+            "throughput": job.downloaded_bytes / transfer if transfer > 0 else None,
+            "postprocess": end - job.transfer_done,
+        })
+    shutil.rmtree(output, ignore_errors=True)
+    return result
+
+
+def summarize(samples: List[Dict]) -> Dict:
+    """Median of every numeric metric across successful samples."""
+    done = [sample for sample in samples if sample["status"] == JobStatus.DONE]
+    medians = {}
+    for key in ("ttfb", "transfer", "throughput", "postprocess", "e2e", "bytes"):
+        values = [sample[key] for sample in done if sample.get(key) is not None]
+        if values:
+            medians[key] = statistics.median(values)
+    return {"samples": samples, "median": medians, "failures": len(samples) - len(done)}
+
+
+def bench_downloads(server: MediaServer, names: List[str], repeat: int, ffmpeg: Optional[str],
+                    turbo: bool, work: Path) -> Dict:
+    """Run every selected download scenario repeat times."""
+    tuner = TurboTuner(HostTuning(work / "host_tuning.json")) if turbo else None
+    results = {}
+    for name in names:
+        path, media_type, quality, fmt, needs_ffmpeg = SCENARIOS[name]
+        if needs_ffmpeg and ffmpeg is None:
+            results[name] = {"skipped": "FFmpeg not found"}
+            continue
+        samples = [run_job(server.url(path), media_type, quality, fmt, work / f"{name}-{index}", tuner)
+                   for index in range(repeat)]
+        results[name] = summarize(samples)
+        print(f"{name}: {results[name]['median']}", file=sys.stderr)
+    return results
+
+
+def bench_gui(server: MediaServer, jobs: int, rate: float) -> Dict:
+    """Event-loop lateness of the main window while several jobs report progress."""
+    try:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PyQt5 import QtCore, QtWidgets
+
+        app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+        import main
+    except ImportError as e:
+        return {"skipped": str(e)}
+
+    window = main.DownloaderUI()
+    window.show()
+    engine.DOWNLOADS_FOLDER = Path(BENCH_HOME) / "gui"
+    for index in range(jobs):
+        # Distinct names so the jobs do not write to the same output file
+        name = f"gui-{index}.mp4"
+        if not (server.root / name).exists():
+            os.link(server.root / "plain.mp4", server.root / name)
+        url = server.url(f"{name}?rate={rate:.0f}")
+        window._enqueue(DownloadWorker(url, "Vídeo", "Melhor", "MP4", False, quiet=True))
+
+    lateness: List[float] = []
+    loop = QtCore.QEventLoop()
+    last = [time.perf_counter()]
+
+    def probe() -> None:
+        now = time.perf_counter()
+        lateness.append(max(0.0, (now - last[0]) * 1000 - GUI_PROBE_INTERVAL_MS))
+        last[0] = now
+        if window.scheduler.is_idle():
+            loop.quit()
+
+    timer = QtCore.QTimer()
+    timer.setTimerType(QtCore.Qt.PreciseTimer)
+    timer.timeout.connect(probe)
+    timer.start(GUI_PROBE_INTERVAL_MS)
+    loop.exec_()
+    timer.stop()
+
+    failures = sum(job.status != JobStatus.DONE for job in window.scheduler.jobs())
+    window.close()
+    lateness.sort()
+    return {
+        "jobs": jobs,
+        "failures": failures,
+        "samples": len(lateness),
+        "lateness_ms": {
+            "p50": lateness[len(lateness) // 2],
+            "p95": lateness[int(len(lateness) * 0.95)],
+            "max": lateness[-1],
+        },
+    }
+
+
+def process_stats() -> Dict:
+    """Resident memory and thread count of this process."""
+    rss = None
+    try:
+        with open("/proc/self/statm", encoding="ascii") as file:
+            rss = int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+
+            # Peak rather than current RSS, in KB on Linux and bytes on macOS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            rss = peak if sys.platform == "darwin" else peak * 1024
+        except ImportError:
+            pass
+    return {"rss_mb": round(rss / (1024 * 1024), 1) if rss else None,
+            "threads": threading.active_count()}
+
+
+def bench_soak(server: MediaServer, jobs: int, interval: float) -> Dict:
+    """Push many small jobs through the main window, sampling resource use over time."""
+    try:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PyQt5 import QtCore, QtWidgets
+
+        app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+        import main
+    except ImportError as e:
+        return {"skipped": str(e)}
+
+    window = main.DownloaderUI()
+    window.show()
+    scheduler = window.scheduler
+    output = Path(BENCH_HOME) / "soak"
+    (server.root / "soak.mp4").write_bytes(os.urandom(SOAK_FILE_SIZE))
+    max_pending = scheduler.max_workers * 2
+    submitted = [0]
+    statuses: Dict[str, int] = {}
+    # A job is notified more than once once finished; count each one once
+    counted: Set[int] = set()
+    samples: List[Dict] = []
+    start = time.perf_counter()
+
+    def on_job_changed(job) -> None:
+        # Called from worker threads; only finished jobs matter here
+        if job.status not in JobStatus.FINISHED or job.job_id in counted:
+            return
+        counted.add(job.job_id)
+        statuses[job.status] = statuses.get(job.status, 0) + 1
+        if job.status == JobStatus.DONE:
+            (output / f"soak-{job.job_id}.mp4").unlink(missing_ok=True)
+
+    def feed() -> None:
+        while submitted[0] < jobs and scheduler.pending_count() < max_pending:
+            index = submitted[0]
+            submitted[0] += 1
+            name = "missing.mp4" if index % SOAK_FAILURE_EVERY == SOAK_FAILURE_EVERY - 1 else "soak.mp4"
+            job = DownloadWorker(server.url(f"{name}?job={index}"), "Vídeo", "Melhor", "MP4", False,
+                                 quiet=True, output_dir=output)
+            job.output_template = f"soak-{job.job_id}.%(ext)s"
+            window._enqueue(job)
+            if index % SOAK_CANCEL_EVERY == SOAK_CANCEL_EVERY - 1:
+                scheduler.cancel(job.job_id)
+        if submitted[0] >= jobs and scheduler.is_idle():
+            loop.quit()
+
+    def sample() -> None:
+        gc.collect()
+        samples.append({
+            "seconds": round(time.perf_counter() - start, 1),
+            "finished": submitted[0] - scheduler.pending_count(),
+            **process_stats(),
+            "qt_objects": len(window.findChildren(QtCore.QObject)),
+            "widgets": len(QtWidgets.QApplication.allWidgets()),
+            "queue_rows": window.queue_view.topLevelItemCount(),
+            "jobs_in_memory": len(scheduler.jobs()),
+            "live_workers": sum(isinstance(obj, DownloadWorker) for obj in gc.get_objects()),
+        })
+        print(f"soak: {samples[-1]}", file=sys.stderr)
+
+    scheduler.listeners.append(on_job_changed)
+    loop = QtCore.QEventLoop()
+    feeder = QtCore.QTimer()
+    feeder.timeout.connect(feed)
+    feeder.start(SOAK_FEED_INTERVAL_MS)
+    sampler = QtCore.QTimer()
+    sampler.timeout.connect(sample)
+    sampler.start(int(interval * 1000))
+    sample()
+    loop.exec_()
+    feeder.stop()
+    sampler.stop()
+    app.processEvents()
+    sample()
+    scheduler.listeners.remove(on_job_changed)
+    window.close()
+
+    # Bounded structures level off early; a leak keeps growing through the second half
+    middle, last = samples[len(samples) // 2], samples[-1]
+    growth = {key: round(last[key] - middle[key], 1) for key in SOAK_GROWTH_KEYS
+              if last[key] is not None and middle[key] is not None}
+    return {
+        "jobs": jobs,
+        "statuses": statuses,
+        "seconds": round(time.perf_counter() - start, 1),
+        "history_limit": scheduler.history_limit,
+        "second_half_growth": growth,
+        "samples": samples,
+    }
+
+
+def bench_startup(server: MediaServer, repeat: int) -> Dict:
+    """Launch the app until its first window, repeat times.
+
+    The update check is pointed at the local server, once answering at once and once
+    stalled past its timeout; the stalled run stays up until the check is in flight,
+    so a check that holds up startup shows in stalled_first_window_ms.
+    """
+    from main import APP_VERSION
+
+    (server.root / "latest_version.txt").write_text(APP_VERSION, encoding="utf-8")
+    runs = {
+        "": (server.url("latest_version.txt"), 1),
+        "stalled_": (server.url(f"latest_version.txt?delay={STARTUP_STALL_SECONDS}"),
+                     STARTUP_STALL_EXIT_MS),
+    }
+    profile_path = APP_DATA_FOLDER / "startup_profile.json"
+    cache_path = APP_DATA_FOLDER / "update_check.json"
+    samples = []
+    for _ in range(repeat):
+        sample = {}
+        for prefix, (version_url, exit_ms) in runs.items():
+            env = dict(os.environ, HB_STARTUP_TIMING="1", HB_STARTUP_EXIT=str(exit_ms),
+                       HB_VERSION_URL=version_url)
+            env.setdefault("QT_QPA_PLATFORM", "offscreen")
+            # A cached answer would skip the request being measured
+            cache_path.unlink(missing_ok=True)
+            profile_path.unlink(missing_ok=True)
+            start = time.perf_counter()
+            process = subprocess.run([sys.executable, str(ROOT_FOLDER / "main.py")], env=env,
+                                     capture_output=True, timeout=120)
+            wall = (time.perf_counter() - start) * 1000
+            if process.returncode != 0 or not profile_path.exists():
+                return {"skipped": process.stderr.decode(errors="replace")[-500:]}
+            profile = json.loads(profile_path.read_text(encoding="utf-8"))
+            sample[f"{prefix}first_window_ms"] = profile["first_window"]
+            sample[f"{prefix}imports_ms"] = profile["imports"]
+            if not prefix:
+                sample["process_ms"] = wall
+        samples.append(sample)
+
+    return {
+        "samples": samples,
+        "median": {key: statistics.median(sample[key] for sample in samples)
+                   for key in samples[0]},
+        # Runs whose update check reached the stalled endpoint before the app quit
+        "stalled_checks": server.stalled,
+    }
+
+
+def environment() -> Dict:
+    """What the numbers were measured on."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_FOLDER,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    try:
+        from yt_dlp.version import __version__ as yt_dlp_version
+    except ImportError:
+        yt_dlp_version = None
+
+    return {
+        "commit": commit,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "yt_dlp": yt_dlp_version,
+    }
+
+
+def compare(baseline: Dict, current: Dict) -> None:
+    """Print the relative change of every median found in both result sets."""
+    for section in ("downloads", "startup"):
+        old_section = baseline.get(section, {})
+        new_section = current.get(section, {})
+        scenarios = {"": new_section} if section == "startup" else new_section
+        for name, result in scenarios.items():
+            old = (old_section.get(name, {}) if name else old_section).get("median", {})
+            for metric, value in result.get("median", {}).items():
+                if old.get(metric):
+                    label = ".".join(filter(None, (section, name, metric)))
+                    print(f"{label}: {old[metric]:.4g} -> {value:.4g} "
+                          f"({(value - old[metric]) * 100 / old[metric]:+.1f}%)")
+
+    old_gui = baseline.get("gui", {}).get("lateness_ms", {})
+    for metric, value in current.get("gui", {}).get("lateness_ms", {}).items():
+        if metric in old_gui:
+            print(f"gui.lateness_ms.{metric}: {old_gui[metric]:.3g} -> {value:.3g}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    from cli import parse_rate
+
+    parser = argparse.ArgumentParser(description="Benchmarks offline do HB Downloader")
+    parser.add_argument("-o", "--output", help="arquivo JSON de resultados (padrão: stdout)")
+    parser.add_argument("--compare", metavar="JSON", help="comparar com um resultado anterior")
+    parser.add_argument("--repeat", type=int, default=3, help="execuções por cenário")
+    parser.add_argument("--only", nargs="+", choices=[*SCENARIOS, "gui", "startup", "soak"],
+                        help="rodar apenas estes cenários (soak só roda quando pedido)")
+    parser.add_argument("--size", type=int, default=64, help="tamanho do arquivo simples em MB")
+    parser.add_argument("--duration", type=int, default=30,
+                        help="duração em segundos das mídias HLS/DASH")
+    parser.add_argument("--rate", type=parse_rate, help="banda por conexão do servidor, ex.: 4M")
+    parser.add_argument("--turbo", action="store_true", help="baixar com o modo turbo")
+    parser.add_argument("--gui-jobs", type=int, default=4, help="downloads simultâneos no teste da UI")
+    parser.add_argument("--soak-jobs", type=int, default=2000, help="jobs sintéticos do teste de resistência")
+    parser.add_argument("--soak-interval", type=float, default=5.0,
+                        help="segundos entre amostras do teste de resistência")
+    parser.add_argument("--soak-history", type=int,
+                        help="jobs finalizados mantidos em memória durante o teste (HB_JOB_HISTORY)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point."""
+    args = parse_args(argv)
+    selected = args.only or [*SCENARIOS, "gui", "startup"]
+    ffmpeg = shutil.which("ffmpeg")
+    work = Path(BENCH_HOME) / "work"
+
+    try:
+        build_media(work / "media", args.size * 1024 * 1024, args.duration, ffmpeg)
+        server = MediaServer(work / "media", args.rate)
+        results = {"environment": environment(), "settings": {
+            "repeat": args.repeat, "size_mb": args.size, "duration": args.duration,
+            "rate": args.rate, "turbo": args.turbo, "ffmpeg": ffmpeg,
+        }}
+
+        names = [name for name in SCENARIOS if name in selected]
+        results["downloads"] = bench_downloads(server, names, args.repeat, ffmpeg, args.turbo, work)
+        if "gui" in selected:
+            # Throttled so the jobs report progress for a few seconds
+            results["gui"] = bench_gui(server, args.gui_jobs, rate=args.size * 1024 * 1024 / 4)
+        if "startup" in selected:
+            results["startup"] = bench_startup(server, args.repeat)
+        if "soak" in selected:
+            if args.soak_history is not None:
+                os.environ["HB_JOB_HISTORY"] = str(args.soak_history)
+            results["soak"] = bench_soak(server, args.soak_jobs, args.soak_interval)
+        server.shutdown()
+    finally:
+        shutil.rmtree(BENCH_HOME, ignore_errors=True)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+    else:
+        print(text)
+
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text(encoding="utf-8")), results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""Headless batch mode: streams a URL list through the download engine without Qt.
+
+Usage:
+    python cli.py urls.txt -j 4 --type audio --quality 320k --format mp3
+    python cli.py urls.txt --type audio --also opus:192k --also flac:320k
+    python cli.py urls.txt --limit 2M --schedule 22:00-07:00=0
+    python cli.py urls.txt -j 8 --processes
+    python cli.py urls.txt -o /media/videos --staging /media/.staging
+    cat urls.txt | python cli.py - --type video --quality 720p
+
+One JSON object is written to stdout per finished job.
+"""
+import argparse
+import datetime
+import json
+import sys
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+from engine import (
+    AUDIO_QUALITIES, DEFAULT_MAX_WORKERS, DEFAULT_PER_HOST_LIMIT, DEFAULT_POSTPROCESS_WORKERS,
+    SUPPORTED_AUDIO_FORMATS, SUPPORTED_VIDEO_FORMATS, VIDEO_QUALITIES,
+    BandwidthManager, DownloadScheduler, DownloadWorker, JobStatus, TurboTuner
+)
+from metrics import METRICS_PATH, MetricsExporter
+from processes import ProcessPool
+from storage import InfoCache, JobJournal, LibraryIndex
+
+MEDIA_TYPES = {"video": "Vídeo", "audio": "Áudio"}
+RATE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+class ResultWriter:
+    """Writes one JSON line per finished job, safe to call from worker threads."""
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+
+    def write(self, job: DownloadWorker, started: float) -> None:
+        """Emit the result record for a finished job."""
+        elapsed = time.monotonic() - started
+        record = {
+            "id": job.job_id,
+            "url": job.url,
+            "status": job.status,
+            "message": job.message,
+            "elapsed": round(elapsed, 3),
+            "bytes": job.downloaded_bytes,
+            "avg_speed": round(job.downloaded_bytes / elapsed) if elapsed > 0 else 0,
+        }
+        if job.parent is not None:
+            record["playlist"] = job.parent.job_id
+        if job.is_playlist:
+            record["entries"] = job.entries_finished
+        if job.selection is not None:
+            record["selection"] = job.selection.summary
+            record["cpu_saved"] = round(job.selection.cpu_saved, 1)
+        with self.lock:
+            self.counts[job.status] = self.counts.get(job.status, 0) + 1
+            self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.stream.flush()
+
+
+def iter_urls(stream: TextIO) -> Iterator[str]:
+    """Yield URLs from a stream lazily, skipping blanks and comments."""
+    for line in stream:
+        url = line.strip()
+        if url and not url.startswith("#"):
+            yield url
+
+
+def parse_rate(text: str) -> Optional[float]:
+    """Parse a rate such as 500K or 2.5M into bytes per second; 0 means unlimited."""
+    text = text.strip().upper().removesuffix("/S").removesuffix("B")
+    unit = text[-1:] if text[-1:] in RATE_UNITS else ""
+    rate = float(text[:len(text) - len(unit)]) * RATE_UNITS[unit]
+    return rate or None
+
+
+def parse_window(text: str) -> Tuple[datetime.time, datetime.time, Optional[float]]:
+    """Parse a schedule window such as 22:00-07:00=0 into (start, end, rate)."""
+    span, _, rate = text.partition("=")
+    start, _, end = span.partition("-")
+    return (datetime.time.fromisoformat(start), datetime.time.fromisoformat(end),
+            parse_rate(rate or "0"))
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="HB Downloader em modo headless")
+    parser.add_argument("input", nargs="?", default="-",
+                        help="arquivo com uma URL por linha ('-' para stdin)")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_MAX_WORKERS,
+                        help="downloads em paralelo")
+    parser.add_argument("--per-host", type=int, default=DEFAULT_PER_HOST_LIMIT,
+                        help="downloads simultâneos por host")
+    parser.add_argument("--postprocess-jobs", type=int, default=DEFAULT_POSTPROCESS_WORKERS,
+                        help="conversões FFmpeg em paralelo")
+    parser.add_argument("--type", choices=sorted(MEDIA_TYPES), default="video")
+    parser.add_argument("--quality", help="ex.: Melhor, 720p, 320k")
+    parser.add_argument("--format", help="ex.: mp4, mkv, mp3, opus")
+    parser.add_argument("--no-audio", action="store_true", help="vídeo sem áudio")
+    parser.add_argument("--also", action="append", default=[], metavar="FORMATO:QUALIDADE",
+                        help="áudio: gerar também este formato a partir do mesmo download")
+    parser.add_argument("--limit", type=parse_rate, metavar="TAXA",
+                        help="banda total, ex.: 500K, 2M (0 = sem limite)")
+    parser.add_argument("--schedule", type=parse_window, action="append", default=[],
+                        metavar="HH:MM-HH:MM=TAXA",
+                        help="limite diferente neste horário, ex.: 22:00-07:00=0")
+    parser.add_argument("--turbo", action="store_true",
+                        help="várias conexões por download, ajustadas automaticamente por host")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="não reutilizar metadados extraídos anteriormente")
+    parser.add_argument("--no-library", action="store_true",
+                        help="baixar de novo mesmo o que já está na biblioteca")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="gravar métricas por job neste arquivo JSON lines (rotativo)")
+    parser.add_argument("--prometheus", metavar="PATH",
+                        help="manter contadores neste textfile do Prometheus")
+    parser.add_argument("--journal", metavar="PATH",
+                        help="registrar os jobs neste arquivo e retomar os que ficaram pendentes")
+    parser.add_argument("--processes", action="store_true",
+                        help="executar cada job em um processo próprio (cancelamento imediato)")
+    parser.add_argument("-o", "--output-dir", metavar="PASTA",
+                        help="pasta de destino (padrão: Downloads)")
+    parser.add_argument("--output-template", metavar="MODELO",
+                        help="nome dos arquivos no formato do yt-dlp, ex.: '%%(uploader)s/%%(title)s.%%(ext)s'")
+    parser.add_argument("--staging", metavar="PASTA",
+                        help="pasta para arquivos parciais, no mesmo disco do destino")
+    args = parser.parse_args(argv)
+
+    if args.type == "video":
+        args.quality = args.quality or VIDEO_QUALITIES[0]
+        args.format = args.format or SUPPORTED_VIDEO_FORMATS[0]
+    else:
+        args.quality = args.quality or AUDIO_QUALITIES[-1]
+        args.format = args.format or SUPPORTED_AUDIO_FORMATS[0]
+
+    args.targets = []
+    for target in args.also:
+        fmt, _, quality = target.partition(":")
+        if args.type != "audio" or not fmt:
+            parser.error(f"--also inválido: {target}")
+        args.targets.append((fmt, quality or args.quality))
+    return args
+
+
+def run(args: argparse.Namespace, source: TextIO, output: TextIO) -> int:
+    """Feed every URL from source through the scheduler; return the exit code."""
+    bandwidth = BandwidthManager(args.limit, args.schedule)
+    scheduler = DownloadScheduler(max_workers=args.jobs, per_host_limit=args.per_host,
+                                  postprocess_workers=args.postprocess_jobs, bandwidth=bandwidth,
+                                  processes=ProcessPool() if args.processes else None)
+    writer = ResultWriter(output)
+    exporter = None
+    if args.metrics or args.prometheus:
+        exporter = MetricsExporter(args.metrics or METRICS_PATH, args.prometheus)
+    info_cache = None if args.no_cache else InfoCache()
+    library = None if args.no_library else LibraryIndex()
+    turbo = TurboTuner() if args.turbo else None
+    journal = JobJournal(args.journal) if args.journal else None
+    # Keep at most a couple of jobs per worker buffered so huge lists stream
+    max_pending = max(1, args.jobs) * 2
+
+    def track(job: DownloadWorker) -> None:
+        started = time.monotonic()
+        job.finished_callbacks.append(
+            lambda success, msg, job=job, started=started: writer.write(job, started)
+        )
+        if exporter is not None:
+            # Finished callbacks run before wait() returns, unlike scheduler listeners
+            job.finished_callbacks.append(lambda success, msg, job=job: exporter.observe(job))
+
+    def submit(job: DownloadWorker) -> None:
+        scheduler.wait_for_capacity(max_pending)
+        scheduler.clear_finished()
+        track(job)
+        # Playlist entries are queued by the scheduler and reported like any other job
+        job.entry_callbacks.append(track)
+        scheduler.submit(job)
+
+    try:
+        if journal is not None:
+            for row in journal.unfinished():
+                submit(DownloadWorker.from_journal(row, journal, quiet=True, info_cache=info_cache,
+                                                   library=library, turbo=turbo))
+
+        for url in iter_urls(source):
+            submit(DownloadWorker(url, MEDIA_TYPES[args.type], args.quality, args.format,
+                                  args.no_audio, quiet=True, info_cache=info_cache,
+                                  journal=journal, targets=args.targets, library=library,
+                                  turbo=turbo, output_dir=args.output_dir,
+                                  output_template=args.output_template, staging_dir=args.staging))
+
+        scheduler.wait()
+    except KeyboardInterrupt:
+        # Journaled jobs keep their partial files so the next run resumes them
+        if journal is not None:
+            scheduler.interrupt_all()
+        scheduler.shutdown()
+        scheduler.wait(timeout=10)
+        bandwidth.close()
+        if exporter is not None:
+            exporter.close()
+        return 130
+
+    scheduler.shutdown(cancel=False)
+    bandwidth.close()
+    if exporter is not None:
+        exporter.close()
+    failed = writer.counts.get(JobStatus.FAILED, 0) + writer.counts.get(JobStatus.CANCELLED, 0)
+    return 1 if failed else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point."""
+    args = parse_args(argv)
+    if args.input == "-":
+        return run(args, sys.stdin, sys.stdout)
+
+    with open(args.input, encoding="utf-8") as source:
+        return run(args, source, sys.stdout)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,432 @@
+"""Daemon mode: the download engine behind a local HTTP/JSON API.
+
+Usage:
+    python daemon.py --port 8790 --turbo
+    curl -X POST localhost:8790/jobs -d '{"url": "https://...", "type": "audio", "format": "mp3"}'
+    curl localhost:8790/jobs
+    curl -X DELETE localhost:8790/jobs/3
+    curl -N localhost:8790/events
+
+Endpoints:
+    GET    /jobs             every known job
+    POST   /jobs             enqueue {"url" | "urls", "type", "quality", "format",
+                             "no_audio", "priority", "also", "turbo", "output_dir",
+                             "template"}
+    GET    /jobs/<id>        one job
+    DELETE /jobs/<id>        cancel a job
+    POST   /jobs/clear       forget finished jobs
+    GET    /events           server-sent events: "jobs" snapshot, then "job" on every
+                             status change and "progress" while jobs are running
+
+The server runs on one asyncio loop: idle clients are a socket and a small
+queue each, and status events are encoded once for all of them.
+"""
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+import sys
+import threading
+from typing import Dict, List, Optional, Set, Tuple, Union
+from urllib.parse import urlsplit
+
+from cli import MEDIA_TYPES, parse_rate, parse_window
+from engine import (
+    AUDIO_QUALITIES, DEFAULT_MAX_WORKERS, DEFAULT_PER_HOST_LIMIT, DEFAULT_POSTPROCESS_WORKERS,
+    JOB_HISTORY_LIMIT, PRIORITY_NAMES, PRIORITY_NORMAL, SUPPORTED_AUDIO_FORMATS, SUPPORTED_VIDEO_FORMATS,
+    VIDEO_QUALITIES, BandwidthManager, DownloadScheduler, DownloadWorker, JobStatus, JobSummary,
+    ProgressAggregator, TurboTuner
+)
+from metrics import METRICS_PATH, MetricsExporter
+from processes import ProcessPool
+from storage import InfoCache, JobHistory, JobJournal, LibraryIndex
+
+# Constants
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8790
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+REQUEST_TIMEOUT = 30.0
+# Seconds between progress events; status changes are sent as they happen
+PROGRESS_INTERVAL = 1.0
+# Comment lines keep proxies from timing out idle streams and reveal dead clients
+SSE_HEARTBEAT = 15.0
+# Events buffered for a slow client before it is disconnected
+SSE_QUEUE_SIZE = 256
+
+HTTP_REASONS = {200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request",
+                401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed",
+                413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class ApiError(Exception):
+    """Request failure reported to the client as a JSON error."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def job_record(job: Union[DownloadWorker, JobSummary]) -> Dict:
+    """JSON view of a job for API clients."""
+    record = job.metrics_record()
+    record.update(percent=job.percent, total_bytes=job.total_bytes, message=job.message)
+    return record
+
+
+class ApiServer:
+    """Serves a DownloadScheduler over HTTP; safe to share with other front ends.
+
+    Jobs created through the API get job_options (info cache, journal,
+    library, ...) as DownloadWorker keyword arguments.
+    """
+
+    def __init__(self, scheduler: DownloadScheduler, turbo: Optional[TurboTuner] = None,
+                 token: Optional[str] = None, **job_options):
+        self.scheduler = scheduler
+        self.turbo = turbo
+        self.token = token
+        self.job_options = job_options
+        self.progress_aggregator = ProgressAggregator()
+        self.clients: Set[asyncio.Queue] = set()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._stopped: Optional[asyncio.Event] = None
+        scheduler.listeners.append(self._on_job_changed)
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> None:
+        """Accept requests until stop() is called."""
+        self.loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._server = await asyncio.start_server(self._handle, host, port,
+                                                  limit=MAX_HEADER_BYTES)
+        logging.info(f"API listening on http://{host}:{port}")
+        ticker = asyncio.create_task(self._progress_ticker())
+        try:
+            await self._stopped.wait()
+        finally:
+            ticker.cancel()
+            self._server.close()
+            self.loop = None
+            for queue in list(self.clients):
+                self._drop_client(queue)
+            await self._server.wait_closed()
+
+    def start_in_thread(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> threading.Thread:
+        """Run serve() on its own event loop in a daemon thread."""
+        thread = threading.Thread(target=asyncio.run, args=(self.serve(host, port),),
+                                  name="ApiServer", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        """Stop serving; callable from any thread."""
+        if self.loop is not None and self._stopped is not None:
+            self.loop.call_soon_threadsafe(self._stopped.set)
+
+    def _on_job_changed(self, job: DownloadWorker) -> None:
+        """Scheduler listener: forward status changes from worker threads to the loop."""
+        loop = self.loop
+        if loop is not None and self.clients:
+            loop.call_soon_threadsafe(self._broadcast, "job", job_record(job))
+
+    def _broadcast(self, event: str, data) -> None:
+        """Queue one encoded event for every client, dropping those that fall behind."""
+        message = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+        for queue in list(self.clients):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._drop_client(queue)
+
+    def _drop_client(self, queue: asyncio.Queue) -> None:
+        """Disconnect an event stream by replacing its backlog with the end marker."""
+        self.clients.discard(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    async def _progress_ticker(self) -> None:
+        """Send one progress event per interval while anyone listens and jobs run."""
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            if not self.clients:
+                continue
+            jobs = [job for job in self.scheduler.jobs() if job.status not in JobStatus.FINISHED]
+            if not jobs:
+                continue
+            progress, overall = self.progress_aggregator.sample(jobs)
+            self._broadcast("progress", {
+                "overall": overall._asdict(),
+                "jobs": {job_id: p._asdict() for job_id, p in progress.items()},
+            })
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve one request per connection."""
+        try:
+            try:
+                method, path, headers, body = await asyncio.wait_for(
+                    self._read_request(reader), REQUEST_TIMEOUT)
+                self._authorize(headers)
+                if method == "GET" and path == "/events":
+                    await self._stream_events(writer)
+                    return
+                status, payload = self._route(method, path, body)
+            except ApiError as e:
+                status, payload = e.status, {"error": str(e)}
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                    asyncio.TimeoutError, ValueError):
+                status, payload = 400, {"error": "requisição inválida"}
+            except ConnectionError:
+                raise
+            except Exception as e:
+                logging.error(f"API request failed: {e}")
+                status, payload = 500, {"error": str(e)}
+            await self._respond(writer, status, payload)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str], bytes]:
+        """Parse the request line, headers and body."""
+        head = await reader.readuntil(b"\r\n\r\n")
+        request_line, *header_lines = head.decode("latin-1").split("\r\n")
+        method, target, _ = request_line.split(" ", 2)
+        headers = {}
+        for line in header_lines:
+            name, _, value = line.partition(":")
+            if name:
+                headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", 0))
+        if length > MAX_BODY_BYTES:
+            raise ApiError(413, "corpo grande demais")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), urlsplit(target).path.rstrip("/") or "/", headers, body
+
+    def _authorize(self, headers: Dict[str, str]) -> None:
+        """Require the bearer token, when one is configured."""
+        if self.token is None:
+            return
+        supplied = headers.get("authorization", "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(supplied, self.token):
+            raise ApiError(401, "token inválido")
+
+    def _route(self, method: str, path: str, body: bytes) -> Tuple[int, object]:
+        """Dispatch a plain JSON request."""
+        parts = path.strip("/").split("/")
+        if parts[0] != "jobs" or len(parts) > 2:
+            raise ApiError(404, "rota desconhecida")
+
+        if len(parts) == 1:
+            if method == "GET":
+                return 200, [job_record(job) for job in self.scheduler.jobs()]
+            if method == "POST":
+                jobs = [self.scheduler.submit(job) for job in self._build_jobs(self._json(body))]
+                return 201, [job_record(job) for job in jobs]
+            raise ApiError(405, "método não suportado")
+
+        if parts[1] == "clear" and method == "POST":
+            self.scheduler.clear_finished()
+            return 204, None
+
+        job = self.scheduler.get(int(parts[1])) if parts[1].isdigit() else None
+        if job is None:
+            raise ApiError(404, "job não encontrado")
+        if method == "GET":
+            return 200, job_record(job)
+        if method == "DELETE":
+            self.scheduler.cancel(job.job_id)
+            return 200, job_record(job)
+        raise ApiError(405, "método não suportado")
+
+    @staticmethod
+    def _json(body: bytes) -> Dict:
+        """Decode a JSON object body."""
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            raise ApiError(400, "JSON inválido")
+        if not isinstance(payload, dict):
+            raise ApiError(400, "esperado um objeto JSON")
+        return payload
+
+    def _build_jobs(self, payload: Dict) -> List[DownloadWorker]:
+        """Validate an enqueue request and create its jobs, one per URL."""
+        urls = payload.get("urls") or [payload.get("url")]
+        if not isinstance(urls, list) or not all(isinstance(url, str) and url.startswith("http") for url in urls):
+            raise ApiError(400, "URL inválida")
+
+        kind = payload.get("type", "video")
+        if kind not in MEDIA_TYPES:
+            raise ApiError(400, f"tipo inválido: {kind}")
+        if kind == "video":
+            quality = payload.get("quality") or VIDEO_QUALITIES[0]
+            fmt = payload.get("format") or SUPPORTED_VIDEO_FORMATS[0]
+        else:
+            quality = payload.get("quality") or AUDIO_QUALITIES[-1]
+            fmt = payload.get("format") or SUPPORTED_AUDIO_FORMATS[0]
+        if not isinstance(quality, str) or not isinstance(fmt, str):
+            raise ApiError(400, "quality e format devem ser texto")
+
+        priority = payload.get("priority", PRIORITY_NORMAL)
+        # bool is an int subclass, so true would pass as priority 1
+        if not isinstance(priority, int) or isinstance(priority, bool) or priority not in PRIORITY_NAMES:
+            raise ApiError(400, f"prioridade inválida: {json.dumps(priority)}")
+
+        also = payload.get("also", [])
+        if not isinstance(also, list) or not all(isinstance(target, str) for target in also):
+            raise ApiError(400, "also deve ser uma lista de 'formato:qualidade'")
+        targets = []
+        for target in also:
+            target_fmt, _, target_quality = target.partition(":")
+            if kind != "audio" or not target_fmt:
+                raise ApiError(400, f"also inválido: {target}")
+            targets.append((target_fmt, target_quality or quality))
+
+        options = dict(self.job_options)
+        for key, option in (("output_dir", "output_dir"), ("template", "output_template")):
+            if key in payload:
+                if not isinstance(payload[key], str) or not payload[key]:
+                    raise ApiError(400, f"{key} inválido")
+                options[option] = payload[key]
+
+        flags = {key: payload.get(key, False) for key in ("no_audio", "turbo")}
+        for key, value in flags.items():
+            # "false" would otherwise be truthy
+            if not isinstance(value, bool):
+                raise ApiError(400, f"{key} deve ser true ou false")
+
+        turbo = self.turbo if flags["turbo"] else None
+        return [DownloadWorker(url, MEDIA_TYPES[kind], quality, fmt, flags["no_audio"],
+                               priority, targets=targets, turbo=turbo, **options)
+                for url in urls]
+
+    async def _stream_events(self, writer: asyncio.StreamWriter) -> None:
+        """Hold the connection open and write server-sent events until it drops."""
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\nConnection: keep-alive\r\n\r\n")
+        snapshot = [job_record(job) for job in self.scheduler.jobs()]
+        writer.write(f"event: jobs\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n".encode("utf-8"))
+        await writer.drain()
+
+        queue: asyncio.Queue = asyncio.Queue(SSE_QUEUE_SIZE)
+        self.clients.add(queue)
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    message = b": keepalive\n\n"
+                if message is None:
+                    return
+                writer.write(message)
+                await writer.drain()
+        finally:
+            self.clients.discard(queue)
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, payload) -> None:
+        """Write a JSON response and close the connection."""
+        body = b"" if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="HB Downloader como serviço HTTP local")
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help="endereço de escuta (use --token fora do localhost)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--token", help="exigir 'Authorization: Bearer TOKEN' em toda requisição")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_MAX_WORKERS,
+                        help="downloads em paralelo")
+    parser.add_argument("--per-host", type=int, default=DEFAULT_PER_HOST_LIMIT,
+                        help="downloads simultâneos por host")
+    parser.add_argument("--postprocess-jobs", type=int, default=DEFAULT_POSTPROCESS_WORKERS,
+                        help="conversões FFmpeg em paralelo")
+    parser.add_argument("--limit", type=parse_rate, metavar="TAXA",
+                        help="banda total, ex.: 500K, 2M (0 = sem limite)")
+    parser.add_argument("--schedule", type=parse_window, action="append", default=[],
+                        metavar="HH:MM-HH:MM=TAXA",
+                        help="limite diferente neste horário, ex.: 22:00-07:00=0")
+    parser.add_argument("--turbo", action="store_true",
+                        help="permitir jobs com várias conexões ajustadas por host")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="não reutilizar metadados extraídos anteriormente")
+    parser.add_argument("--no-library", action="store_true",
+                        help="baixar de novo mesmo o que já está na biblioteca")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="gravar métricas por job neste arquivo JSON lines (rotativo)")
+    parser.add_argument("--prometheus", metavar="PATH",
+                        help="manter contadores neste textfile do Prometheus")
+    parser.add_argument("--journal", metavar="PATH",
+                        help="registrar os jobs neste arquivo e retomar os que ficaram pendentes")
+    parser.add_argument("--processes", action="store_true",
+                        help="executar cada job em um processo próprio (cancelamento imediato)")
+    parser.add_argument("--history-limit", type=int, default=JOB_HISTORY_LIMIT, metavar="N",
+                        help="jobs concluídos mantidos em memória; os mais antigos vão para o log")
+    parser.add_argument("-o", "--output-dir", metavar="PASTA",
+                        help="pasta de destino padrão (padrão: Downloads)")
+    parser.add_argument("--staging", metavar="PASTA",
+                        help="pasta para arquivos parciais, no mesmo disco do destino")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point."""
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    bandwidth = BandwidthManager(args.limit, args.schedule)
+    history = JobHistory()
+    scheduler = DownloadScheduler(max_workers=args.jobs, per_host_limit=args.per_host,
+                                  postprocess_workers=args.postprocess_jobs, bandwidth=bandwidth,
+                                  processes=ProcessPool() if args.processes else None,
+                                  history_limit=args.history_limit, history=history)
+    exporter = None
+    if args.metrics or args.prometheus:
+        exporter = MetricsExporter(args.metrics or METRICS_PATH, args.prometheus)
+        scheduler.listeners.append(exporter.observe)
+    journal = JobJournal(args.journal) if args.journal else None
+    job_options = {
+        "quiet": True,
+        "info_cache": None if args.no_cache else InfoCache(),
+        "library": None if args.no_library else LibraryIndex(),
+        "journal": journal,
+        "output_dir": args.output_dir,
+        "staging_dir": args.staging,
+    }
+    server = ApiServer(scheduler, TurboTuner() if args.turbo else None, args.token, **job_options)
+
+    if journal is not None:
+        for row in journal.unfinished():
+            scheduler.submit(DownloadWorker.from_journal(
+                row, journal, quiet=True, info_cache=job_options["info_cache"],
+                library=job_options["library"]))
+
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Journaled jobs keep their partial files so the next start resumes them
+        if journal is not None:
+            scheduler.interrupt_all()
+        scheduler.shutdown()
+        scheduler.wait(timeout=10)
+        bandwidth.close()
+        history.close()
+        if exporter is not None:
+            exporter.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,2138 @@
+import contextlib
+import datetime
+import hashlib
+import heapq
+import itertools
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+from typing import (
+    TYPE_CHECKING, Callable, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple, Union
+)
+from pathlib import Path
+from urllib.parse import urlparse
+
+from storage import APP_DATA_FOLDER, HostTuning, InfoCache, JobHistory, JobJournal, LibraryIndex
+
+if TYPE_CHECKING:
+    from yt_dlp import YoutubeDL
+
+    from processes import ProcessPool, WorkerProcess
+
+# Constants
+DOWNLOADS_FOLDER = Path.home() / "Downloads"
+OUTPUT_TEMPLATE = "%(title)s-%(resolution)s.%(ext)s"
+# Partial, fragment and merge files live under STAGING_FOLDER, one folder per
+# output directory, until the finished file is renamed into place. A hidden
+# STAGING_DIRNAME inside the output directory is the fallback when the app
+# data is on another filesystem; jobs remove it again once it is empty.
+STAGING_DIRNAME = ".hb-staging"
+STAGING_FOLDER = APP_DATA_FOLDER / "staging"
+# Streams of known size at least this large get their disk space reserved up front
+PREALLOCATE_MIN_BYTES = 16 * 1024 * 1024
+# Initial read (and so write) block; yt-dlp resizes it with the transfer rate
+DISK_BUFFER_SIZE = 1024 * 1024
+SUPPORTED_VIDEO_FORMATS = ["MP4", "MKV", "WEBM"]
+SUPPORTED_AUDIO_FORMATS = ["MP3", "FLAC", "ACC", "M4A", "OPUS", "OGG", "WAV"]
+VIDEO_QUALITIES = ["Melhor", "1440p", "1080p", "720p", "480p", "360p", "144p"]
+AUDIO_QUALITIES = ["128k", "192k", "256k", "320k"]
+
+DEFAULT_MAX_WORKERS = 3
+DEFAULT_PER_HOST_LIMIT = 2
+DEFAULT_POSTPROCESS_WORKERS = os.cpu_count() or 2
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_NAMES = {PRIORITY_HIGH: "Alta", PRIORITY_NORMAL: "Normal", PRIORITY_LOW: "Baixa"}
+
+CANCEL_MESSAGE = "Cancelado pelo usuário"
+LIBRARY_HIT_MESSAGE = "Já estava na biblioteca"
+
+PROGRESS_FPS = 10
+SPEED_SMOOTHING = 0.3
+# Fragments still in flight past the last reported index when a job is cancelled
+FRAGMENT_CLEANUP_MARGIN = 32
+JOURNAL_FLUSH_INTERVAL = 2.0
+
+# Share of the global bandwidth budget each running job gets, by priority
+PRIORITY_WEIGHTS = {PRIORITY_HIGH: 4, PRIORITY_NORMAL: 2, PRIORITY_LOW: 1}
+# Seconds of traffic a job may burst after being idle
+BANDWIDTH_BURST = 0.5
+THROTTLE_SLICE = 0.1
+
+# Turbo levels: (concurrent fragments, HTTP chunk size); writes keep DISK_BUFFER_SIZE
+TURBO_LEVELS = [
+    (2, 1024 * 1024),
+    (4, 4 * 1024 * 1024),
+    (8, 10 * 1024 * 1024),
+    (16, 20 * 1024 * 1024),
+]
+TURBO_START_LEVEL = 1
+# Seconds of transfer measured before a job reports its throughput
+TURBO_PROBE_SECONDS = 3.0
+# Shortest transfer worth reporting when a job ends before the probe does
+TURBO_MIN_PROBE_SECONDS = 1.0
+# Relative gain a level must show over the one below to try the next
+TURBO_MIN_GAIN = 0.1
+
+# Playlist fan-out: entry jobs kept pending per download worker, and extra
+# attempts a failed entry gets before it counts against the playlist
+PLAYLIST_WINDOW_PER_WORKER = 2
+PLAYLIST_ENTRY_RETRIES = 1
+PLAYLIST_TYPES = ("playlist", "multi_video")
+PLAYLIST_FAILED_MESSAGE = "{failed} de {total} itens da playlist não foram baixados"
+
+# Finished jobs the scheduler keeps in memory; older ones go to the history log
+JOB_HISTORY_LIMIT = 500
+
+# Idle YoutubeDL sessions kept for reuse, and how long an idle one may wait
+SESSION_POOL_SIZE = 8
+SESSION_IDLE_TIMEOUT = 300.0
+
+# Codec prefixes each video container holds as-is: (video, audio); empty accepts anything
+CONTAINER_CODECS = {
+    "mp4": (("avc1", "avc3", "h264", "hev1", "hvc1", "h265", "av01"),
+            ("mp4a", "aac", "mp3", "ac-3", "ec-3")),
+    "mkv": ((), ()),
+    "webm": (("vp8", "vp9", "vp09", "av01"), ("opus", "vorbis")),
+}
+# Containers whose muxer rejects other codecs, so codec fit outranks resolution
+STRICT_CONTAINERS = {"webm"}
+# Characters with a meaning in yt-dlp format specs, which pinned format ids must avoid
+FORMAT_SPEC_OPERATORS = "/+,()[]"
+
+
+class AudioTarget(NamedTuple):
+    """How FFmpegExtractAudio produces one audio format."""
+    codec: str                 # FFmpegExtractAudio codec name
+    ext: str                   # extension of the produced file
+    sources: Tuple[str, ...]   # source codec prefixes it stream-copies instead of encoding
+    speed: float               # media seconds encoded per CPU second, for savings estimates
+
+
+AUDIO_TARGETS = {
+    "mp3": AudioTarget("mp3", "mp3", ("mp3",), 80.0),
+    "flac": AudioTarget("flac", "flac", ("flac",), 250.0),
+    "acc": AudioTarget("aac", "m4a", ("mp4a", "aac"), 60.0),
+    "m4a": AudioTarget("m4a", "m4a", ("mp4a", "aac"), 60.0),
+    "opus": AudioTarget("opus", "opus", ("opus",), 50.0),
+    "ogg": AudioTarget("vorbis", "ogg", ("vorbis",), 50.0),
+    "wav": AudioTarget("wav", "wav", (), 1000.0),
+}
+
+
+def prewarm() -> None:
+    """Import yt-dlp and load its extractors ahead of the first download."""
+    try:
+        from yt_dlp import YoutubeDL
+
+        YoutubeDL({'quiet': True, 'no_warnings': True}).close()
+    except Exception as e:
+        logging.warning(f"Error prewarming yt-dlp: {e}")
+
+
+def link_or_copy(source: Path, destination: Path) -> None:
+    """Hard-link source to destination, copying when linking is not possible."""
+    try:
+        os.link(source, destination)
+    except OSError:
+        # Copy under a temporary name so destination never holds a partial file
+        partial = destination.with_name(f".{destination.name}.part")
+        shutil.copyfile(source, partial)
+        os.replace(partial, destination)
+
+
+def resolve_staging_dir(output_dir: Path, staging_dir: Optional[Path]) -> Path:
+    """Staging directory for output_dir: staging_dir when it shares output_dir's filesystem.
+
+    Finished files are renamed into place, which is only atomic (and free)
+    within one filesystem. By default partial files stay out of the user's
+    folder, under the app data with one folder per output directory so equal
+    names cannot clash; a hidden folder inside output_dir is the fallback
+    when the app data lives on another disk.
+    """
+    fallback = output_dir / STAGING_DIRNAME
+    explicit = staging_dir is not None
+    if not explicit:
+        folder_key = hashlib.sha1(str(output_dir.resolve()).encode("utf-8")).hexdigest()[:16]
+        staging_dir = STAGING_FOLDER / folder_key
+    try:
+        staging_dir.mkdir(parents=True, exist_ok=True)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        if staging_dir.stat().st_dev == output_dir.stat().st_dev:
+            return staging_dir
+        if explicit:
+            logging.warning(f"Staging directory {staging_dir} is on another filesystem than "
+                            f"{output_dir}, using {fallback}")
+    except OSError as e:
+        logging.warning(f"Error using staging directory {staging_dir}: {e}")
+    return fallback
+
+
+_fallocate = None
+
+
+def preallocate(path: str, size: int) -> bool:
+    """Reserve disk space for a file being written, without changing its length.
+
+    Linux only: yt-dlp resumes from the length of a partial file, so the
+    space is reserved with FALLOC_FL_KEEP_SIZE rather than by growing it.
+    """
+    global _fallocate
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        if _fallocate is None:
+            import ctypes
+            import ctypes.util
+
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            _fallocate = getattr(libc, "fallocate64", None) or libc.fallocate
+            _fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+        fd = os.open(path, os.O_WRONLY)
+        try:
+            return _fallocate(fd, 1, 0, size) == 0  # 1 = FALLOC_FL_KEEP_SIZE
+        finally:
+            os.close(fd)
+    except (OSError, AttributeError) as e:
+        logging.debug(f"Preallocating {path} failed: {e}")
+        return False
+
+
+def audio_target(fmt: str) -> AudioTarget:
+    """Codec details for an audio format, passing unknown names straight to FFmpeg."""
+    fmt = fmt.lower()
+    return AUDIO_TARGETS.get(fmt, AudioTarget(fmt, fmt, (fmt,), 50.0))
+
+
+def max_height(quality: str) -> Optional[int]:
+    """Height cap for a video quality label; None for the best available."""
+    if quality.endswith('p') and quality[:-1].isdigit():
+        return int(quality[:-1])
+    if quality == '2k':
+        return 1440
+    return None
+
+
+def codec_fits(codec: str, accepted: Tuple[str, ...]) -> bool:
+    """Whether a yt-dlp codec string starts with one of the accepted prefixes."""
+    return not accepted or codec.lower().startswith(accepted)
+
+
+class FormatSelection(NamedTuple):
+    """Streams picked for a job and what picking them saves."""
+    spec: str            # explicit format ids, e.g. "137+140"
+    summary: str
+    stream_copy: bool    # every output is produced without re-encoding
+    cpu_saved: float     # estimated encoder seconds avoided
+
+
+def _describe_format(fmt: Dict) -> str:
+    """Short label for a format: id, codecs and height."""
+    codecs = [codec for codec in (fmt.get('vcodec'), fmt.get('acodec')) if codec != 'none']
+    if fmt.get('height') and fmt.get('vcodec') != 'none':
+        codecs.append(f"{fmt['height']}p")
+    return f"{fmt['format_id']} ({', '.join(codecs)})"
+
+
+def _streams(formats: List[Dict]) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    """Split formats with known codecs into (video-only, audio-only, progressive)."""
+    videos, audios, progressive = [], [], []
+    for fmt in formats:
+        vcodec, acodec, format_id = fmt.get('vcodec'), fmt.get('acodec'), fmt.get('format_id')
+        if not vcodec or not acodec or not format_id:
+            continue
+        if any(char in format_id for char in FORMAT_SPEC_OPERATORS):
+            continue
+        if vcodec != 'none' and acodec == 'none':
+            videos.append(fmt)
+        elif vcodec == 'none' and acodec != 'none':
+            audios.append(fmt)
+        elif vcodec != 'none':
+            progressive.append(fmt)
+    return videos, audios, progressive
+
+
+def select_video_formats(formats: List[Dict], container: str, height: Optional[int],
+                         no_audio: bool) -> Optional[FormatSelection]:
+    """Rank video streams by height, then fit for the container, then bitrate.
+
+    Containers in STRICT_CONTAINERS rank the codec fit first instead. A
+    progressive file already in the container wins when it is as tall as the
+    best adaptive pair, since it needs no merge at all. Returns None when the
+    extractor did not report codecs, leaving the choice to yt-dlp.
+    """
+    video_codecs, audio_codecs = CONTAINER_CODECS.get(container, ((), ()))
+    videos, audios, progressive = _streams(formats)
+    if height is not None:
+        videos = [f for f in videos if f.get('height') and f['height'] <= height]
+        progressive = [f for f in progressive if f.get('height') and f['height'] <= height]
+
+    def video_key(f: Dict) -> tuple:
+        height_rank, fits = f.get('height') or 0, codec_fits(f['vcodec'], video_codecs)
+        if container in STRICT_CONTAINERS:
+            height_rank, fits = fits, height_rank
+        return height_rank, fits, f.get('fps') or 0, f.get('tbr') or 0
+
+    def audio_key(f: Dict) -> tuple:
+        return codec_fits(f['acodec'], audio_codecs), f.get('abr') or f.get('tbr') or 0
+
+    if not videos:
+        return None
+    video = max(videos, key=video_key)
+    if no_audio:
+        fits = codec_fits(video['vcodec'], video_codecs)
+        return FormatSelection(video['format_id'], _describe_format(video), fits, 0.0)
+
+    ready = [f for f in progressive
+             if f.get('ext') == container and (f.get('height') or 0) >= (video.get('height') or 0)
+             and codec_fits(f['vcodec'], video_codecs) and codec_fits(f['acodec'], audio_codecs)]
+    if ready:
+        single = max(ready, key=video_key)
+        return FormatSelection(single['format_id'], f"{_describe_format(single)}, no merge",
+                               True, 0.0)
+    if not audios:
+        return None
+
+    audio = max(audios, key=audio_key)
+    fits = codec_fits(video['vcodec'], video_codecs) and codec_fits(audio['acodec'], audio_codecs)
+    return FormatSelection(f"{video['format_id']}+{audio['format_id']}",
+                           f"{_describe_format(video)} + {_describe_format(audio)}", fits, 0.0)
+
+
+def select_audio_format(formats: List[Dict], targets: List[AudioTarget],
+                        duration: Optional[float] = None) -> Optional[FormatSelection]:
+    """Pick the audio stream the most targets can stream-copy, then the best bitrate.
+
+    FFmpegExtractAudio copies instead of encoding when the source codec already
+    is the target codec; the savings estimate uses each target's encode speed.
+    """
+    _, audios, _ = _streams(formats)
+    if not audios:
+        return None
+
+    def copies(f: Dict) -> List[AudioTarget]:
+        return [target for target in targets
+                if target.sources and codec_fits(f['acodec'], target.sources)]
+
+    audio = max(audios, key=lambda f: (len(copies(f)), f.get('abr') or f.get('tbr') or 0))
+    copied = copies(audio)
+    cpu_saved = sum((duration / target.speed for target in copied), 0.0) if duration else 0.0
+    if copied:
+        summary = f"{_describe_format(audio)}, copied to {', '.join(t.ext for t in copied)}"
+    else:
+        summary = f"{_describe_format(audio)}, encoded"
+    return FormatSelection(audio['format_id'], summary, len(copied) == len(targets), cpu_saved)
+
+
+def offered_qualities(formats: List[Dict]) -> List[str]:
+    """Video quality labels for the heights a media item offers, best first."""
+    heights = {f['height'] for f in formats
+               if f.get('height') and f.get('vcodec') not in (None, 'none')}
+    if not heights:
+        return list(VIDEO_QUALITIES)
+    return [VIDEO_QUALITIES[0]] + [f"{height}p" for height in sorted(heights, reverse=True)]
+
+
+def stream_copy_formats(formats: List[Dict], media_type: str) -> Set[str]:
+    """Supported output formats this media reaches without re-encoding."""
+    if media_type == "Vídeo":
+        candidates = [(fmt, select_video_formats(formats, fmt.lower(), None, False))
+                      for fmt in SUPPORTED_VIDEO_FORMATS]
+    else:
+        candidates = [(fmt, select_audio_format(formats, [audio_target(fmt)]))
+                      for fmt in SUPPORTED_AUDIO_FORMATS]
+    return {fmt for fmt, selection in candidates if selection and selection.stream_copy}
+
+
+class TokenBucket:
+    """Thread-safe token bucket; consume() blocks until the bytes are paid for."""
+
+    def __init__(self, rate: Optional[float] = None, burst: float = BANDWIDTH_BURST):
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+
+    def set_rate(self, rate: Optional[float]) -> None:
+        """Change the rate in bytes per second; None disables limiting."""
+        with self.lock:
+            self._refill_locked()
+            self.rate = rate
+
+    def consume(self, amount: int, should_stop: Callable[[], bool] = lambda: False) -> None:
+        """Take amount tokens, sleeping while the bucket is in debt."""
+        with self.lock:
+            self._refill_locked()
+            if self.rate is None:
+                return
+            self.tokens -= amount
+
+        # Sleep in slices so rate changes and cancellation take effect promptly
+        while not should_stop():
+            with self.lock:
+                self._refill_locked()
+                if self.rate is None or self.tokens >= 0:
+                    return
+                delay = min(-self.tokens / self.rate, THROTTLE_SLICE)
+            time.sleep(delay)
+
+    def _refill_locked(self) -> None:
+        """Add the tokens accrued since the last update, up to the burst size."""
+        now = time.monotonic()
+        if self.rate is not None:
+            capacity = self.rate * self.burst
+            self.tokens = min(capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class BandwidthManager:
+    """Splits a global bandwidth budget across running jobs by priority.
+
+    The budget may be overridden by time-of-day windows, e.g. unlimited
+    overnight. Shares are recomputed whenever a job starts or finishes,
+    the budget changes, or a schedule window opens or closes.
+    """
+
+    def __init__(self, limit: Optional[float] = None,
+                 schedule: Optional[List[Tuple[datetime.time, datetime.time, Optional[float]]]] = None):
+        self.lock = threading.Lock()
+        self.limit = limit
+        self.schedule = list(schedule or [])
+        self._jobs: Dict[int, 'DownloadWorker'] = {}
+        self._timer: Optional[threading.Timer] = None
+        self._arm_timer()
+
+    def set_limit(self, limit: Optional[float]) -> None:
+        """Change the global budget in bytes per second; None means unlimited."""
+        with self.lock:
+            self.limit = limit
+        self.rebalance()
+
+    def set_schedule(self, schedule: List[Tuple[datetime.time, datetime.time, Optional[float]]]) -> None:
+        """Replace the (start, end, limit) windows that override the global budget."""
+        with self.lock:
+            self.schedule = list(schedule)
+        self._arm_timer()
+        self.rebalance()
+
+    def current_limit(self, now: Optional[datetime.datetime] = None) -> Optional[float]:
+        """Budget in effect at the given time; the first matching window wins."""
+        moment = (now or datetime.datetime.now()).time()
+        with self.lock:
+            for start, end, limit in self.schedule:
+                if start <= end:
+                    inside = start <= moment < end
+                else:
+                    inside = moment >= start or moment < end
+                if inside:
+                    return limit
+            return self.limit
+
+    def attach(self, job: 'DownloadWorker') -> None:
+        """Start sharing the budget with a job that began downloading."""
+        with self.lock:
+            self._jobs[job.job_id] = job
+        self.rebalance()
+
+    def detach(self, job: 'DownloadWorker') -> None:
+        """Return a finished job's share to the others."""
+        with self.lock:
+            self._jobs.pop(job.job_id, None)
+        job.set_ratelimit(None)
+        self.rebalance()
+
+    def rebalance(self) -> None:
+        """Recompute every attached job's rate limit."""
+        limit = self.current_limit()
+        with self.lock:
+            jobs = list(self._jobs.values())
+        total_weight = sum(PRIORITY_WEIGHTS.get(job.priority, 1) for job in jobs)
+        for job in jobs:
+            share = None
+            if limit is not None:
+                share = limit * PRIORITY_WEIGHTS.get(job.priority, 1) / total_weight
+            job.set_ratelimit(share)
+
+    def close(self) -> None:
+        """Stop the schedule timer."""
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _arm_timer(self) -> None:
+        """Schedule a rebalance at the next window boundary."""
+        now = datetime.datetime.now()
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            delays = []
+            for start, end, _ in self.schedule:
+                for boundary in (start, end):
+                    moment = datetime.datetime.combine(now.date(), boundary)
+                    if moment <= now:
+                        moment += datetime.timedelta(days=1)
+                    delays.append((moment - now).total_seconds())
+            if not delays:
+                return
+
+            self._timer = threading.Timer(min(delays) + 1, self._on_boundary)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_boundary(self) -> None:
+        """A schedule window opened or closed."""
+        self.rebalance()
+        self._arm_timer()
+
+
+class TurboTuner:
+    """Picks fragment concurrency and chunk sizes per host by hill climbing.
+
+    Settings are fixed for the lifetime of a yt-dlp stream, so each job runs
+    at one level and reports the throughput measured over its first seconds.
+    The next job to the same host climbs a level while that keeps paying off,
+    then settles on the fastest level seen.
+    """
+
+    def __init__(self, store: Optional[HostTuning] = None):
+        self.store = store or HostTuning()
+
+    def choose(self, host: str) -> int:
+        """Level to use for the next job against host."""
+        speeds = self.store.get(host)
+        if not speeds:
+            return TURBO_START_LEVEL
+
+        best = max(speeds, key=speeds.get)
+        below = speeds.get(best - 1)
+        climbing = below is None or speeds[best] > below * (1 + TURBO_MIN_GAIN)
+        if climbing and best + 1 < len(TURBO_LEVELS) and best + 1 not in speeds:
+            return best + 1
+        if best - 1 >= 0 and below is None:
+            return best - 1
+        return best
+
+    @staticmethod
+    def options(level: int) -> Dict:
+        """yt-dlp options for a level."""
+        fragments, chunk_size = TURBO_LEVELS[level]
+        return {
+            'concurrent_fragment_downloads': fragments,
+            'http_chunk_size': chunk_size,
+        }
+
+    def record(self, host: str, level: int, speed: float) -> None:
+        """Report the throughput a job reached at a level."""
+        logging.info(f"Turbo level {level} reached {speed / 1024 / 1024:.2f} MB/s on {host}")
+        self.store.record(host, level, speed)
+
+
+class MetadataPrefetcher:
+    """Extracts a URL's metadata into the info cache before its job is queued.
+
+    Only the latest URL matters: prefetching another one, or cancel(), aborts
+    the running extraction at its next HTTP request, unless keep() handed it
+    to a job. Callbacks receive (url, info) from the prefetch thread; info is
+    None on failure.
+    """
+
+    def __init__(self, info_cache: InfoCache):
+        self.info_cache = info_cache
+        self.lock = threading.Lock()
+        self.callbacks: List[Callable[[str, Optional[Dict]], None]] = []
+        self._tasks: Dict[str, Tuple[threading.Event, threading.Event]] = {}  # url -> (cancel, done)
+        self._latest: Optional[str] = None
+        self._kept: Set[str] = set()
+
+    def prefetch(self, url: str) -> None:
+        """Start extracting url in the background unless it is already in progress."""
+        with self.lock:
+            task = self._tasks.get(url)
+            if task is not None and not task[0].is_set():
+                self._latest = url
+                return
+            self._cancel_latest_locked()
+            task = self._tasks[url] = (threading.Event(), threading.Event())
+            self._latest = url
+            thread = threading.Thread(target=self._run, args=(url, *task),
+                                      name="Prefetch", daemon=True)
+        thread.start()
+
+    def cancel(self) -> None:
+        """Abandon the latest prefetch, if it is still running and not kept."""
+        with self.lock:
+            self._cancel_latest_locked()
+
+    def keep(self, url: str) -> None:
+        """Let a running prefetch finish even after the URL is replaced."""
+        with self.lock:
+            if url in self._tasks:
+                self._kept.add(url)
+
+    def wait(self, url: str, should_stop: Callable[[], bool] = lambda: False) -> None:
+        """Block while url is being prefetched, so its job can reuse the result."""
+        with self.lock:
+            task = self._tasks.get(url)
+        while task is not None and not task[1].wait(THROTTLE_SLICE) and not should_stop():
+            pass
+
+    def _cancel_latest_locked(self) -> None:
+        """Signal the latest prefetch to stop at its next request."""
+        task = self._tasks.get(self._latest)
+        if task is not None and self._latest not in self._kept:
+            task[0].set()
+        self._latest = None
+
+    def _run(self, url: str, cancel: threading.Event, done: threading.Event) -> None:
+        """Prefetch thread body: extract, cache, then report unless cancelled."""
+        try:
+            info = self.info_cache.get(url) or self._extract(url, cancel)
+        except Exception as e:
+            info = None
+            if not cancel.is_set():
+                logging.info(f"Prefetch of {url} failed: {e}")
+        finally:
+            with self.lock:
+                if url in self._tasks and self._tasks[url][0] is cancel:
+                    del self._tasks[url]
+                    self._kept.discard(url)
+            done.set()
+
+        if cancel.is_set():
+            return
+        for callback in list(self.callbacks):
+            callback(url, info)
+
+    def _extract(self, url: str, cancel: threading.Event) -> Dict:
+        """Run yt-dlp's extraction step with every request gated on cancel."""
+        from yt_dlp import YoutubeDL
+        from yt_dlp.utils import DownloadCancelled
+
+        with YoutubeDL({'quiet': True, 'no_warnings': True, 'noprogress': True}) as ydl:
+            urlopen = ydl.urlopen
+
+            def guarded_urlopen(request):
+                if cancel.is_set():
+                    raise DownloadCancelled("Prefetch cancelled")
+                return urlopen(request)
+
+            ydl.urlopen = guarded_urlopen
+            info = ydl.extract_info(url, download=False, process=False)
+            if info.get('_type', 'video') != 'video':
+                return info
+            info = ydl.sanitize_info(info, remove_private_keys=True)
+        if not cancel.is_set():
+            self.info_cache.put(url, info)
+        return info
+
+
+class SessionPool:
+    """Long-lived YoutubeDL instances handed from job to job.
+
+    Extractor instances (with their player and signature caches), HTTP
+    connection pools and the cookie jar survive between jobs; apply() only
+    swaps the per-job options. A session serves one job at a time, from
+    download through postprocessing, and idle sessions are matched to the
+    host they last served so its connections and cookies are warm.
+    """
+
+    def __init__(self, size: int = SESSION_POOL_SIZE, idle_timeout: float = SESSION_IDLE_TIMEOUT):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self._idle: List[Tuple[str, bool, float, 'YoutubeDL']] = []  # (host, quiet, released, ydl)
+        self._base: Dict[int, Dict] = {}  # id(ydl) -> session-wide params
+        self._closed = False
+
+    def acquire(self, host: str, opts: Dict) -> Tuple['YoutubeDL', bool]:
+        """Return a session configured with opts, and whether it was reused."""
+        from yt_dlp import YoutubeDL
+
+        quiet = bool(opts.get('quiet'))
+        ydl = None
+        with self.lock:
+            now = time.monotonic()
+            expired = [entry for entry in self._idle if now - entry[2] > self.idle_timeout]
+            self._idle = [entry for entry in self._idle if entry not in expired]
+            # The console stream is picked from 'quiet' at creation, so it must match
+            matches = [entry for entry in self._idle if entry[1] == quiet]
+            if matches:
+                entry = next((e for e in reversed(matches) if e[0] == host), matches[-1])
+                self._idle.remove(entry)
+                ydl = entry[3]
+        for entry in expired:
+            self._discard(entry[3])
+
+        if ydl is None:
+            # YoutubeDL adopts the dict it is given, so keep opts for telling job keys apart
+            ydl = YoutubeDL(dict(opts))
+            with self.lock:
+                self._base[id(ydl)] = {key: value for key, value in ydl.params.items()
+                                       if key not in opts}
+            return ydl, False
+        self.apply(ydl, opts)
+        return ydl, True
+
+    def apply(self, ydl: 'YoutubeDL', opts: Dict) -> None:
+        """Replace the per-job options of a session, redoing what YoutubeDL() derives from them."""
+        from yt_dlp.postprocessor import get_postprocessor
+        from yt_dlp.utils import POSTPROCESS_WHEN
+
+        with self.lock:
+            base = self._base[id(ydl)]
+        ydl.params = dict(base, **opts)
+        ydl._parse_outtmpl()
+        ydl.format_selector = ydl.build_format_selector(ydl.params['format'])
+
+        ydl._progress_hooks = []
+        ydl._postprocessor_hooks = []
+        ydl._post_hooks = []
+        for hook in ydl.params.get('progress_hooks', []):
+            ydl.add_progress_hook(hook)
+        for hook in ydl.params.get('postprocessor_hooks', []):
+            ydl.add_postprocessor_hook(hook)
+
+        ydl._pps = {when: [] for when in POSTPROCESS_WHEN}
+        for pp_def in ydl.params.get('postprocessors', []):
+            pp_def = dict(pp_def)
+            when = pp_def.pop('when', 'post_process')
+            ydl.add_post_processor(get_postprocessor(pp_def.pop('key'))(ydl, **pp_def), when=when)
+
+        ydl._download_retcode = 0
+        ydl._num_downloads = 0
+        ydl._playlist_urls.clear()
+
+    def release(self, ydl: 'YoutubeDL', host: str, reusable: bool = True) -> None:
+        """Return a session after its job; broken or surplus sessions are closed."""
+        quiet = bool(ydl.params.get('quiet'))
+        # Drop every reference to the finished job
+        ydl.__dict__.pop('post_process', None)
+        ydl._progress_hooks = []
+        ydl._postprocessor_hooks = []
+        with self.lock:
+            base = self._base.get(id(ydl))
+            if base is not None:
+                ydl.params = dict(base)
+            if reusable and base is not None and not self._closed:
+                self._idle.append((host, quiet, time.monotonic(), ydl))
+                if len(self._idle) <= self.size:
+                    return
+                ydl = self._idle.pop(0)[3]
+        self._discard(ydl)
+
+    def close(self) -> None:
+        """Close every idle session; sessions released later are closed too."""
+        with self.lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for entry in idle:
+            self._discard(entry[3])
+
+    def _discard(self, ydl: 'YoutubeDL') -> None:
+        """Close a session and forget it."""
+        with self.lock:
+            self._base.pop(id(ydl), None)
+        try:
+            ydl.close()
+        except Exception as e:
+            logging.warning(f"Error closing yt-dlp session: {e}")
+
+
+class JobMetrics:
+    """Timing spans and transfer statistics of one job, cheap enough to always collect."""
+
+    def __init__(self):
+        self.durations: Dict[str, float] = {}
+        self._open: Dict[str, float] = {}
+        self.retries = 0
+        self.peak_speed = 0.0
+        self.exported = False
+
+    def start(self, name: str) -> None:
+        """Open a span; a span already open keeps its start."""
+        self._open.setdefault(name, time.monotonic())
+
+    def end(self, name: str) -> None:
+        """Close a span, adding its time to any earlier run of the same span."""
+        started = self._open.pop(name, None)
+        if started is not None:
+            self.durations[name] = self.durations.get(name, 0.0) + time.monotonic() - started
+
+    @contextlib.contextmanager
+    def span(self, name: str):
+        """Time the enclosed block as a span."""
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def count_retry(self, n: int = 0) -> None:
+        """yt-dlp retry_sleep_functions callback: count the retry, keep the default no delay."""
+        self.retries += 1
+
+
+class JobStatus:
+    """Lifecycle states of a download job."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    POSTPROCESSING = "postprocessing"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    INTERRUPTED = "interrupted"  # stopped by shutdown, partial files kept for resuming
+
+    FINISHED = (DONE, FAILED, CANCELLED, INTERRUPTED)
+
+
+class DownloadWorker:
+    """Runs a single yt-dlp download and reports back through callbacks."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, url: str, media_type: str, quality: str, fmt: str, no_audio: bool,
+                 priority: int = PRIORITY_NORMAL, quiet: bool = False,
+                 info_cache: Optional[InfoCache] = None, journal: Optional[JobJournal] = None,
+                 journal_id: Optional[int] = None,
+                 targets: Optional[List[Tuple[str, str]]] = None,
+                 library: Optional[LibraryIndex] = None, turbo: Optional[TurboTuner] = None,
+                 prefetcher: Optional[MetadataPrefetcher] = None,
+                 output_dir: Optional[Path] = None, output_template: Optional[str] = None,
+                 staging_dir: Optional[Path] = None):
+        self.job_id = next(DownloadWorker._ids)
+        self.url = url
+        self.media_type = media_type
+        self.quality = quality
+        self.fmt = fmt.lower()
+        self.no_audio = no_audio
+        # Extra (format, quality) pairs encoded from a single audio download
+        self.targets: List[Tuple[str, str]] = []
+        if media_type == "Áudio" and targets:
+            pairs = [(self.fmt, quality)] + [(f.lower(), q) for f, q in targets]
+            # Outputs are named by extension and quality, so ACC and M4A would share a file
+            outputs = {}
+            for fmt, target_quality in pairs:
+                outputs.setdefault((audio_target(fmt).ext, target_quality), (fmt, target_quality))
+            self.targets = list(outputs.values())
+            if len(self.targets) == 1:
+                self.targets = []
+        self.priority = priority
+        self.quiet = quiet
+        self.output_dir = Path(output_dir) if output_dir else DOWNLOADS_FOLDER
+        self.output_template = output_template or OUTPUT_TEMPLATE
+        self.staging_dir = Path(staging_dir) if staging_dir else None
+        self._staging: Optional[Path] = None  # resolved when the job starts
+        self._preallocated: Set[str] = set()
+        self.info_cache = info_cache
+        self.prefetcher = prefetcher
+        self.library = library
+        self.turbo = turbo
+        self.turbo_level: Optional[int] = None
+        self._probe: Optional[Tuple[float, int]] = None  # (start time, bytes at start)
+        self._probed = False
+        self.cancelled = False
+        self.interrupted = False
+        self.ratelimit: Optional[float] = None
+        self._bucket = TokenBucket()
+        self._ydl: Optional['YoutubeDL'] = None
+        self._deferred_post_process: List[tuple] = []
+        # Set by DownloadScheduler.submit when the scheduler shares yt-dlp sessions
+        self.sessions: Optional[SessionPool] = None
+        self.session_reused = False
+        self.selection: Optional[FormatSelection] = None
+        # Set by DownloadScheduler.submit when jobs run in worker processes
+        self.processes: Optional['ProcessPool'] = None
+        self._process: Optional['WorkerProcess'] = None
+        # Set by DownloadScheduler.submit: FFmpeg slots extra target encodes may borrow
+        self.cpu_slots: Optional[threading.Semaphore] = None
+
+        # Playlist fan-out: a playlist job only lists its entries, each entry
+        # becomes a job of its own, queued by DownloadScheduler
+        self.is_playlist = False
+        self.entry_count: Optional[int] = None  # None until the length is known
+        self.entries_finished = 0
+        self.entries_failed = 0
+        self._entries = None
+        self.parent: Optional['DownloadWorker'] = None
+        self.playlist_index: Optional[int] = None
+        self.attempt = 1
+        # Called with every entry job before it is queued, inherited by nested playlists
+        self.entry_callbacks: List[Callable[['DownloadWorker'], None]] = []
+
+        self.status = JobStatus.QUEUED
+        self.message = ""
+        self.metrics = JobMetrics()
+
+        # Raw counters written by the progress hook and sampled by ProgressAggregator
+        self.downloaded_bytes = 0
+        self.total_bytes = 0
+        self.fragment_index = 0
+        self.fragment_count = 0
+        self.finishing = False
+        self._streams: Dict[str, Tuple[int, int]] = {}
+        self._finished_streams: Set[str] = set()
+        self._expected_streams = 1
+        self._expected_bytes = 0
+
+        # Every path this job wrote, so cancellation removes exactly these
+        self.output_files: Set[Path] = set()
+        self._fragment_bases: Dict[str, int] = {}  # tmpfilename -> highest fragment index
+
+        # Callbacks are invoked from the thread running the job
+        self.finished_callbacks: List[Callable[[bool, str], None]] = []
+
+        self.journal = journal
+        self.journal_id = journal_id
+        self._journal_flushed = 0.0
+        if journal is not None and journal_id is None:
+            self.journal_id = journal.add(self, self._get_serializable_options())
+
+    @classmethod
+    def from_journal(cls, row: Dict, journal: JobJournal, **kwargs) -> 'DownloadWorker':
+        """Rebuild an unfinished job from its journal row; yt-dlp resumes its partial files."""
+        options = row['options']
+        targets = [tuple(target) for target in options.get('targets', [])]
+        job = cls(row['url'], row['media_type'], row['quality'], row['fmt'], row['no_audio'],
+                  row['priority'], journal=journal, journal_id=row['id'], targets=targets,
+                  output_dir=options.get('output_dir'), output_template=options.get('output_template'),
+                  staging_dir=options.get('staging_dir'), **kwargs)
+        outputs = row['outputs']
+        job.output_files.update(Path(path) for path in outputs.get('files', []))
+        job._fragment_bases.update(outputs.get('fragments', {}))
+        job.downloaded_bytes = row['downloaded_bytes']
+        job.total_bytes = row['total_bytes']
+        return job
+
+    @property
+    def percent(self) -> int:
+        """Completion percentage derived from byte or fragment counters."""
+        if self.status == JobStatus.DONE or self.finishing:
+            return 100
+        if self.is_playlist:
+            return min(99, self.entries_finished * 100 // self.entry_count) if self.entry_count else 0
+        if self.total_bytes:
+            return min(99, self.downloaded_bytes * 100 // self.total_bytes)
+        if self.fragment_count:
+            return min(99, self.fragment_index * 100 // self.fragment_count)
+        return 0
+
+    @property
+    def host(self) -> str:
+        """Host the job downloads from, used for per-host concurrency limits."""
+        host = (urlparse(self.url).hostname or "").lower()
+        return host[4:] if host.startswith("www.") else host
+
+    def run(self) -> None:
+        """Download and postprocess in the calling thread."""
+        if self.download():
+            self.postprocess()
+
+    def download(self) -> bool:
+        """Network stage; returns True when postprocessing is still to be done.
+
+        yt-dlp's post_process step (merge, audio extraction, final move) is
+        captured instead of run, so postprocess() can do it on another thread.
+        """
+        if self.processes is not None:
+            return self.processes.download(self)
+        self._flush_journal(force=True)
+        if self.turbo is not None:
+            self.turbo_level = self.turbo.choose(self.host)
+        try:
+            self._open_ydl()
+            self._ydl.post_process = self._defer_post_process
+            if not self._download(self._ydl):
+                self._close_ydl()
+                self._emit_finished(True, LIBRARY_HIT_MESSAGE)
+                return False
+            if self.is_playlist:
+                # Still running: the scheduler queues the entries, see iter_entries()
+                return False
+            self._check_cancelled()
+            return True
+        except Exception as e:
+            self._close_ydl()
+            if self.cancelled:
+                self._stop()
+            else:
+                self._emit_finished(False, str(e))
+            return False
+
+    def postprocess(self) -> None:
+        """CPU stage: run the postprocessing captured by download(), then finish."""
+        if self.processes is not None:
+            self.processes.postprocess(self)
+            return
+        self.metrics.start("postprocess")
+        try:
+            from yt_dlp import YoutubeDL
+
+            for filename, info, files_to_move in self._deferred_post_process:
+                self._check_cancelled()
+                info = YoutubeDL.post_process(self._ydl, filename, info, files_to_move)
+                if self.targets:
+                    with self.metrics.span("transcode"):
+                        self._transcode_targets(info)
+                else:
+                    self._add_to_library(info, self.fmt, self.quality, info['filepath'])
+
+            if self.cancelled:
+                self._stop()
+            else:
+                self._emit_finished(True, "")
+        except Exception as e:
+            if self.cancelled:
+                self._stop()
+            else:
+                self._emit_finished(False, str(e))
+        finally:
+            self._close_ydl()
+            self._prune_staging()
+
+    def _prune_staging(self) -> None:
+        """Remove directories the output template created in staging once they are empty."""
+        if self._staging is None:
+            return
+        for path in self.output_files:
+            for parent in path.parents:
+                if parent == self._staging or self._staging not in parent.parents:
+                    break
+                try:
+                    parent.rmdir()
+                except OSError:
+                    break
+        # The fallback sits in the user's folder; yt-dlp recreates it for a job
+        # that resolved it just before this
+        if self._staging == self.output_dir / STAGING_DIRNAME:
+            try:
+                self._staging.rmdir()
+            except OSError:
+                pass
+
+    def _transcode_targets(self, info: Dict) -> None:
+        """Encode the downloaded audio once per target, then drop the source.
+
+        The job's own postprocessing slot encodes one target at a time; more
+        run alongside it only on slots of cpu_slots that are free right now,
+        so concurrent jobs never run more encoders than postprocess_workers.
+        Without a scheduler's slots the targets are encoded one by one.
+        """
+        source = Path(info['filepath'])
+        pending = deque(self.targets)
+        errors: List[Exception] = []
+        lock = threading.Lock()
+
+        def encode_pending(borrowed: bool) -> None:
+            try:
+                while True:
+                    with lock:
+                        if not pending or errors:
+                            return
+                        fmt, quality = pending.popleft()
+                    try:
+                        self._transcode_target(source, info, fmt, quality)
+                    except Exception as e:
+                        with lock:
+                            errors.append(e)
+                        return
+            finally:
+                if borrowed:
+                    self.cpu_slots.release()
+
+        # Never blocks: waiting for a slot while holding one could deadlock two jobs
+        helpers = []
+        while (self.cpu_slots is not None and len(helpers) < len(self.targets) - 1
+               and self.cpu_slots.acquire(blocking=False)):
+            helper = threading.Thread(target=encode_pending, args=(True,), daemon=True,
+                                      name=f"Transcode-{self.job_id}-{len(helpers) + 1}")
+            helper.start()
+            helpers.append(helper)
+        encode_pending(False)
+        for helper in helpers:
+            helper.join()
+        if errors:
+            raise errors[0]
+
+        self._check_cancelled()
+        try:
+            source.unlink()
+        except OSError as e:
+            logging.warning(f"Error removing transcode source {source}: {e}")
+
+    def _transcode_target(self, source: Path, info: Dict, fmt: str, quality: str) -> None:
+        """Run FFmpegExtractAudio for one target on a private link to the source.
+
+        Source and output stay in the staging directory; the finished output
+        is then renamed into the output directory.
+        """
+        from yt_dlp.postprocessor import FFmpegExtractAudioPP
+
+        self._check_cancelled()
+        # ExtractAudio renames its input, so every target gets its own hard link.
+        # The link's extension is the info 'ext', making the output {stem}-{quality}.{codec}
+        ext = f"{fmt}-source"
+        link = source.with_name(f"{source.stem}-{quality}.{ext}")
+        self.output_files.add(link)
+        try:
+            link.unlink()
+        except FileNotFoundError:
+            pass
+        link_or_copy(source, link)
+
+        try:
+            pp = FFmpegExtractAudioPP(self._ydl, preferredcodec=audio_target(fmt).codec,
+                                      preferredquality=quality.replace('k', ''))
+            result = self._ydl.run_pp(pp, dict(info, filepath=str(link), ext=ext))
+            staged = Path(result['filepath'])
+            self.output_files.add(staged)
+            destination = self.output_dir / staged.name
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            os.replace(staged, destination)
+            self.output_files.add(destination)
+            self._add_to_library(info, fmt, quality, str(destination))
+        finally:
+            try:
+                link.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _library_variant(self, fmt: str, quality: str) -> str:
+        """Library key suffix identifying one kind of output of a media item."""
+        return f"{self.media_type}:{fmt}:{quality}:{int(self.no_audio)}"
+
+    def _library_source(self, info: Dict) -> str:
+        """URL a library entry must have been downloaded from to be reused for this job."""
+        return info.get('webpage_url') or info.get('original_url') or self.url
+
+    def _add_to_library(self, info: Dict, fmt: str, quality: str, path: str) -> None:
+        """Index a finished output so later jobs for the same media can skip the download."""
+        key = InfoCache.key_for(info)
+        if self.library is None or key is None:
+            return
+        try:
+            self.library.add(key, self._library_variant(fmt, quality), Path(path),
+                             self._library_source(info))
+        except Exception as e:
+            logging.warning(f"Error indexing {path} in the library: {e}")
+
+    def _reuse_from_library(self, info: Dict) -> bool:
+        """Satisfy the job from indexed files; True when no download is needed.
+
+        Files living outside the output directory are hard-linked (or copied) into it.
+        """
+        key = InfoCache.key_for(info)
+        if self.library is None or key is None or info.get('_type', 'video') != 'video':
+            return False
+
+        source = self._library_source(info)
+        entries = [self.library.find(key, self._library_variant(fmt, quality), source)
+                   for fmt, quality in self.targets or [(self.fmt, self.quality)]]
+        if not all(entries):
+            return False
+
+        for entry in entries:
+            source = Path(entry['path'])
+            destination = self.output_dir / source.name
+            if not destination.exists():
+                self.output_dir.mkdir(parents=True, exist_ok=True)
+                link_or_copy(source, destination)
+        logging.info(f"{self.url} already downloaded as {[entry['path'] for entry in entries]}")
+        return True
+
+    def iter_entries(self) -> Iterator[Tuple[int, str]]:
+        """Yield (index, url) for each entry of a playlist job, fetching pages as they are needed.
+
+        Entries are not kept once yielded, so the length of a channel does
+        not bound memory. Entries extracted in full go to the info cache,
+        which spares their jobs a second extraction.
+        """
+        from yt_dlp.utils import PagedList
+
+        try:
+            if self._entries is None:
+                # Detected in a worker process, whose entries cannot be sent over
+                self._open_ydl()
+                with self.metrics.span("extract"):
+                    info = self._ydl.extract_info(self.url, download=False, process=False)
+                self._entries = info.get('entries') or []
+            entries, self._entries = self._entries, None
+            if isinstance(entries, PagedList):
+                # Indexing a PagedList caches every page it has fetched
+                entries._use_cache = False
+                entries = entries._getslice(0, None)
+
+            index = 0
+            for index, entry in enumerate(entries, 1):
+                if self.cancelled:
+                    return
+                url = entry and (entry.get('webpage_url') or entry.get('url'))
+                if not url:
+                    continue
+                if self.info_cache and entry.get('_type', 'video') == 'video' and entry.get('formats'):
+                    self.info_cache.put(url, self._ydl.sanitize_info(entry, remove_private_keys=True))
+                yield index, url
+            self.entry_count = index
+        finally:
+            self._close_ydl()
+
+    def for_entry(self, url: str, index: int, attempt: int = 1) -> 'DownloadWorker':
+        """Job for one entry of this playlist, with the playlist's settings."""
+        job = DownloadWorker(url, self.media_type, self.quality, self.fmt, self.no_audio,
+                             self.priority, quiet=self.quiet, info_cache=self.info_cache,
+                             targets=self.targets, library=self.library, turbo=self.turbo,
+                             output_dir=self.output_dir, output_template=self.output_template,
+                             staging_dir=self.staging_dir)
+        job.parent = self
+        job.playlist_index = index
+        job.attempt = attempt
+        job.entry_callbacks = self.entry_callbacks
+        return job
+
+    def _open_ydl(self) -> None:
+        """Take a YoutubeDL instance for this job, from the session pool when there is one."""
+        from yt_dlp import YoutubeDL
+
+        if self._staging is None:
+            self._staging = resolve_staging_dir(self.output_dir, self.staging_dir)
+        if self.sessions is not None:
+            self._ydl, self.session_reused = self.sessions.acquire(
+                self.host, self._get_download_options())
+        else:
+            self._ydl = YoutubeDL(self._get_download_options())
+
+    def _defer_post_process(self, filename: str, info: Dict,
+                            files_to_move: Optional[Dict] = None) -> Dict:
+        """Stand-in for YoutubeDL.post_process that records the call for later."""
+        info['filepath'] = filename
+        # yt-dlp strips the keys it copied into this dict once the download returns
+        self._deferred_post_process.append((filename, dict(info), files_to_move))
+        return info
+
+    def _close_ydl(self) -> None:
+        """Release the YoutubeDL instance shared by both stages."""
+        self._deferred_post_process = []
+        if self._ydl is None:
+            return
+        if self.sessions is not None:
+            # A cancelled download may leave the session mid-request
+            self.sessions.release(self._ydl, self.host, reusable=not self.cancelled)
+        else:
+            self._ydl.close()
+        self._ydl = None
+
+    def _stop(self) -> None:
+        """Finish a cancelled job, keeping partial files only when interrupted."""
+        if not self.interrupted:
+            self._clean_partial_downloads()
+            self._prune_staging()
+        self._emit_finished(False, CANCEL_MESSAGE)
+
+    def _download(self, ydl: 'YoutubeDL') -> bool:
+        """Download the URL, reusing cached extraction results when possible.
+
+        Returns False when the library already holds every output of the job.
+        """
+        from yt_dlp.utils import DownloadError
+
+        if self.prefetcher is not None:
+            self.prefetcher.wait(self.url, lambda: self.cancelled)
+        cached = self.info_cache.get(self.url) if self.info_cache else None
+        if cached is not None:
+            if self._reuse_from_library(cached):
+                return False
+            try:
+                self._check_cancelled()
+                self._select_formats(ydl, cached)
+                ydl.process_ie_result(cached, download=True)
+                return True
+            except DownloadError:
+                if self.cancelled:
+                    raise
+                # Format URLs went stale before their advertised expiry
+                logging.info(f"Cached info for {self.url} failed, extracting again")
+                self.info_cache.invalidate(self.url)
+
+        with self.metrics.span("extract"):
+            info = ydl.extract_info(self.url, download=False, process=False)
+        if info.get('_type') in PLAYLIST_TYPES:
+            self.is_playlist = True
+            self._entries = info.get('entries') or []
+            self.entry_count = info.get('playlist_count')
+            if self.entry_count is None and isinstance(self._entries, list):
+                self.entry_count = len(self._entries)
+            logging.info(f"{self.url} is a playlist ({self.entry_count or '?'} entries)")
+            return True
+        if self.info_cache and info.get('_type', 'video') == 'video':
+            self.info_cache.put(self.url, ydl.sanitize_info(info, remove_private_keys=True))
+        if self._reuse_from_library(info):
+            return False
+        self._check_cancelled()
+        self._select_formats(ydl, info)
+        ydl.process_ie_result(info, download=True)
+        return True
+
+    def _select_formats(self, ydl: 'YoutubeDL', info: Dict) -> None:
+        """Pin the streams that best fit the output, keeping the generic spec as fallback."""
+        if info.get('_type', 'video') != 'video' or not info.get('formats'):
+            return
+        if self.media_type == "Vídeo":
+            selection = select_video_formats(info['formats'], self.fmt, max_height(self.quality),
+                                             self.no_audio)
+        else:
+            targets = [audio_target(fmt) for fmt, _ in self.targets or [(self.fmt, self.quality)]]
+            selection = select_audio_format(info['formats'], targets, info.get('duration'))
+        if selection is None:
+            return
+
+        # The selector is compiled when YoutubeDL is created, so replace it directly
+        fallback = self._get_download_options()['format']
+        ydl.format_selector = ydl.build_format_selector(f"{selection.spec}/{fallback}")
+        self.selection = selection
+        logging.info(f"{self.url}: selected {selection.summary}"
+                     f" (stream copy: {selection.stream_copy}, ~{selection.cpu_saved:.1f}s CPU saved)")
+
+    def _get_serializable_options(self) -> Dict:
+        """Download options without the in-process hooks, for the journal."""
+        opts = {key: value for key, value in self._get_download_options().items()
+                if not key.endswith(('_hooks', '_functions'))}
+        if self.targets:
+            opts['targets'] = self.targets
+        opts['output_dir'] = str(self.output_dir)
+        opts['output_template'] = self.output_template
+        if self.staging_dir is not None:
+            opts['staging_dir'] = str(self.staging_dir)
+        return opts
+
+    def _get_download_options(self) -> Dict:
+        """Generate download options based on media type and settings."""
+        staging = self._staging or resolve_staging_dir(self.output_dir, self.staging_dir)
+        opts = {
+            'outtmpl': self.output_template,
+            # Targets are encoded in staging too and then renamed, see _transcode_target
+            'paths': {'home': str(staging if self.targets else self.output_dir),
+                      'temp': str(staging)},
+            'buffersize': DISK_BUFFER_SIZE,
+            'progress_hooks': [self._progress_hook],
+            'postprocessor_hooks': [self._postprocessor_hook],
+            'retry_sleep_functions': {kind: self.metrics.count_retry
+                                      for kind in ('http', 'fragment', 'extractor')},
+            'format': 'bestaudio/best',
+        }
+        if self.quiet:
+            opts.update({'quiet': True, 'noprogress': True, 'no_warnings': True})
+        if self.turbo_level is not None:
+            opts.update(TurboTuner.options(self.turbo_level))
+
+        if self.media_type == "Vídeo":
+            opts = self._configure_video_options(opts)
+        else:
+            opts = self._configure_audio_options(opts)
+
+        return opts
+
+    def _configure_video_options(self, opts: Dict) -> Dict:
+        """Configure options for video downloads."""
+        height = max_height(self.quality)
+        if height is None:
+            opts['format'] = 'bestvideo+bestaudio/best'
+        else:
+            opts['format'] = f'bestvideo[height<={height}]+bestaudio/best'
+
+        if self.no_audio:
+            opts['format'] = opts['format'].split('+')[0]
+
+        opts['merge_output_format'] = self.fmt
+        return opts
+
+    def _configure_audio_options(self, opts: Dict) -> Dict:
+        """Configure options for audio downloads."""
+        opts['format'] = 'bestaudio'
+        if self.targets:
+            # Encoded per target after the download, see _transcode_targets
+            return opts
+        opts['postprocessors'] = [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': audio_target(self.fmt).codec,
+            'preferredquality': self.quality.replace('k', '')
+        }]
+        return opts
+
+    def cancel(self) -> None:
+        """Request cancellation; the job stops at its next chunk, fragment or postprocessor.
+
+        Only sets a flag, so it is safe to call from any thread. The job's own
+        thread removes its files and reports the outcome. A job running in a
+        worker process is killed at once instead.
+        """
+        self.cancelled = True
+        self._kill_process()
+
+    def interrupt(self) -> None:
+        """Stop like cancel() but keep partial files so the job can resume later."""
+        self.interrupted = True
+        self.cancelled = True
+        self._kill_process()
+
+    def set_ratelimit(self, ratelimit: Optional[float]) -> None:
+        """Cap the download rate in bytes per second; takes effect on the next chunk."""
+        self.ratelimit = ratelimit
+        self._bucket.set_rate(ratelimit)
+        process = self._process
+        if process is not None:
+            process.send("ratelimit", ratelimit)
+
+    def _kill_process(self) -> None:
+        """Kill the worker process running this job, if any; its stage then reports the stop."""
+        process = self._process
+        if process is not None:
+            process.kill()
+
+    def _check_cancelled(self) -> None:
+        """Abort the yt-dlp call stack if cancellation was requested."""
+        if self.cancelled:
+            from yt_dlp.utils import DownloadCancelled
+            raise DownloadCancelled(CANCEL_MESSAGE)
+
+    def _clean_partial_downloads(self) -> None:
+        """Delete exactly the temp, fragment and output files this job wrote."""
+        paths = set()
+        for path in self.output_files:
+            paths.update((path, path.with_name(f"{path.stem}.temp{path.suffix}")))
+        for tmpfilename, last_index in self._fragment_bases.items():
+            for index in range(last_index + FRAGMENT_CLEANUP_MARGIN + 1):
+                fragment = Path(f"{tmpfilename}-Frag{index}")
+                paths.update((fragment, fragment.with_name(fragment.name + ".part")))
+
+        for path in paths:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.warning(f"Error cleaning partial download {path}: {e}")
+
+    def _track_download(self, d: Dict) -> None:
+        """Record the final, temp, state and fragment files of a stream being written."""
+        filename = d.get('filename')
+        tmpfilename = d.get('tmpfilename') or filename
+        if filename:
+            self.output_files.update((Path(filename), Path(filename + '.ytdl')))
+        if tmpfilename:
+            self.output_files.add(Path(tmpfilename))
+            if d.get('fragment_index') is not None:
+                last_index = self._fragment_bases.get(tmpfilename, 0)
+                self._fragment_bases[tmpfilename] = max(last_index, d['fragment_index'])
+
+    def _preallocate(self, d: Dict) -> None:
+        """Reserve the disk space of a large single-file stream on its first progress report."""
+        tmpfilename = d.get('tmpfilename')
+        total = d.get('total_bytes') or 0
+        if (not tmpfilename or tmpfilename in self._preallocated or total < PREALLOCATE_MIN_BYTES
+                or d.get('fragment_index') is not None):
+            return
+        self._preallocated.add(tmpfilename)
+        if preallocate(tmpfilename, total):
+            logging.debug(f"Preallocated {total} bytes for {tmpfilename}")
+
+    def _progress_hook(self, d: Dict) -> None:
+        """Record raw progress counters; consumers sample them at their own rate."""
+        self._check_cancelled()
+
+        status = d.get('status')
+        filename = d.get('filename') or ''
+        if status == 'downloading':
+            self.metrics.start("download")
+            self.metrics.peak_speed = max(self.metrics.peak_speed, d.get('speed') or 0)
+            self._track_download(d)
+            self._preallocate(d)
+            total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+            downloaded = d.get('downloaded_bytes') or 0
+            received = downloaded - self._streams.get(filename, (0, 0))[0]
+            self._streams[filename] = (downloaded, int(total))
+            self.fragment_index = d.get('fragment_index') or 0
+            self.fragment_count = d.get('fragment_count') or 0
+            if not self._expected_bytes:
+                self._expect_streams(d.get('info_dict') or {})
+        elif status == 'finished':
+            done = d.get('downloaded_bytes') or d.get('total_bytes') or 0
+            self._streams[filename] = (done, done)
+            self._finished_streams.add(filename)
+        else:
+            return
+
+        self.downloaded_bytes = sum(done for done, _ in self._streams.values())
+        self.total_bytes = max(self._expected_bytes,
+                               sum(total for _, total in self._streams.values()))
+        self.finishing = len(self._finished_streams) >= self._expected_streams
+        self._flush_journal()
+        if self.finishing:
+            self.metrics.end("download")
+            self._measure_turbo(final=True)
+
+        if status == 'downloading' and received > 0:
+            self._measure_turbo()
+            # Holding yt-dlp here until the bytes are paid for throttles the transfer
+            self._bucket.consume(received, lambda: self.cancelled)
+            self._check_cancelled()
+
+    def _measure_turbo(self, final: bool = False) -> None:
+        """Report throughput over the first TURBO_PROBE_SECONDS of transfer."""
+        if self.turbo_level is None or self._probed:
+            return
+        now = time.monotonic()
+        if self._probe is None:
+            self._probe = (now, self.downloaded_bytes)
+            return
+
+        started, start_bytes = self._probe
+        elapsed = now - started
+        if elapsed < (TURBO_MIN_PROBE_SECONDS if final else TURBO_PROBE_SECONDS):
+            return
+        self._probed = True
+        # Rate-limited jobs measure the limit, not the link
+        if self.ratelimit is None:
+            self.turbo.record(self.host, self.turbo_level,
+                              (self.downloaded_bytes - start_bytes) / elapsed)
+
+    def _flush_journal(self, force: bool = False) -> None:
+        """Persist status, progress and written files, at most every JOURNAL_FLUSH_INTERVAL."""
+        if self.journal is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._journal_flushed < JOURNAL_FLUSH_INTERVAL:
+            return
+        self._journal_flushed = now
+
+        outputs = {
+            'files': sorted(str(path) for path in self.output_files),
+            'fragments': self._fragment_bases,
+        }
+        try:
+            self.journal.update(self.journal_id, self.status, self.downloaded_bytes,
+                                self.total_bytes, outputs, self.message)
+        except Exception as e:
+            logging.warning(f"Error writing job journal: {e}")
+
+    def _postprocessor_hook(self, d: Dict) -> None:
+        """Track files produced by postprocessors and stop between them on cancel."""
+        name = f"pp.{d.get('postprocessor')}"
+        if d.get('status') == 'started':
+            self.metrics.start(name)
+        elif d.get('status') == 'finished':
+            self.metrics.end(name)
+
+        # Files already on disk before this job must never be claimed
+        filepath = (d.get('info_dict') or {}).get('filepath')
+        if filepath and self.output_files:
+            self.output_files.add(Path(filepath))
+            # yt-dlp reports the source path only; the extracted audio is a sibling
+            if d.get('postprocessor') == 'ExtractAudio':
+                self.output_files.add(Path(filepath).with_suffix(f".{audio_target(self.fmt).ext}"))
+
+        self._check_cancelled()
+
+    def _expect_streams(self, info: Dict) -> None:
+        """Learn how many streams, and roughly how many bytes, the job will fetch."""
+        formats = info.get('requested_formats') or [info]
+        self._expected_streams = len(formats)
+        sizes = [fmt.get('filesize') or fmt.get('filesize_approx') for fmt in formats]
+        if all(sizes):
+            self._expected_bytes = int(sum(sizes))
+
+    def metrics_record(self) -> Dict:
+        """Structured summary of the job: outcome, transfer statistics and span durations."""
+        transfer = self.metrics.durations.get("download")
+        record = {
+            "job": self.job_id,
+            "url": self.url,
+            "media_type": self.media_type,
+            "format": self.fmt,
+            "quality": self.quality,
+            "priority": self.priority,
+            "status": self.status,
+            "bytes": self.downloaded_bytes,
+            "avg_speed": round(self.downloaded_bytes / transfer) if transfer else None,
+            "peak_speed": round(self.metrics.peak_speed),
+            "retries": self.metrics.retries,
+            "fragments": self.fragment_count,
+            "turbo_level": self.turbo_level,
+            "session_reused": self.session_reused,
+            "spans": {name: round(seconds, 3) for name, seconds in self.metrics.durations.items()},
+        }
+        if self.is_playlist:
+            record["entries"] = {"total": self.entry_count, "finished": self.entries_finished,
+                                 "failed": self.entries_failed}
+        if self.parent is not None:
+            record["playlist"] = {"job": self.parent.job_id, "index": self.playlist_index,
+                                  "attempt": self.attempt}
+        if self.selection is not None:
+            record["selection"] = {
+                "formats": self.selection.spec,
+                "summary": self.selection.summary,
+                "stream_copy": self.selection.stream_copy,
+                "cpu_saved": round(self.selection.cpu_saved, 1),
+            }
+        if self.status != JobStatus.DONE:
+            record["message"] = self.message
+        return record
+
+    def _emit_finished(self, success: bool, msg: str) -> None:
+        """Record the final state and notify listeners."""
+        if success:
+            self.status = JobStatus.DONE
+        elif self.interrupted:
+            self.status = JobStatus.INTERRUPTED
+        elif self.cancelled:
+            self.status = JobStatus.CANCELLED
+        else:
+            self.status = JobStatus.FAILED
+        self.message = msg
+        self.metrics.end("postprocess")
+        self._flush_journal(force=True)
+        for callback in list(self.finished_callbacks):
+            callback(success, msg)
+
+
+class JobSummary:
+    """What a finished job leaves in the scheduler: the fields front ends show.
+
+    Replaces the DownloadWorker once listeners have seen it finish, so the
+    worker's hooks, callbacks, counters and file sets are freed.
+    """
+
+    __slots__ = ("job_id", "url", "priority", "status", "message", "percent",
+                 "downloaded_bytes", "total_bytes", "finished", "_record")
+
+    def __init__(self, job: DownloadWorker):
+        self.job_id = job.job_id
+        self.url = job.url
+        self.priority = job.priority
+        self.status = job.status
+        self.message = job.message
+        self.percent = job.percent
+        self.downloaded_bytes = job.downloaded_bytes
+        self.total_bytes = job.total_bytes
+        self.finished = time.time()
+        self._record = job.metrics_record()
+
+    def metrics_record(self) -> Dict:
+        """The finished job's DownloadWorker.metrics_record()."""
+        return dict(self._record)
+
+    def history_record(self) -> Dict:
+        """Line written to the history log when the summary is dropped."""
+        return dict(self._record, time=time.strftime("%Y-%m-%dT%H:%M:%S%z",
+                                                      time.localtime(self.finished)))
+
+
+class DownloadScheduler:
+    """Priority job queue served by a bounded pool of worker threads.
+
+    Jobs run in two stages. Download threads (max_workers) do the network
+    transfer, then hand the job to a CPU-sized pool of postprocessing threads
+    for merging and transcoding, freeing the download slot. When the
+    postprocessing backlog is full, download threads hold their slot until
+    it drains, which throttles downloads to what the CPU can keep up with.
+
+    Finished jobs are kept as JobSummary records, at most history_limit of
+    them; older ones are written to the history log, if there is one.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS,
+                 per_host_limit: int = DEFAULT_PER_HOST_LIMIT,
+                 postprocess_workers: int = DEFAULT_POSTPROCESS_WORKERS,
+                 bandwidth: Optional[BandwidthManager] = None, reuse_sessions: bool = True,
+                 processes: Optional['ProcessPool'] = None,
+                 history_limit: int = JOB_HISTORY_LIMIT, history: Optional[JobHistory] = None):
+        self.bandwidth = bandwidth
+        self.history_limit = max(0, history_limit)
+        self.history = history
+        self.sessions = SessionPool() if reuse_sessions else None
+        self.processes = processes
+        self.max_workers = max(1, max_workers)
+        self.per_host_limit = max(1, per_host_limit)
+        self.postprocess_workers = max(1, postprocess_workers)
+        self._resize_processes()
+
+        self._cond = threading.Condition()
+        self._queue: List[tuple] = []  # heap of (priority, sequence, job)
+        self._sequence = itertools.count()
+        self._jobs: Dict[int, Union[DownloadWorker, JobSummary]] = {}
+        self._finished: deque = deque()  # ids of JobSummary entries, oldest first
+        self._host_load: Dict[str, int] = {}
+        self._threads: List[threading.Thread] = []
+        self._idle_threads = 0
+        self._running = 0
+        self._closed = False
+
+        self._pp_queue: deque = deque()
+        self._pp_threads: List[threading.Thread] = []
+        self._pp_running = 0
+        # One per FFmpeg worker, taken by postprocessing threads and extra target encoders
+        self._cpu_slots = threading.Semaphore(self.postprocess_workers)
+        self._expanding = 0  # playlists whose entries are still being queued
+
+        # Listeners receive the job whenever its status changes; progress is
+        # sampled separately through ProgressAggregator
+        self.listeners: List[Callable[[DownloadWorker], None]] = []
+
+    def submit(self, job: DownloadWorker) -> DownloadWorker:
+        """Queue a job and wake a worker thread to pick it up."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Scheduler is shut down")
+            self._jobs[job.job_id] = job
+            if job.sessions is None:
+                job.sessions = self.sessions
+            if job.processes is None:
+                job.processes = self.processes
+            if job.cpu_slots is None:
+                job.cpu_slots = self._cpu_slots
+            job.metrics.start("queue")
+            heapq.heappush(self._queue, (job.priority, next(self._sequence), job))
+            self._spawn_workers_locked()
+            self._cond.notify_all()
+
+        self._notify(job)
+        return job
+
+    def cancel(self, job_id: int) -> None:
+        """Cancel a queued or running job."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in JobStatus.FINISHED:
+                return
+
+            job.cancel()
+            if job.status != JobStatus.QUEUED:
+                # Wakes the thread queueing the job's entries, if it is a playlist
+                self._cond.notify_all()
+                return
+
+            # Queued jobs never reach a worker, finish them here
+            self._queue = [entry for entry in self._queue if entry[2] is not job]
+            heapq.heapify(self._queue)
+            self._cond.notify_all()
+
+        job._emit_finished(False, CANCEL_MESSAGE)
+        self._notify(job)
+
+    def cancel_all(self) -> None:
+        """Cancel every job that has not finished yet."""
+        for job in self.jobs():
+            self.cancel(job.job_id)
+
+    def interrupt_all(self) -> None:
+        """Stop every unfinished job but keep its partial files for resuming."""
+        with self._cond:
+            jobs = [job for job in self._jobs.values() if job.status not in JobStatus.FINISHED]
+            for job in jobs:
+                job.interrupt()
+            queued = [entry[2] for entry in self._queue]
+            self._queue = []
+            self._cond.notify_all()
+
+        for job in queued:
+            job._emit_finished(False, CANCEL_MESSAGE)
+            self._notify(job)
+
+    def set_max_workers(self, max_workers: int) -> None:
+        """Resize the worker pool; surplus threads exit once they become idle."""
+        with self._cond:
+            self.max_workers = max(1, max_workers)
+            self._spawn_workers_locked()
+            self._cond.notify_all()
+        self._resize_processes()
+
+    def set_per_host_limit(self, per_host_limit: int) -> None:
+        """Change how many jobs may run against the same host at once."""
+        with self._cond:
+            self.per_host_limit = max(1, per_host_limit)
+            self._cond.notify_all()
+
+    def get(self, job_id: int) -> Optional[Union[DownloadWorker, JobSummary]]:
+        """Return the job with the given id, if known."""
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[Union[DownloadWorker, JobSummary]]:
+        """Snapshot of all known jobs in submission order."""
+        with self._cond:
+            return list(self._jobs.values())
+
+    def clear_finished(self) -> None:
+        """Forget jobs that are no longer queued or running, logging them to the history."""
+        with self._cond:
+            finished = [job for job in self._jobs.values() if job.status in JobStatus.FINISHED]
+            self._jobs = {job_id: job for job_id, job in self._jobs.items()
+                          if job.status not in JobStatus.FINISHED}
+            self._finished.clear()
+        self._log_history([job for job in finished if isinstance(job, JobSummary)])
+
+    def pending_count(self) -> int:
+        """Number of jobs queued, downloading or postprocessing."""
+        with self._cond:
+            return self._pending_locked()
+
+    def wait_for_capacity(self, max_pending: int) -> None:
+        """Block until fewer than max_pending jobs are queued, downloading or postprocessing."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending_locked() < max_pending)
+
+    def is_idle(self) -> bool:
+        """Whether nothing is queued, downloading or postprocessing."""
+        with self._cond:
+            return self._pending_locked() == 0
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every submitted job has finished."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending_locked() == 0, timeout)
+
+    def _pending_locked(self) -> int:
+        """Jobs in any stage that have not finished yet."""
+        return (len(self._queue) + self._running + len(self._pp_queue) + self._pp_running
+                + self._expanding)
+
+    def shutdown(self, cancel: bool = True) -> None:
+        """Stop accepting jobs and let worker threads exit."""
+        if cancel:
+            self.cancel_all()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self.sessions is not None:
+            self.sessions.close()
+        if self.processes is not None:
+            self.processes.close()
+
+    def _resize_processes(self) -> None:
+        """Let the process pool hold every download plus the postprocessing backlog."""
+        if self.processes is not None:
+            self.processes.resize(self.max_workers + self.postprocess_workers)
+
+    def _spawn_workers_locked(self) -> None:
+        """Start threads until the pool covers the queue, up to max_workers."""
+        while (len(self._threads) < self.max_workers
+               and self._idle_threads < len(self._queue)):
+            thread = threading.Thread(target=self._worker_loop, daemon=True,
+                                      name=f"DownloadWorker-{len(self._threads) + 1}")
+            self._threads.append(thread)
+            thread.start()
+            self._idle_threads += 1
+
+    def _next_job_locked(self) -> Optional[DownloadWorker]:
+        """Pop the highest-priority job whose host still has a free slot."""
+        skipped = []
+        job = None
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            if self._host_load.get(entry[2].host, 0) < self.per_host_limit:
+                job = entry[2]
+                break
+            skipped.append(entry)
+
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+        return job
+
+    def _worker_loop(self) -> None:
+        """Pull jobs off the queue until the pool shrinks or shuts down."""
+        current = threading.current_thread()
+        while True:
+            with self._cond:
+                job = None
+                while job is None:
+                    if self._closed or len(self._threads) > self.max_workers:
+                        self._threads.remove(current)
+                        self._idle_threads -= 1
+                        self._cond.notify_all()
+                        return
+                    job = self._next_job_locked()
+                    if job is None:
+                        self._cond.wait()
+
+                self._idle_threads -= 1
+                self._running += 1
+                self._host_load[job.host] = self._host_load.get(job.host, 0) + 1
+                job.status = JobStatus.RUNNING
+                job.metrics.end("queue")
+
+            self._notify(job)
+            handoff = False
+            try:
+                if self.bandwidth is not None:
+                    self.bandwidth.attach(job)
+                handoff = job.download()
+            except Exception as e:
+                logging.exception(f"Unhandled error in job {job.job_id}: {e}")
+                job._emit_finished(False, str(e))
+            finally:
+                if self.bandwidth is not None:
+                    self.bandwidth.detach(job)
+                with self._cond:
+                    if handoff:
+                        self._handoff_locked(job)
+                    elif job.is_playlist and job.status not in JobStatus.FINISHED:
+                        self._expanding += 1
+                        threading.Thread(target=self._expand_playlist, args=(job,), daemon=True,
+                                         name=f"Playlist-{job.job_id}").start()
+                    self._running -= 1
+                    self._idle_threads += 1
+                    self._host_load[job.host] -= 1
+                    if not self._host_load[job.host]:
+                        del self._host_load[job.host]
+                    self._cond.notify_all()
+            self._notify(job)
+
+    def _handoff_locked(self, job: DownloadWorker) -> None:
+        """Queue a downloaded job for postprocessing, waiting while the backlog is full."""
+        self._cond.wait_for(
+            lambda: len(self._pp_queue) + self._pp_running < self.postprocess_workers * 2
+        )
+        job.status = JobStatus.POSTPROCESSING
+        job.metrics.start("postprocess_wait")
+        self._pp_queue.append(job)
+        if len(self._pp_threads) < min(self.postprocess_workers,
+                                       self._pp_running + len(self._pp_queue)):
+            thread = threading.Thread(target=self._postprocess_loop, daemon=True,
+                                      name=f"PostProcessor-{len(self._pp_threads) + 1}")
+            self._pp_threads.append(thread)
+            thread.start()
+
+    def _expand_playlist(self, playlist: DownloadWorker) -> None:
+        """Queue a playlist's entries as jobs, keeping only a window of them pending.
+
+        Runs outside the download pool, so a playlist never holds the slot
+        its own entries need. Failed entries are retried as new jobs.
+        """
+        active: List[DownloadWorker] = []
+        error = None
+        try:
+            for index, url in playlist.iter_entries():
+                self._settle_entries(playlist, active, self.max_workers * PLAYLIST_WINDOW_PER_WORKER)
+                if self._closed:
+                    # Shut down without cancelling: stop listing, like interrupt_all()
+                    playlist.interrupt()
+                if playlist.cancelled:
+                    break
+                self._submit_entry(active, playlist.for_entry(url, index))
+        except Exception as e:
+            if not playlist.cancelled:
+                logging.warning(f"Listing playlist {playlist.url} failed: {e}")
+                error = str(e)
+
+        if not playlist.cancelled:
+            self._settle_entries(playlist, active, 1)
+        if playlist.cancelled:
+            for job in active:
+                self.cancel(job.job_id)
+            playlist._emit_finished(False, CANCEL_MESSAGE)
+        elif error is not None:
+            playlist._emit_finished(False, error)
+        elif playlist.entries_failed:
+            playlist._emit_finished(False, PLAYLIST_FAILED_MESSAGE.format(
+                failed=playlist.entries_failed, total=playlist.entries_finished))
+        else:
+            playlist._emit_finished(True, "")
+
+        with self._cond:
+            self._expanding -= 1
+            self._cond.notify_all()
+        self._notify(playlist)
+
+    def _settle_entries(self, playlist: DownloadWorker, active: List[DownloadWorker],
+                        limit: int) -> None:
+        """Wait until fewer than limit entries are pending, counting and retrying finished ones."""
+        while True:
+            retries = []
+            with self._cond:
+                self._cond.wait_for(lambda: playlist.cancelled or len(active) < limit
+                                    or any(job.status in JobStatus.FINISHED for job in active))
+                for job in [job for job in active if job.status in JobStatus.FINISHED]:
+                    active.remove(job)
+                    if (job.status == JobStatus.FAILED and job.attempt <= PLAYLIST_ENTRY_RETRIES
+                            and not playlist.cancelled):
+                        logging.info(f"Retrying playlist entry {job.url}: {job.message}")
+                        retries.append(playlist.for_entry(job.url, job.playlist_index,
+                                                          job.attempt + 1))
+                        continue
+                    playlist.entries_finished += 1
+                    if job.status != JobStatus.DONE:
+                        playlist.entries_failed += 1
+                done = playlist.cancelled or len(active) < limit
+            for job in retries:
+                self._submit_entry(active, job)
+            if done and not retries:
+                return
+
+    def _submit_entry(self, active: List[DownloadWorker], job: DownloadWorker) -> None:
+        """Queue a playlist entry job, tracking it among the playlist's pending entries."""
+        for callback in list(job.entry_callbacks):
+            callback(job)
+        try:
+            self.submit(job)
+        except RuntimeError:
+            return  # shut down while the playlist was being listed
+        active.append(job)
+
+    def _postprocess_loop(self) -> None:
+        """Run postprocessing for handed-off jobs; exits once the queue drains."""
+        current = threading.current_thread()
+        while True:
+            with self._cond:
+                if not self._pp_queue:
+                    self._pp_threads.remove(current)
+                    return
+                job = self._pp_queue.popleft()
+                self._pp_running += 1
+                job.metrics.end("postprocess_wait")
+
+            # Shared with the extra encoders of multi-target jobs, see _transcode_targets
+            self._cpu_slots.acquire()
+            try:
+                job.postprocess()
+            except Exception as e:
+                logging.exception(f"Unhandled error postprocessing job {job.job_id}: {e}")
+                job._emit_finished(False, str(e))
+            finally:
+                self._cpu_slots.release()
+                with self._cond:
+                    self._pp_running -= 1
+                    self._cond.notify_all()
+            self._notify(job)
+
+    def _notify(self, job: DownloadWorker) -> None:
+        """Forward a job change to every listener."""
+        for listener in list(self.listeners):
+            try:
+                listener(job)
+            except Exception as e:
+                logging.warning(f"Scheduler listener failed: {e}")
+        if job.status in JobStatus.FINISHED:
+            self._retire(job)
+
+    def _retire(self, job: DownloadWorker) -> None:
+        """Swap a finished job for its summary, dropping the oldest beyond history_limit."""
+        evicted = []
+        with self._cond:
+            if self._jobs.get(job.job_id) is not job:
+                return
+            self._jobs[job.job_id] = JobSummary(job)
+            self._finished.append(job.job_id)
+            while len(self._finished) > self.history_limit:
+                summary = self._jobs.pop(self._finished.popleft(), None)
+                if summary is not None:
+                    evicted.append(summary)
+        self._log_history(evicted)
+
+    def _log_history(self, summaries: List[JobSummary]) -> None:
+        """Write dropped summaries to the history log."""
+        if self.history is None or not summaries:
+            return
+        try:
+            self.history.append([summary.history_record() for summary in summaries])
+        except Exception as e:
+            logging.warning(f"Error writing job history: {e}")
+
+
+class JobProgress(NamedTuple):
+    """Point-in-time progress of one job, or of several jobs combined."""
+
+    percent: int
+    downloaded_bytes: int
+    total_bytes: int
+    speed: float
+    eta: Optional[float]
+
+
+class ProgressAggregator:
+    """Samples raw job counters at a fixed rate into smoothed speed and ETA."""
+
+    def __init__(self, smoothing: float = SPEED_SMOOTHING):
+        self.smoothing = smoothing
+        self._samples: Dict[int, Tuple[float, int, float]] = {}  # job_id -> (time, bytes, speed)
+
+    def sample(self, jobs: List[DownloadWorker]) -> Tuple[Dict[int, JobProgress], JobProgress]:
+        """Return per-job progress and the aggregate over unfinished jobs."""
+        now = time.monotonic()
+        samples = {}
+        progress = {}
+        for job in jobs:
+            downloaded = job.downloaded_bytes
+            speed = 0.0
+            if job.status == JobStatus.RUNNING:
+                speed = self._smoothed_speed(job.job_id, now, downloaded)
+                samples[job.job_id] = (now, downloaded, speed)
+            progress[job.job_id] = JobProgress(job.percent, downloaded, job.total_bytes,
+                                               speed, self._eta(job.total_bytes - downloaded, speed))
+
+        # Only running jobs keep state, so finished jobs cost nothing
+        self._samples = samples
+        return progress, self._combine([progress[job.job_id] for job in jobs
+                                        if job.status not in JobStatus.FINISHED])
+
+    def _smoothed_speed(self, job_id: int, now: float, downloaded: int) -> float:
+        """Exponentially smoothed bytes per second since the previous sample."""
+        previous = self._samples.get(job_id)
+        if previous is None:
+            return 0.0
+        last_time, last_bytes, last_speed = previous
+        elapsed = now - last_time
+        if elapsed <= 0:
+            return last_speed
+        instant = max(0, downloaded - last_bytes) / elapsed
+        if not last_speed:
+            return instant
+        return last_speed + self.smoothing * (instant - last_speed)
+
+    def _combine(self, pending: List[JobProgress]) -> JobProgress:
+        """Aggregate progress: bytes-weighted when every size is known."""
+        if not pending:
+            return JobProgress(100, 0, 0, 0.0, None)
+
+        downloaded = sum(p.downloaded_bytes for p in pending)
+        speed = sum(p.speed for p in pending)
+        if all(p.total_bytes for p in pending):
+            total = sum(p.total_bytes for p in pending)
+            percent = min(100, downloaded * 100 // total)
+            return JobProgress(percent, downloaded, total, speed, self._eta(total - downloaded, speed))
+
+        percent = sum(p.percent for p in pending) // len(pending)
+        return JobProgress(percent, downloaded, 0, speed, None)
+
+    @staticmethod
+    def _eta(remaining: int, speed: float) -> Optional[float]:
+        """Seconds left at the current speed, if it can be estimated."""
+        if speed <= 0 or remaining <= 0:
+            return None
+        return remaining / speed
+
+
+def format_bytes(size: float) -> str:
+    """Human-readable byte count."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    """Format an ETA as H:MM:SS or M:SS."""
+    if seconds is None:
+        return "--:--"
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
@@ -1,42 +1,129 @@
+import time
+
+STARTUP_T0 = time.perf_counter()
+
 import os
 import sys
+import json
+import datetime
 import logging
+import logging.handlers
+import multiprocessing
+import contextlib
+import threading
 import webbrowser
-from typing import Optional, Dict, List, Union
+from typing import Optional, Dict, List, Tuple, Union
 from pathlib import Path
 
-import requests
-from yt_dlp import YoutubeDL
 from PyQt5 import QtWidgets, QtCore, QtGui
 from PyQt5.QtGui import QIcon, QFontDatabase, QFont
 from PyQt5.QtWidgets import QMessageBox, QApplication
 
+from engine import (
+    AUDIO_QUALITIES, DEFAULT_MAX_WORKERS, JOB_HISTORY_LIMIT, PRIORITY_NAMES, PRIORITY_NORMAL,
+    SUPPORTED_AUDIO_FORMATS, SUPPORTED_VIDEO_FORMATS, VIDEO_QUALITIES,
+    PROGRESS_FPS, BandwidthManager, DownloadScheduler, DownloadWorker, JobProgress, JobStatus,
+    MetadataPrefetcher, ProgressAggregator, TurboTuner, format_bytes, format_eta,
+    offered_qualities, prewarm, stream_copy_formats
+)
+from metrics import METRICS_PATH, MetricsExporter
+from storage import APP_DATA_FOLDER, InfoCache, JobHistory, JobJournal, LibraryIndex
+
+IMPORTS_DONE = time.perf_counter()
+
 # Constants
 APP_VERSION = "1.0.0"
-VERSION_URL = "https://raw.githubusercontent.com/hi-bernardo/HB-Downloader/main/src/latest_version.txt"
+VERSION_URL = os.environ.get(
+    "HB_VERSION_URL",
+    "https://raw.githubusercontent.com/hi-bernardo/HB-Downloader/main/src/latest_version.txt")
 DOWNLOAD_URL = "https://github.com/hi-bernardo/HB-Downloader/releases"
-DOWNLOADS_FOLDER = Path.home() / "Downloads"
-SUPPORTED_VIDEO_FORMATS = ["MP4", "MKV", "WEBM"]
-SUPPORTED_AUDIO_FORMATS = ["MP3", "FLAC", "ACC", "M4A", "OPUS", "OGG", "WAV"]
-VIDEO_QUALITIES = ["Melhor", "1440p", "1080p", "720p", "480p", "360p", "144p"]
-AUDIO_QUALITIES = ["128k", "192k", "256k", "320k"]
-
+UPDATE_CACHE_PATH = APP_DATA_FOLDER / "update_check.json"
+UPDATE_CHECK_INTERVAL = 24 * 3600
+STARTUP_PROFILE_PATH = APP_DATA_FOLDER / "startup_profile.json"
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUPS = 2
+NIGHT_WINDOW = (datetime.time(22, 0), datetime.time(7, 0))
+# Pause in typing before a URL's metadata is prefetched
+PREFETCH_DELAY_MS = 500
+STATUS_LABELS = {
+    JobStatus.QUEUED: "Na fila",
+    JobStatus.RUNNING: "Baixando",
+    JobStatus.POSTPROCESSING: "Processando",
+    JobStatus.DONE: "Concluído",
+    JobStatus.FAILED: "Erro",
+    JobStatus.CANCELLED: "Cancelado",
+    JobStatus.INTERRUPTED: "Interrompido",
+}
+
+
+class UpdateChecker(QtCore.QObject):
+    """Checks for updates in a background thread, caching the last answer on disk."""
+
+    update_available = QtCore.pyqtSignal(str)
+
+    def __init__(self, cache_path: Path = UPDATE_CACHE_PATH,
+                 interval: float = UPDATE_CHECK_INTERVAL):
+        super().__init__()
+        self.cache_path = cache_path
+        self.interval = interval
+        self.update_available.connect(self.show_update_popup)
 
-class UpdateChecker:
-    """Handles application update checks."""
+    def start(self) -> None:
+        """Run the check without blocking the caller."""
+        threading.Thread(target=self.check_for_updates, daemon=True,
+                         name="UpdateChecker").start()
 
-    @staticmethod
-    def check_for_updates() -> None:
-        """Check for updates and show popup if new version is available."""
+    def check_for_updates(self) -> None:
+        """Check for updates and signal if a new version is available."""
         try:
-            response = requests.get(VERSION_URL, timeout=5)
-            if response.status_code == 200:
-                latest_version = response.text.strip()
-                if latest_version != APP_VERSION:
-                    UpdateChecker.show_update_popup(latest_version)
+            latest_version = self._latest_version()
+            if latest_version and latest_version != APP_VERSION:
+                self.update_available.emit(latest_version)
         except Exception as e:
             logging.warning(f"Error checking for updates: {e}")
 
+    def _latest_version(self) -> Optional[str]:
+        """Return the latest version, hitting the network at most once per interval."""
+        cache = self._load_cache()
+        if time.time() - cache.get('checked_at', 0) < self.interval:
+            return cache.get('latest_version')
+
+        headers = {}
+        if cache.get('etag'):
+            headers['If-None-Match'] = cache['etag']
+        if cache.get('last_modified'):
+            headers['If-Modified-Since'] = cache['last_modified']
+
+        import requests
+        response = requests.get(VERSION_URL, headers=headers, timeout=5)
+        if response.status_code == 200:
+            cache.update({
+                'latest_version': response.content.decode('utf-8', 'replace').strip(),
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            })
+        elif response.status_code != 304:
+            return cache.get('latest_version')
+
+        cache['checked_at'] = time.time()
+        self._save_cache(cache)
+        return cache.get('latest_version')
+
+    def _load_cache(self) -> Dict:
+        """Read the cached check result, tolerating a missing or corrupt file."""
+        try:
+            return json.loads(self.cache_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self, cache: Dict) -> None:
+        """Persist the check result."""
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            self.cache_path.write_text(json.dumps(cache), encoding='utf-8')
+        except OSError as e:
+            logging.warning(f"Error saving update cache: {e}")
+
     @staticmethod
     def show_update_popup(latest_version: str) -> None:
         """Show update available popup."""
@@ -63,9 +150,10 @@ class ResourceManager:
 
 
 class Logger:
-    """Custom logger configuration."""
+    """Custom logger configuration, plus the always-on per-job metrics export."""
 
-    def __init__(self, path: str = "log.txt", enabled: bool = False):
+    def __init__(self, path: str = "log.txt", enabled: bool = False,
+                 metrics_path: Path = METRICS_PATH, prometheus_path: Optional[str] = None):
         """Initialize logger with file and console handlers."""
         self.logger = logging.getLogger("Downloader")
         self.logger.setLevel(logging.DEBUG)
@@ -73,6 +161,13 @@ class Logger:
         if self.logger.hasHandlers():
             self.logger.handlers.clear()
 
+        # Job metrics are one line per finished job, cheap enough to keep on
+        try:
+            self.metrics: Optional[MetricsExporter] = MetricsExporter(metrics_path, prometheus_path)
+        except OSError as e:
+            self.metrics = None
+            logging.warning(f"Job metrics unavailable: {e}")
+
         self.enabled = enabled
         if not self.enabled:
             self.logger.disabled = True
@@ -80,8 +175,9 @@ class Logger:
 
         formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
 
-        # File handler
-        fh = logging.FileHandler(path, mode='w', encoding='utf-8')
+        # File handler, appended to and rotated instead of truncated on launch
+        fh = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES,
+                                                  backupCount=LOG_BACKUPS, encoding='utf-8')
         fh.setFormatter(formatter)
         self.logger.addHandler(fh)
 
@@ -95,6 +191,50 @@ class Logger:
         return self.logger
 
 
+class StartupProfiler:
+    """Opt-in timing of startup phases, enabled with HB_STARTUP_TIMING=1."""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.phases: Dict[str, float] = {"imports": IMPORTS_DONE - STARTUP_T0}
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Accumulate the wall time spent inside the block under name."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def report(self) -> None:
+        """Report time to first window and, when enabled, the per-phase breakdown."""
+        elapsed = time.perf_counter() - STARTUP_T0
+        logging.getLogger("Downloader").info(f"Time to first window: {elapsed * 1000:.0f} ms")
+        if not self.enabled:
+            return
+
+        profile = {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()}
+        profile["first_window"] = round(elapsed * 1000, 1)
+        profile["frozen"] = hasattr(sys, '_MEIPASS')
+
+        # Windowed PyInstaller builds have no stderr, so always keep a file copy
+        if sys.stderr is not None:
+            for name, value in profile.items():
+                print(f"startup {name}: {value}", file=sys.stderr)
+        try:
+            STARTUP_PROFILE_PATH.parent.mkdir(parents=True, exist_ok=True)
+            STARTUP_PROFILE_PATH.write_text(json.dumps(profile, indent=2), encoding='utf-8')
+        except OSError as e:
+            logging.warning(f"Error saving startup profile: {e}")
+
+
+STARTUP_PROFILER = StartupProfiler(enabled=bool(os.environ.get("HB_STARTUP_TIMING")))
+
+
 class TextAnimator(QtCore.QObject):
     """Handles text animations for UI elements."""
 
@@ -106,7 +246,7 @@ class TextAnimator(QtCore.QObject):
 
         self.animation_patterns = {
             "starting": ["Iniciando", "Iniciando.", "Iniciando..", "Iniciando..."],
-            "downloading": "Baixando {percent}%",
+            "downloading": "Baixando {percent}%{detail}",
             "canceling": ["Cancelando", "Cancelando.", "Cancelando..", "Cancelando..."],
             "finishing": ["Finalizando", "Finalizando.", "Finalizando..", "Finalizando..."]
         }
@@ -114,13 +254,21 @@ class TextAnimator(QtCore.QObject):
         self.current_animation = ""
         self.frame_index = 0
         self.percent = 0
+        self.detail = ""
 
-    def start_animation(self, animation_type: str, percent: Optional[int] = None) -> None:
+    def start_animation(self, animation_type: str, percent: Optional[int] = None,
+                        detail: str = "") -> None:
         """Start animation with given type and optional percentage."""
-        self.current_animation = animation_type
-        self.frame_index = 0
         if percent is not None:
             self.percent = percent
+        self.detail = detail
+
+        # Repeated calls only refresh the values, restarting would starve the timer
+        if animation_type == self.current_animation and self.timer.isActive():
+            return
+
+        self.current_animation = animation_type
+        self.frame_index = 0
         self.timer.start(300)
 
     def _update_animation(self) -> None:
@@ -132,7 +280,7 @@ class TextAnimator(QtCore.QObject):
             self._update_widget_text(current_frame)
             self.frame_index += 1
         elif isinstance(animation, str) and "{percent}" in animation:
-            self._update_widget_text(animation.format(percent=self.percent))
+            self._update_widget_text(animation.format(percent=self.percent, detail=self.detail))
 
     def _update_widget_text(self, text: str) -> None:
         """Update widget text based on widget type."""
@@ -144,106 +292,31 @@ class TextAnimator(QtCore.QObject):
     def stop_animation(self, final_text: str = "") -> None:
         """Stop animation and optionally set final text."""
         self.timer.stop()
+        self.current_animation = ""
         if final_text:
             self._update_widget_text(final_text)
 
 
-class DownloadWorker(QtCore.QObject):
-    """Worker class for handling downloads in background thread."""
+class SchedulerBridge(QtCore.QObject):
+    """Marshals scheduler events from worker threads onto the GUI thread."""
 
-    progress = QtCore.pyqtSignal(int, str)
-    finished = QtCore.pyqtSignal(bool, str)
+    job_changed = QtCore.pyqtSignal(object)
 
-    def __init__(self, url: str, media_type: str, quality: str, fmt: str, no_audio: bool):
+    def __init__(self, scheduler: DownloadScheduler):
         super().__init__()
-        self.url = url
-        self.media_type = media_type
-        self.quality = quality
-        self.fmt = fmt.lower()
-        self.no_audio = no_audio
-        self.cancelled = False
-
-    def run(self) -> None:
-        """Main download execution method."""
-        try:
-            opts = self._get_download_options()
+        self.scheduler = scheduler
+        scheduler.listeners.append(self.job_changed.emit)
 
-            with YoutubeDL(opts) as ydl:
-                ydl.download([self.url])
 
-            if not self.cancelled:
-                self.finished.emit(True, "")
-        except Exception as e:
-            self.finished.emit(False, str(e))
-
-    def _get_download_options(self) -> Dict:
-        """Generate download options based on media type and settings."""
-        outtmpl = str(DOWNLOADS_FOLDER / '%(title)s-%(resolution)s.%(ext)s')
-        opts = {
-            'outtmpl': outtmpl,
-            'progress_hooks': [self._progress_hook],
-            'format': 'bestaudio/best',
-        }
+class PrefetchBridge(QtCore.QObject):
+    """Marshals prefetched metadata from the prefetch thread onto the GUI thread."""
 
-        if self.media_type == "Vídeo":
-            opts = self._configure_video_options(opts)
-        else:
-            opts = self._configure_audio_options(opts)
-
-        return opts
-
-    def _configure_video_options(self, opts: Dict) -> Dict:
-        """Configure options for video downloads."""
-        if self.quality.lower() == 'melhor':
-            opts['format'] = 'bestvideo+bestaudio/best'
-        elif self.quality.endswith('p'):
-            height = self.quality[:-1]
-            opts['format'] = f'bestvideo[height<={height}]+bestaudio/best'
-        elif self.quality == '2k':
-            opts['format'] = 'bestvideo[height<=1440]+bestaudio/best'
-
-        if self.no_audio:
-            opts['format'] = opts['format'].split('+')[0]
-
-        opts['merge_output_format'] = self.fmt
-        return opts
-
-    def _configure_audio_options(self, opts: Dict) -> Dict:
-        """Configure options for audio downloads."""
-        opts['format'] = 'bestaudio'
-        opts['postprocessors'] = [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': self.fmt,
-            'preferredquality': self.quality.replace('k', '')
-        }]
-        return opts
-
-    def cancel(self) -> None:
-        """Cancel current download and clean up partial files."""
-        self.cancelled = True
-        self._clean_partial_downloads()
-        self.finished.emit(False, "Cancelado pelo usuário")
-
-    def _clean_partial_downloads(self) -> None:
-        """Clean up partially downloaded files."""
-        try:
-            for file in DOWNLOADS_FOLDER.iterdir():
-                if any(self.url.split("/")[-1] in file.name for ext in ['.mp4', '.webm', '.mkv', '.mp3']):
-                    file.unlink()
-        except Exception as e:
-            logging.warning(f"Error cleaning partial downloads: {e}")
-
-    def _progress_hook(self, d: Dict) -> None:
-        """Handle download progress updates."""
-        if self.cancelled:
-            raise Exception("Download cancelado")
+    info_ready = QtCore.pyqtSignal(str, object)
 
-        if d.get('status') == 'downloading':
-            percent_str = d.get('_percent_str', '0.0%')
-            percent = float(percent_str.strip('%'))
-            self.progress.emit(int(percent), percent_str)
-        elif d.get('status') == 'finished':
-            self.progress.emit(100, 'Finalizando...')
+    def __init__(self, prefetcher: MetadataPrefetcher):
+        super().__init__()
+        self.prefetcher = prefetcher
+        prefetcher.callbacks.append(self.info_ready.emit)
 
 
 class DownloaderUI(QtWidgets.QWidget):
@@ -252,22 +325,86 @@ class DownloaderUI(QtWidgets.QWidget):
     def __init__(self):
         super().__init__()
         self._setup_logger()
+        self._setup_scheduler()
         self._init_ui()
         self._setup_connections()
+        self._resume_jobs()
 
     def _setup_logger(self) -> None:
         """Initialize and configure logger."""
-        self.logger = Logger().get_logger()
+        logger = Logger(prometheus_path=os.environ.get("HB_PROMETHEUS_TEXTFILE"))
+        self.logger = logger.get_logger()
+        self.metrics = logger.metrics
+
+    def _setup_scheduler(self) -> None:
+        """Create the download queue and its bridge to the UI."""
+        self.bandwidth = BandwidthManager()
+        self.turbo = TurboTuner()
+        processes = None
+        if os.environ.get("HB_WORKER_PROCESSES"):
+            from processes import ProcessPool
+
+            processes = ProcessPool()
+        # Kept open for days: finished jobs beyond the history limit go to disk
+        self.history = JobHistory()
+        history_limit = int(os.environ.get("HB_JOB_HISTORY", JOB_HISTORY_LIMIT))
+        self.scheduler = DownloadScheduler(bandwidth=self.bandwidth, processes=processes,
+                                           history_limit=history_limit, history=self.history)
+        self.scheduler_bridge = SchedulerBridge(self.scheduler)
+        if self.metrics is not None:
+            self.scheduler.listeners.append(self.metrics.observe)
+        try:
+            self.info_cache = InfoCache()
+        except Exception as e:
+            self.info_cache = None
+            self.logger.warning(f"Info cache unavailable: {e}")
+        try:
+            self.journal = JobJournal()
+        except Exception as e:
+            self.journal = None
+            self.logger.warning(f"Job journal unavailable: {e}")
+        try:
+            self.library = LibraryIndex()
+        except Exception as e:
+            self.library = None
+            self.logger.warning(f"Library index unavailable: {e}")
+        self.queue_items: Dict[int, QtWidgets.QTreeWidgetItem] = {}
+
+        # Metadata is extracted while the user is still choosing options
+        self.prefetcher = MetadataPrefetcher(self.info_cache) if self.info_cache else None
+        self.prefetch_bridge = PrefetchBridge(self.prefetcher) if self.prefetcher else None
+        self.prefetch_timer = QtCore.QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(PREFETCH_DELAY_MS)
+        self.offered_formats: Optional[List[Dict]] = None
+
+        # Scripts can drive this same engine over HTTP, see daemon.py
+        self.api = None
+        api_port = os.environ.get("HB_API_PORT")
+        if api_port:
+            from daemon import ApiServer
+
+            self.api = ApiServer(self.scheduler, self.turbo, os.environ.get("HB_API_TOKEN"),
+                                 info_cache=self.info_cache, journal=self.journal,
+                                 library=self.library, quiet=True)
+            self.api.start_in_thread(port=int(api_port))
+
+        # Progress is pulled at a fixed frame rate instead of pushed per yt-dlp callback
+        self.progress_aggregator = ProgressAggregator()
+        self.progress_timer = QtCore.QTimer(self)
+        self.progress_timer.setInterval(1000 // PROGRESS_FPS)
 
     def _init_ui(self) -> None:
         """Initialize UI components."""
         self.setWindowIcon(QtGui.QIcon(ResourceManager.get_path('src/icon.ico')))
         self.setWindowTitle("HB Downloader")
-        self.setFixedSize(550, 350)
-        self.setStyleSheet(self._get_stylesheet())
+        self.setFixedSize(550, 600)
+        with STARTUP_PROFILER.phase("stylesheet"):
+            self.setStyleSheet(self._get_stylesheet())
 
-        self._create_widgets()
-        self._setup_layout()
+        with STARTUP_PROFILER.phase("widgets"):
+            self._create_widgets()
+            self._setup_layout()
 
     def _get_stylesheet(self) -> str:
         """Return application stylesheet."""
@@ -347,6 +484,17 @@ class DownloaderUI(QtWidgets.QWidget):
             border-radius: 4px;
             margin-left: -20px;
         }
+        QTreeWidget, QSpinBox {
+            background-color: rgba(255, 255, 255, 0.05);
+            border: 0.5px solid #9c9c9c;
+            border-radius: 10px;
+            padding: 4px;
+        }
+        QHeaderView::section {
+            background-color: #2b2b2b;
+            border: none;
+            font-weight: bold;
+        }
         """
 
     def _create_widgets(self) -> None:
@@ -371,6 +519,11 @@ class DownloaderUI(QtWidgets.QWidget):
         self.checkbox_no_audio.setFixedWidth(105)
         self.checkbox_no_audio.setVisible(False)
 
+        self.checkbox_turbo = QtWidgets.QCheckBox("Turbo")
+        self.checkbox_turbo.setToolTip("Várias conexões por download, ajustadas para cada site")
+        self.checkbox_turbo.setCursor(QtGui.QCursor(QtCore.Qt.PointingHandCursor))
+        self.checkbox_turbo.setFixedWidth(70)
+
         # Quality and format
         self.label_quality = self._create_label("QUALIDADE")
         self.label_format = self._create_label("FORMATO")
@@ -383,6 +536,15 @@ class DownloaderUI(QtWidgets.QWidget):
         self.format_combo.setCursor(QtGui.QCursor(QtCore.Qt.PointingHandCursor))
         self.format_combo.setVisible(False)
 
+        # Extra audio targets encoded from the same download
+        self.audio_targets: List[Tuple[str, str]] = []
+        self.btn_add_target = QtWidgets.QPushButton("Adicionar formato")
+        self.btn_add_target.setCursor(QtGui.QCursor(QtCore.Qt.PointingHandCursor))
+        self.btn_add_target.setVisible(False)
+        self.label_targets = QtWidgets.QLabel()
+        self.label_targets.setStyleSheet("color: gray;")
+        self.label_targets.setVisible(False)
+
         # Progress and actions
         self.progress = QtWidgets.QProgressBar()
         self.progress.setVisible(False)
@@ -393,6 +555,46 @@ class DownloaderUI(QtWidgets.QWidget):
         self.btn_download.setCursor(QtGui.QCursor(QtCore.Qt.PointingHandCursor))
         self.btn_download.setVisible(False)
 
+        self.priority_combo = QtWidgets.QComboBox()
+        self.priority_combo.setCursor(QtGui.QCursor(QtCore.Qt.PointingHandCursor))
+        for priority, name in PRIORITY_NAMES.items():
+            self.priority_combo.addItem(f"Prioridade {name}", priority)
+        self.priority_combo.setCurrentIndex(self.priority_combo.findData(PRIORITY_NORMAL))
+
+        self.workers_spin = QtWidgets.QSpinBox()
+        self.workers_spin.setRange(1, 16)
+        self.workers_spin.setValue(DEFAULT_MAX_WORKERS)
+        self.workers_spin.setPrefix("Simultâneos: ")
+
+        self.limit_spin = QtWidgets.QDoubleSpinBox()
+        self.limit_spin.setRange(0, 1000)
+        self.limit_spin.setDecimals(1)
+        self.limit_spin.setSingleStep(0.5)
+        self.limit_spin.setPrefix("Limite: ")
+        self.limit_spin.setSuffix(" MB/s")
+        self.limit_spin.setSpecialValueText("Sem limite")
+
+        self.checkbox_night = QtWidgets.QCheckBox("Livre à noite")
+        self.checkbox_night.setToolTip("Sem limite de banda entre 22h e 7h")
+        self.checkbox_night.setCursor(QtGui.QCursor(QtCore.Qt.PointingHandCursor))
+
+        # Download queue
+        self.queue_view = QtWidgets.QTreeWidget()
+        self.queue_view.setHeaderLabels(["#", "URL", "Prioridade", "Status", "%", "Vel.", "ETA"])
+        self.queue_view.setRootIsDecorated(False)
+        self.queue_view.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        self.queue_view.setColumnWidth(0, 30)
+        self.queue_view.setColumnWidth(1, 150)
+        self.queue_view.setColumnWidth(2, 70)
+        self.queue_view.setColumnWidth(3, 75)
+        self.queue_view.setColumnWidth(4, 35)
+        self.queue_view.setColumnWidth(5, 75)
+
+        self.btn_cancel = QtWidgets.QPushButton("Cancelar")
+        self.btn_cancel.setCursor(QtGui.QCursor(QtCore.Qt.PointingHandCursor))
+        self.btn_clear = QtWidgets.QPushButton("Limpar concluídos")
+        self.btn_clear.setCursor(QtGui.QCursor(QtCore.Qt.PointingHandCursor))
+
         self.signature = QtWidgets.QLabel("by oBrazoo")
         self.signature.setAlignment(QtCore.Qt.AlignLeft | QtCore.Qt.AlignBottom)
         self.signature.setStyleSheet("color: gray; font-size: 10px;")
@@ -418,6 +620,7 @@ class DownloaderUI(QtWidgets.QWidget):
         type_layout = QtWidgets.QHBoxLayout()
         type_layout.addWidget(self.media_type)
         type_layout.addWidget(self.checkbox_no_audio)
+        type_layout.addWidget(self.checkbox_turbo)
 
         # Quality/format labels
         label_layout = QtWidgets.QHBoxLayout()
@@ -429,30 +632,86 @@ class DownloaderUI(QtWidgets.QWidget):
         combo_layout.addWidget(self.quality_combo)
         combo_layout.addWidget(self.format_combo)
 
+        targets_layout = QtWidgets.QHBoxLayout()
+        targets_layout.addWidget(self.label_targets)
+        targets_layout.addWidget(self.btn_add_target)
+
+        # Queue settings and actions
+        queue_settings_layout = QtWidgets.QHBoxLayout()
+        queue_settings_layout.addWidget(self.priority_combo)
+        queue_settings_layout.addWidget(self.workers_spin)
+        queue_settings_layout.addWidget(self.limit_spin)
+        queue_settings_layout.addWidget(self.checkbox_night)
+
+        queue_actions_layout = QtWidgets.QHBoxLayout()
+        queue_actions_layout.addWidget(self.btn_cancel)
+        queue_actions_layout.addWidget(self.btn_clear)
+
         # Assemble main layout
         layout.addLayout(url_layout)
         layout.addLayout(type_layout)
         layout.addLayout(label_layout)
         layout.addLayout(combo_layout)
+        layout.addLayout(targets_layout)
         layout.addSpacing(10)
+        layout.addLayout(queue_settings_layout)
         layout.addWidget(self.progress)
         layout.addSpacing(10)
         layout.addWidget(self.btn_download)
+        layout.addWidget(self.queue_view)
+        layout.addLayout(queue_actions_layout)
         layout.addStretch()
         layout.addWidget(self.signature)
 
     def _setup_connections(self) -> None:
         """Setup signal-slot connections."""
         self.url_input.textChanged.connect(self._on_url_change)
+        self.url_input.textChanged.connect(self._schedule_prefetch)
+        self.prefetch_timer.timeout.connect(self._prefetch)
+        if self.prefetch_bridge is not None:
+            self.prefetch_bridge.info_ready.connect(self._on_info_ready)
         self.btn_paste.clicked.connect(self._paste_url)
         self.media_type.currentIndexChanged.connect(self._update_options)
-        self.btn_download.clicked.connect(self._toggle_download)
+        self.btn_add_target.clicked.connect(self._add_audio_target)
+        self.btn_download.clicked.connect(self._start_download)
+        self.btn_cancel.clicked.connect(self._cancel_download)
+        self.btn_clear.clicked.connect(self._clear_finished)
+        self.workers_spin.valueChanged.connect(self.scheduler.set_max_workers)
+        self.limit_spin.valueChanged.connect(self._on_limit_change)
+        self.checkbox_night.toggled.connect(self._on_limit_change)
+        self.scheduler_bridge.job_changed.connect(self._on_job_changed)
+        self.progress_timer.timeout.connect(self._refresh_progress)
 
     def _on_url_change(self, text: str) -> None:
         """Handle URL input changes."""
         valid = text.strip().startswith("http") and self.media_type.currentIndex() != 0
         self.btn_download.setVisible(valid)
-        self.logger.info(f"URL changed: {text}")
+
+    def _schedule_prefetch(self, text: str) -> None:
+        """Restart the prefetch countdown, dropping what was fetched for the old URL."""
+        self.prefetch_timer.stop()
+        if self.offered_formats is not None:
+            self.offered_formats = None
+            self._fill_combos()
+        if self.prefetcher is None:
+            return
+        self.prefetcher.cancel()
+        if text.strip().startswith("http"):
+            self.prefetch_timer.start()
+
+    def _prefetch(self) -> None:
+        """Start extracting the URL once typing has paused."""
+        url = self.url_input.text().strip()
+        if url.startswith("http"):
+            self.prefetcher.prefetch(url)
+
+    def _on_info_ready(self, url: str, info: Optional[Dict]) -> None:
+        """Offer the qualities the prefetched media actually has."""
+        if url != self.url_input.text().strip() or not info or not info.get('formats'):
+            return
+        self.offered_formats = info['formats']
+        self._fill_combos()
+        self.logger.info(f"Prefetched {url}: {len(self.offered_formats)} formats")
 
     def _paste_url(self) -> None:
         """Paste URL from clipboard."""
@@ -462,23 +721,19 @@ class DownloaderUI(QtWidgets.QWidget):
 
     def _update_options(self) -> None:
         """Update quality and format options based on media type."""
-        self.quality_combo.clear()
-        self.format_combo.clear()
-
         # Hide all optional elements initially
-        for widget in [self.quality_combo, self.format_combo,
-                       self.checkbox_no_audio, self.label_quality, self.label_format]:
+        for widget in [self.quality_combo, self.format_combo, self.checkbox_no_audio,
+                       self.label_quality, self.label_format, self.btn_add_target]:
             widget.setVisible(False)
+        self._set_audio_targets([])
+        self._fill_combos()
 
         media_type = self.media_type.currentText()
 
         if media_type == "Vídeo":
-            self.quality_combo.addItems(VIDEO_QUALITIES)
-            self.format_combo.addItems(SUPPORTED_VIDEO_FORMATS)
             self.checkbox_no_audio.setVisible(True)
         elif media_type == "Áudio":
-            self.quality_combo.addItems(AUDIO_QUALITIES)
-            self.format_combo.addItems(SUPPORTED_AUDIO_FORMATS)
+            self.btn_add_target.setVisible(True)
 
         # Show relevant elements
         for widget in [self.quality_combo, self.format_combo,
@@ -487,87 +742,255 @@ class DownloaderUI(QtWidgets.QWidget):
 
         self._on_url_change(self.url_input.text())
 
-    def _toggle_download(self) -> None:
-        """Toggle between start/cancel download."""
-        if self.btn_download.text() == "Iniciar Download":
-            self._start_download()
+    def _fill_combos(self) -> None:
+        """Fill quality and format choices, from the prefetched formats when known.
+
+        Formats reachable without re-encoding are marked with a tooltip.
+        """
+        media_type = self.media_type.currentText()
+        quality, fmt = self.quality_combo.currentText(), self.format_combo.currentText()
+        self.quality_combo.clear()
+        self.format_combo.clear()
+
+        formats = self.offered_formats
+        if media_type == "Vídeo":
+            qualities = offered_qualities(formats) if formats else VIDEO_QUALITIES
+            self.quality_combo.addItems(qualities)
+            self.format_combo.addItems(SUPPORTED_VIDEO_FORMATS)
+        elif media_type == "Áudio":
+            self.quality_combo.addItems(AUDIO_QUALITIES)
+            self.format_combo.addItems(SUPPORTED_AUDIO_FORMATS)
         else:
-            self._cancel_download()
+            return
+
+        if formats:
+            copyable = stream_copy_formats(formats, media_type)
+            for index in range(self.format_combo.count()):
+                if self.format_combo.itemText(index) in copyable:
+                    self.format_combo.setItemData(index, "Sem recodificar", QtCore.Qt.ToolTipRole)
+        # Keep the user's choice when it is still on offer
+        for combo, text in ((self.quality_combo, quality), (self.format_combo, fmt)):
+            if combo.findText(text) >= 0:
+                combo.setCurrentText(text)
+
+    def _add_audio_target(self) -> None:
+        """Queue the selected audio format and quality as an extra output."""
+        target = (self.format_combo.currentText(), self.quality_combo.currentText())
+        if target not in self.audio_targets:
+            self._set_audio_targets(self.audio_targets + [target])
+
+    def _set_audio_targets(self, targets: List[Tuple[str, str]]) -> None:
+        """Replace the extra audio targets and refresh their label."""
+        self.audio_targets = targets
+        self.label_targets.setText(
+            "Também: " + ", ".join(f"{fmt} {quality}" for fmt, quality in targets)
+        )
+        self.label_targets.setVisible(bool(targets))
+
+    def _on_limit_change(self) -> None:
+        """Apply the bandwidth budget and the overnight window to running jobs."""
+        megabytes = self.limit_spin.value()
+        self.bandwidth.set_limit(megabytes * 1024 * 1024 if megabytes else None)
+        self.bandwidth.set_schedule([(*NIGHT_WINDOW, None)] if self.checkbox_night.isChecked() else [])
+        self.logger.info(f"Bandwidth limit: {megabytes} MB/s, night: {self.checkbox_night.isChecked()}")
 
     def _start_download(self) -> None:
-        """Start download process."""
+        """Add a download job to the queue."""
         url = self.url_input.text().strip()
         media_type = self.media_type.currentText()
         quality = self.quality_combo.currentText()
         fmt = self.format_combo.currentText()
         no_audio = self.checkbox_no_audio.isChecked()
+        priority = self.priority_combo.currentData()
+
+        targets = self.audio_targets if media_type == "Áudio" else []
+        turbo = self.turbo if self.checkbox_turbo.isChecked() else None
+
+        job = DownloadWorker(url, media_type, quality, fmt, no_audio, priority,
+                             info_cache=self.info_cache, journal=self.journal, targets=targets,
+                             library=self.library, turbo=turbo, prefetcher=self.prefetcher,
+                             staging_dir=os.environ.get("HB_STAGING_DIR"))
+        if self.prefetcher is not None:
+            self.prefetcher.keep(url)
+        self._enqueue(job)
+        self._set_audio_targets([])
 
+        self.logger.info(
+                f"Download queued - Job: {job.job_id}, URL: {url}, Type: {media_type}, "
+                f"Quality: {quality}, Format: {fmt}, No Audio: {no_audio}, Priority: {priority}, "
+                f"Targets: {job.targets}"
+        )
+
+    def _resume_jobs(self) -> None:
+        """Re-queue jobs left unfinished by a previous session or crash."""
+        if self.journal is None:
+            return
+
+        for row in self.journal.unfinished():
+            job = DownloadWorker.from_journal(row, self.journal, info_cache=self.info_cache,
+                                              library=self.library)
+            self._enqueue(job)
+            self.logger.info(f"Download resumed - Job: {job.job_id}, URL: {job.url}")
+
+    def _enqueue(self, job: DownloadWorker) -> None:
+        """Add a queue row for the job and hand it to the scheduler."""
         # Setup progress UI
+        if self.scheduler.is_idle():
+            self._show_progress()
+
+        self._add_queue_item(job)
+        self.scheduler.submit(job)
+
+    def _add_queue_item(self, job: DownloadWorker) -> QtWidgets.QTreeWidgetItem:
+        """Create the queue row of a job."""
+        item = QtWidgets.QTreeWidgetItem([
+            str(job.job_id), job.url, PRIORITY_NAMES[job.priority], STATUS_LABELS[job.status],
+            str(job.percent), "", ""
+        ])
+        item.setData(0, QtCore.Qt.UserRole, job.job_id)
+        self.queue_view.addTopLevelItem(item)
+        self.queue_items[job.job_id] = item
+        return item
+
+    def _show_progress(self) -> None:
+        """Reset the progress bar for a new batch of jobs."""
         self.progress.setVisible(True)
         self.progress.setValue(0)
         self.progress_animator.start_animation("starting")
 
-        # Create and start worker thread
-        self.thread = QtCore.QThread()
-        self.worker = DownloadWorker(url, media_type, quality, fmt, no_audio)
-        self.worker.moveToThread(self.thread)
-
-        # Connect signals
-        self.thread.started.connect(self.worker.run)
-        self.worker.progress.connect(self._update_progress)
-        self.worker.finished.connect(self._finish_download)
-        self.worker.finished.connect(self.thread.quit)
-        self.worker.finished.connect(self.worker.deleteLater)
-        self.thread.finished.connect(self.thread.deleteLater)
+    def _cancel_download(self) -> None:
+        """Cancel the selected jobs, or every pending job if none is selected."""
+        selected = self.queue_view.selectedItems()
+        if selected:
+            job_ids = [item.data(0, QtCore.Qt.UserRole) for item in selected]
+        else:
+            job_ids = [job.job_id for job in self.scheduler.jobs()]
+
+        for job_id in job_ids:
+            self.scheduler.cancel(job_id)
+
+        if self.progress.isVisible():
+            self.progress_animator.start_animation("canceling")
+
+    def _clear_finished(self) -> None:
+        """Remove finished jobs from the queue view."""
+        self.scheduler.clear_finished()
+        self._drop_forgotten_rows()
+
+    def _drop_forgotten_rows(self) -> None:
+        """Remove the rows of jobs the scheduler no longer keeps."""
+        for job_id, item in list(self.queue_items.items()):
+            if self.scheduler.get(job_id) is None:
+                self.queue_view.takeTopLevelItem(self.queue_view.indexOfTopLevelItem(item))
+                del self.queue_items[job_id]
+
+    def _on_job_changed(self, job: DownloadWorker) -> None:
+        """Refresh the queue row when a job changes status."""
+        item = self.queue_items.get(job.job_id)
+        if item is None and self.scheduler.get(job.job_id) is not None:
+            # Submitted through the HTTP API or queued for a playlist
+            if not self.progress.isVisible():
+                self._show_progress()
+            item = self._add_queue_item(job)
+        if item is not None:
+            item.setText(3, STATUS_LABELS[job.status])
+            if job.status in JobStatus.FINISHED:
+                item.setText(4, str(job.percent))
+                item.setText(5, "")
+                item.setText(6, "")
+
+        if job.status in JobStatus.FINISHED:
+            if len(self.queue_items) > self.scheduler.history_limit:
+                # The scheduler moved the oldest finished jobs to the history log
+                self._drop_forgotten_rows()
+            self._finish_download(job)
+        elif not self.progress_timer.isActive():
+            self.progress_timer.start()
+
+    def _refresh_progress(self) -> None:
+        """Sample job counters and repaint progress; runs at PROGRESS_FPS."""
+        jobs = [job for job in self.scheduler.jobs() if job.status not in JobStatus.FINISHED]
+        if not jobs:
+            self.progress_timer.stop()
+            return
 
-        self.thread.start()
-        self.btn_download.setText("Cancelar")
-        self.btn_download.setEnabled(True)
+        progress, overall = self.progress_aggregator.sample(jobs)
+        for job in jobs:
+            item = self.queue_items.get(job.job_id)
+            if item is None or job.status != JobStatus.RUNNING:
+                continue
+            job_progress = progress[job.job_id]
+            self._set_item_text(item, 4, str(job_progress.percent))
+            self._set_item_text(item, 5, f"{format_bytes(job_progress.speed)}/s")
+            self._set_item_text(item, 6, format_eta(job_progress.eta))
 
-        self.logger.info(
-                f"Download started - URL: {url}, Type: {media_type}, "
-                f"Quality: {quality}, Format: {fmt}, No Audio: {no_audio}"
-        )
+        self._update_progress(overall, any(job.finishing for job in jobs))
 
-    def _cancel_download(self) -> None:
-        """Cancel current download."""
-        if hasattr(self, 'worker'):
-            self.worker.cancel()
-
-        self.progress_animator.start_animation("canceling")
-        QtCore.QTimer.singleShot(
-                3000,
-                lambda: self.progress_animator.stop_animation("❌ Download cancelado")
-        )
+    @staticmethod
+    def _set_item_text(item: QtWidgets.QTreeWidgetItem, column: int, text: str) -> None:
+        """Set cell text only when it changed, avoiding needless repaints."""
+        if item.text(column) != text:
+            item.setText(column, text)
 
-    def _update_progress(self, percent: int, text: str) -> None:
-        """Update download progress display."""
-        self.progress.setValue(percent)
+    def _update_progress(self, overall: JobProgress, finishing: bool) -> None:
+        """Show the combined progress of the jobs still in the queue."""
+        self.progress.setValue(overall.percent)
 
-        if percent < 100:
-            self.progress_animator.start_animation("downloading", percent)
-        elif percent == 100:
+        if finishing and overall.percent >= 100:
             self.progress_animator.start_animation("finishing")
-            QtCore.QTimer.singleShot(
-                    3600,
-                    lambda: self.progress_animator.stop_animation("✅ Download concluído!")
-            )
-
-    def _finish_download(self, success: bool, msg: str) -> None:
-        """Handle download completion."""
-        if success:
+        elif overall.speed:
+            detail = f" · {format_bytes(overall.speed)}/s · {format_eta(overall.eta)}"
+            self.progress_animator.start_animation("downloading", overall.percent, detail)
+
+    def _finish_download(self, job: DownloadWorker) -> None:
+        """Handle completion of a single job."""
+        if job.status == JobStatus.DONE:
+            self.logger.info(f"Download completed successfully - Job: {job.job_id} {job.message}")
+            if job.selection is not None:
+                self.logger.info(f"Format selection - Job: {job.job_id}: {job.selection.summary}, "
+                                 f"~{job.selection.cpu_saved:.1f}s CPU saved")
+        elif job.status == JobStatus.CANCELLED:
+            self.logger.warning(f"Download canceled by user - Job: {job.job_id}")
+        else:
+            self.logger.error(f"Download error - Job: {job.job_id}: {job.message}")
+
+        if not self.scheduler.is_idle():
+            return
+
+        self.progress_animator.stop_animation()
+        if job.status == JobStatus.DONE:
+            self.progress.setValue(100)
             self.progress.setFormat("✅ Download concluído!")
-            self.logger.info("Download completed successfully.")
-        elif "Cancelado" in msg:
+        elif job.status == JobStatus.CANCELLED:
             self.progress.setFormat("❌ Download cancelado")
-            self.logger.warning("Download canceled by user")
         else:
-            self.progress.setFormat(f"⚠️ {msg[:30]}...")
-            self.logger.error(f"Download error: {msg}")
+            self.progress.setFormat(f"⚠️ {job.message[:30]}...")
 
-        QtCore.QTimer.singleShot(3000, lambda: self.progress.setVisible(False))
+        QtCore.QTimer.singleShot(3000, self._hide_progress_if_idle)
         self.progress.style().polish(self.progress)
-        self.btn_download.setText("Iniciar Download")
+
+    def _hide_progress_if_idle(self) -> None:
+        """Hide the progress bar unless new jobs were queued meanwhile."""
+        if self.scheduler.is_idle():
+            self.progress.setVisible(False)
+
+    def closeEvent(self, event: QtGui.QCloseEvent) -> None:
+        """Stop outstanding downloads, keeping them journaled for the next start when possible."""
+        self.prefetch_timer.stop()
+        if self.prefetcher is not None:
+            self.prefetcher.cancel()
+        # Partial files are only worth keeping if the journal can resume them
+        if self.journal is not None:
+            self.scheduler.interrupt_all()
+        self.scheduler.shutdown(cancel=self.journal is None)
+        self.scheduler.wait(timeout=3)
+        if self.api is not None:
+            self.api.stop()
+        self.bandwidth.close()
+        self.history.close()
+        if self.metrics is not None:
+            self.metrics.close()
+        super().closeEvent(event)
 
 
 def main():
@@ -576,21 +999,36 @@ def main():
         import ctypes
         ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID('Brazoo.HB_Downloader.1.0')
 
-    app = QtWidgets.QApplication(sys.argv)
+    with STARTUP_PROFILER.phase("qapplication"):
+        app = QtWidgets.QApplication(sys.argv)
+
+    # Setup fonts; the italic face is not needed for the first paint
+    with STARTUP_PROFILER.phase("fonts"):
+        QFontDatabase.addApplicationFont(ResourceManager.get_path("src/font/Inter-Variable.ttf"))
+        app.setFont(QFont("Inter Variable", 11))
 
-    # Setup fonts
-    QFontDatabase.addApplicationFont(ResourceManager.get_path("src/font/Inter-Variable.ttf"))
-    QFontDatabase.addApplicationFont(ResourceManager.get_path("src/font/Inter-Italic.ttf"))
-    app.setFont(QFont("Inter Variable", 11))
+    with STARTUP_PROFILER.phase("window"):
+        window = DownloaderUI()
+        window.show()
+    QtCore.QTimer.singleShot(0, STARTUP_PROFILER.report)
+    if os.environ.get("HB_STARTUP_EXIT"):
+        # Used by benchmark.py to time startup without user interaction; the value is
+        # how long, in ms, the app stays up after its first window
+        QtCore.QTimer.singleShot(int(os.environ["HB_STARTUP_EXIT"]), app.quit)
 
-    # Check for updates and show main window
-    UpdateChecker.check_for_updates()
+    # Deferred work once the window is up
+    QtCore.QTimer.singleShot(0, lambda: QFontDatabase.addApplicationFont(
+            ResourceManager.get_path("src/font/Inter-Italic.ttf")))
+    # Started from the event loop so its imports do not hold the GIL during the first paint
+    QtCore.QTimer.singleShot(0, threading.Thread(target=prewarm, daemon=True, name="Prewarm").start)
 
-    window = DownloaderUI()
-    window.show()
+    update_checker = UpdateChecker()
+    update_checker.start()
 
     sys.exit(app.exec_())
 
 
 if __name__ == '__main__':
+    # Worker processes of frozen builds start through this executable
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
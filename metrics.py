@@ -0,0 +1,103 @@
+"""Structured per-job metrics: rotating JSON lines and an optional Prometheus textfile."""
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from engine import DownloadWorker, JobStatus
+from storage import APP_DATA_FOLDER
+
+# Constants
+METRICS_PATH = APP_DATA_FOLDER / "metrics" / "jobs.jsonl"
+METRICS_MAX_BYTES = 5 * 1024 * 1024
+METRICS_BACKUPS = 3
+
+
+class MetricsExporter:
+    """Writes one JSON line per finished job and keeps Prometheus counters.
+
+    observe() works as a DownloadScheduler listener or, called with the job,
+    from a finished callback. The Prometheus file is meant for node_exporter's
+    textfile collector and is replaced atomically.
+    """
+
+    def __init__(self, path: Path = METRICS_PATH, prometheus_path: Optional[Path] = None,
+                 max_bytes: int = METRICS_MAX_BYTES, backups: int = METRICS_BACKUPS):
+        self.prometheus_path = Path(prometheus_path) if prometheus_path else None
+        self.lock = threading.Lock()
+
+        self.jobs_total: Dict[str, int] = {}
+        self.bytes_total = 0
+        self.retries_total = 0
+        self.span_seconds: Dict[str, float] = {}
+        self.span_count: Dict[str, int] = {}
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8"
+        )
+        self.handler.setFormatter(logging.Formatter("%(message)s"))
+        self.logger = logging.getLogger(f"Downloader.metrics.{id(self)}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(self.handler)
+
+    def observe(self, job: DownloadWorker) -> None:
+        """Export a job once, when it has finished."""
+        if job.status not in JobStatus.FINISHED:
+            return
+        with self.lock:
+            if job.metrics.exported:
+                return
+            job.metrics.exported = True
+
+            record = job.metrics_record()
+            record["time"] = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+            self.logger.info(json.dumps(record, ensure_ascii=False))
+
+            self.jobs_total[job.status] = self.jobs_total.get(job.status, 0) + 1
+            self.bytes_total += job.downloaded_bytes
+            self.retries_total += job.metrics.retries
+            for name, seconds in job.metrics.durations.items():
+                self.span_seconds[name] = self.span_seconds.get(name, 0.0) + seconds
+                self.span_count[name] = self.span_count.get(name, 0) + 1
+
+            if self.prometheus_path is not None:
+                self._write_prometheus_locked()
+
+    def close(self) -> None:
+        """Flush and close the JSON-lines file."""
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+
+    def _write_prometheus_locked(self) -> None:
+        """Replace the textfile with the current counters."""
+        lines = [
+            "# HELP hb_jobs_total Finished download jobs by status.",
+            "# TYPE hb_jobs_total counter",
+            *(f'hb_jobs_total{{status="{status}"}} {count}'
+              for status, count in sorted(self.jobs_total.items())),
+            "# HELP hb_downloaded_bytes_total Bytes transferred by finished jobs.",
+            "# TYPE hb_downloaded_bytes_total counter",
+            f"hb_downloaded_bytes_total {self.bytes_total}",
+            "# HELP hb_retries_total HTTP, fragment and extractor retries.",
+            "# TYPE hb_retries_total counter",
+            f"hb_retries_total {self.retries_total}",
+            "# HELP hb_span_seconds Time finished jobs spent in each stage.",
+            "# TYPE hb_span_seconds summary",
+        ]
+        for name in sorted(self.span_seconds):
+            lines.append(f'hb_span_seconds_sum{{span="{name}"}} {self.span_seconds[name]:.3f}')
+            lines.append(f'hb_span_seconds_count{{span="{name}"}} {self.span_count[name]}')
+
+        temp_path = self.prometheus_path.with_name(f".{self.prometheus_path.name}.tmp")
+        try:
+            self.prometheus_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+            os.replace(temp_path, self.prometheus_path)
+        except OSError as e:
+            logging.warning(f"Error writing Prometheus metrics: {e}")
@@ -0,0 +1,371 @@
+"""Process-pool backend: runs each job's stages in a worker process.
+
+The parent keeps an ordinary DownloadWorker per job; ProcessPool mirrors
+the counters the child reports into it, so the scheduler, progress
+sampling, journal and listeners work unchanged. Extraction and
+postprocessing then hold a GIL other than the GUI's, and cancel() kills
+the process at once instead of waiting for yt-dlp's next callback.
+"""
+import logging
+import multiprocessing
+import queue
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from engine import (
+    DEFAULT_MAX_WORKERS, DEFAULT_POSTPROCESS_WORKERS, PROGRESS_FPS, DownloadWorker, JobStatus,
+    SessionPool
+)
+from storage import InfoCache, LibraryIndex
+
+# Constants
+# Room for every download plus a postprocessing backlog of one job per FFmpeg worker;
+# DownloadScheduler resizes its pool the same way from its own settings
+PROCESS_POOL_SIZE = DEFAULT_MAX_WORKERS + DEFAULT_POSTPROCESS_WORKERS
+# Seconds between cancellation checks while waiting for a free process
+PROCESS_WAIT_INTERVAL = 0.1
+PROCESS_DIED_MESSAGE = "O processo de download terminou inesperadamente"
+POOL_CLOSED_MESSAGE = "Os processos de download foram encerrados"
+# Seconds a worker process gets to exit after its pipe closes
+PROCESS_EXIT_TIMEOUT = 5.0
+# Attributes streamed from the child's job to its parent-side mirror
+MIRRORED_ATTRIBUTES = ("downloaded_bytes", "total_bytes", "fragment_index", "fragment_count",
+                       "finishing", "turbo_level", "session_reused", "selection", "is_playlist",
+                       "entry_count")
+
+
+class ProcessDied(Exception):
+    """The worker process exited or was killed while running a stage."""
+
+
+class RemoteTurbo:
+    """TurboTuner stand-in for a worker process: the parent's tuner picks and learns."""
+
+    def __init__(self, level: int, send):
+        self.level = level
+        self.send = send
+
+    def choose(self, host: str) -> int:
+        """The level the parent chose for this job."""
+        return self.level
+
+    def record(self, host: str, level: int, speed: float) -> None:
+        """Forward a measurement to the parent, which owns the tuning file."""
+        self.send("turbo", host, level, speed)
+
+
+def job_spec(job: DownloadWorker) -> Dict:
+    """Everything a worker process needs to rebuild the job."""
+    return {
+        "url": job.url, "media_type": job.media_type, "quality": job.quality, "fmt": job.fmt,
+        "no_audio": job.no_audio, "priority": job.priority, "quiet": job.quiet,
+        "targets": job.targets, "output_dir": str(job.output_dir),
+        "output_template": job.output_template,
+        "staging_dir": job.staging_dir and str(job.staging_dir),
+        "info_cache": job.info_cache is not None, "library": job.library is not None,
+        "turbo_level": job.turbo_level if job.turbo is not None else None,
+        "ratelimit": job.ratelimit,
+        "output_files": [str(path) for path in job.output_files],
+        "fragments": dict(job._fragment_bases),
+        "downloaded_bytes": job.downloaded_bytes, "total_bytes": job.total_bytes,
+    }
+
+
+def job_snapshot(job: DownloadWorker) -> Dict:
+    """Counters, outputs and metrics of a job, for its parent-side mirror."""
+    snapshot = {name: getattr(job, name) for name in MIRRORED_ATTRIBUTES}
+    snapshot.update(
+        status=job.status, message=job.message,
+        output_files=[str(path) for path in job.output_files],
+        fragments=dict(job._fragment_bases),
+        durations=dict(job.metrics.durations), retries=job.metrics.retries,
+        peak_speed=job.metrics.peak_speed,
+    )
+    return snapshot
+
+
+def apply_snapshot(job: DownloadWorker, snapshot: Dict) -> None:
+    """Copy a child's snapshot onto the parent's job; status stays the scheduler's."""
+    for name in MIRRORED_ATTRIBUTES:
+        setattr(job, name, snapshot[name])
+    job.output_files.update(Path(path) for path in snapshot["output_files"])
+    job._fragment_bases.update(snapshot["fragments"])
+    job.metrics.durations.update(snapshot["durations"])
+    job.metrics.retries = snapshot["retries"]
+    job.metrics.peak_speed = snapshot["peak_speed"]
+
+
+class WorkerProcess:
+    """Parent-side handle of one worker process and its pipe."""
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=serve, args=(child_conn,), daemon=True,
+                                       name="DownloadProcess")
+        self.process.start()
+        child_conn.close()
+        self.send_lock = threading.Lock()
+
+    def run(self, job: DownloadWorker, stage: str, payload=None):
+        """Run one stage in the child, mirroring its progress; returns the stage's result."""
+        self.send(stage, payload)
+        while True:
+            try:
+                kind, *message = self.conn.recv()
+            except (EOFError, OSError):
+                raise ProcessDied()
+            if kind == "turbo":
+                job.turbo.record(*message)
+                continue
+            apply_snapshot(job, message[-1])
+            if kind == "done":
+                return message[0], message[-1]
+            job._flush_journal()
+
+    def send(self, *message) -> None:
+        """Send a message to the child; a dead child is noticed by run()."""
+        try:
+            with self.send_lock:
+                self.conn.send(message)
+        except OSError:
+            pass
+
+    def alive(self) -> bool:
+        """Whether the process can take another job."""
+        return self.process.is_alive()
+
+    def kill(self) -> None:
+        """Terminate the process immediately."""
+        self.process.kill()
+
+    def close(self) -> None:
+        """Let the process exit, killing it if it does not."""
+        self.conn.close()
+        self.process.join(PROCESS_EXIT_TIMEOUT)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+class ProcessPool:
+    """Worker processes shared by jobs, one job per process at a time.
+
+    A process stays with its job from download through postprocessing,
+    because the deferred postprocessing state lives in it. Processes are
+    started on demand and at most size of them run at once, so downloads
+    wait for a free one while the postprocessing backlog is full. Idle
+    ones are kept for later jobs, with their yt-dlp sessions still warm.
+    """
+
+    def __init__(self, size: int = PROCESS_POOL_SIZE):
+        self.size = max(1, size)
+        # Forking a process that runs Qt and worker threads is unsafe
+        self.context = multiprocessing.get_context("spawn")
+        self.condition = threading.Condition()
+        self._idle: List[WorkerProcess] = []
+        self._live = 0
+        self._closed = False
+
+    def download(self, job: DownloadWorker) -> bool:
+        """DownloadWorker.download() for pooled jobs."""
+        if job.prefetcher is not None:
+            job.prefetcher.wait(job.url, lambda: job.cancelled)
+        job._flush_journal(force=True)
+        if job.turbo is not None:
+            # Chosen here so every process learns from the parent's measurements
+            job.turbo_level = job.turbo.choose(job.host)
+        process = self._acquire(job)
+        if process is None:
+            if job.cancelled:
+                job._stop()
+            else:
+                job._emit_finished(False, POOL_CLOSED_MESSAGE)
+            return False
+        # cancel() kills job._process, so the flag is checked again once it is set
+        job._process = process
+        if job.cancelled:
+            return self._stage_failed(job)
+        try:
+            handoff, snapshot = job._process.run(job, "download", job_spec(job))
+        except ProcessDied:
+            return self._stage_failed(job)
+        if job.is_playlist:
+            # The scheduler lists the entries in this process, see DownloadWorker.iter_entries
+            process, job._process = job._process, None
+            self._release(process)
+        elif not handoff:
+            self._finish(job, snapshot)
+        return handoff
+
+    def postprocess(self, job: DownloadWorker) -> None:
+        """DownloadWorker.postprocess() for pooled jobs."""
+        if job.cancelled:
+            job._process.kill()
+            self._stage_failed(job)
+            return
+        try:
+            _, snapshot = job._process.run(job, "postprocess")
+        except ProcessDied:
+            self._stage_failed(job)
+            return
+        self._finish(job, snapshot)
+
+    def resize(self, size: int) -> None:
+        """Change how many processes may run at once; surplus idle ones stop."""
+        with self.condition:
+            self.size = max(1, size)
+            excess = max(0, self._live - self.size)
+            surplus, self._idle = self._idle[:excess], self._idle[excess:]
+            self.condition.notify_all()
+        for process in surplus:
+            self._retire(process)
+
+    def close(self) -> None:
+        """Stop idle processes; busy ones stop when their job finishes."""
+        with self.condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self.condition.notify_all()
+        for process in idle:
+            self._retire(process)
+
+    def _acquire(self, job: DownloadWorker) -> Optional[WorkerProcess]:
+        """Take an idle process or start a new one; None once the job is cancelled or the pool closed."""
+        dead = []
+        with self.condition:
+            while True:
+                if self._closed:
+                    return None
+                while self._idle:
+                    process = self._idle.pop()
+                    if process.alive():
+                        return process
+                    dead.append(process)
+                    self._live -= 1
+                if self._live < self.size:
+                    self._live += 1
+                    break
+                if job.cancelled:
+                    return None
+                self.condition.wait(PROCESS_WAIT_INTERVAL)
+        for process in dead:
+            process.close()
+        try:
+            return WorkerProcess(self.context)
+        except Exception:
+            with self.condition:
+                self._live -= 1
+                self.condition.notify()
+            raise
+
+    def _release(self, process: WorkerProcess) -> None:
+        """Keep a finished job's process for the next job unless the pool is closed."""
+        with self.condition:
+            if not self._closed and process.alive():
+                self._idle.append(process)
+                self.condition.notify()
+                return
+        self._retire(process)
+
+    def _retire(self, process: WorkerProcess) -> None:
+        """Stop a process and free its slot."""
+        process.close()
+        with self.condition:
+            self._live -= 1
+            self.condition.notify()
+
+    def _finish(self, job: DownloadWorker, snapshot: Dict) -> None:
+        """Report the child's outcome through the parent's job."""
+        process, job._process = job._process, None
+        self._release(process)
+        job._emit_finished(snapshot["status"] == JobStatus.DONE, snapshot["message"])
+
+    def _stage_failed(self, job: DownloadWorker) -> bool:
+        """Handle a killed or crashed process; cancelled jobs clean up here."""
+        process, job._process = job._process, None
+        process.kill()
+        self._retire(process)
+        if job.cancelled:
+            job._stop()
+        else:
+            job._emit_finished(False, PROCESS_DIED_MESSAGE)
+        return False
+
+
+def serve(conn) -> None:
+    """Worker process body: run job stages sent by the parent until the pipe closes."""
+    logging.basicConfig(level=logging.WARNING)
+    sessions = SessionPool()
+    services: Dict[str, object] = {}
+    stages: queue.Queue = queue.Queue()
+    send_lock = threading.Lock()
+    current: List[Optional[DownloadWorker]] = [None]
+
+    def send(*message) -> None:
+        with send_lock:
+            conn.send(message)
+
+    def listen() -> None:
+        # Rate changes arrive while the main thread is busy with a stage
+        while True:
+            try:
+                kind, payload = conn.recv()
+            except (EOFError, OSError):
+                stages.put(None)
+                return
+            if kind == "ratelimit":
+                if current[0] is not None:
+                    current[0].set_ratelimit(payload)
+            else:
+                stages.put((kind, payload))
+
+    def report(job: DownloadWorker, done: threading.Event) -> None:
+        while not done.wait(1 / PROGRESS_FPS):
+            send("state", job_snapshot(job))
+
+    def service(name: str, factory):
+        if name not in services:
+            services[name] = factory()
+        return services[name]
+
+    threading.Thread(target=listen, daemon=True, name="ParentPipe").start()
+    while True:
+        stage = stages.get()
+        if stage is None:
+            break
+        kind, spec = stage
+        if kind == "download":
+            if current[0] is not None:
+                # A playlist job keeps its session open for listing entries
+                current[0]._close_ydl()
+            job = DownloadWorker(
+                spec["url"], spec["media_type"], spec["quality"], spec["fmt"], spec["no_audio"],
+                spec["priority"], quiet=spec["quiet"], targets=spec["targets"],
+                info_cache=service("info_cache", InfoCache) if spec["info_cache"] else None,
+                library=service("library", LibraryIndex) if spec["library"] else None,
+                turbo=RemoteTurbo(spec["turbo_level"], send) if spec["turbo_level"] is not None else None,
+                output_dir=spec["output_dir"], output_template=spec["output_template"],
+                staging_dir=spec["staging_dir"],
+            )
+            job.sessions = sessions
+            job.output_files.update(Path(path) for path in spec["output_files"])
+            job._fragment_bases.update(spec["fragments"])
+            job.downloaded_bytes = spec["downloaded_bytes"]
+            job.total_bytes = spec["total_bytes"]
+            job.set_ratelimit(spec["ratelimit"])
+            job.status = JobStatus.RUNNING
+            current[0] = job
+        job = current[0]
+
+        done = threading.Event()
+        reporter = threading.Thread(target=report, args=(job, done), daemon=True,
+                                    name="ProgressReporter")
+        reporter.start()
+        try:
+            result = job.download() if kind == "download" else job.postprocess()
+        finally:
+            done.set()
+            reporter.join()
+        send("done", result, job_snapshot(job))
+    sessions.close()
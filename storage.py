@@ -0,0 +1,410 @@
+import hashlib
+import json
+import logging
+import logging.handlers
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse, urlunparse
+
+# Constants
+APP_DATA_FOLDER = Path.home() / ".hb_downloader"
+INFO_CACHE_PATH = APP_DATA_FOLDER / "info_cache.sqlite3"
+INFO_CACHE_TTL = 6 * 3600
+INFO_CACHE_MAX_BYTES = 64 * 1024 * 1024
+FORMAT_EXPIRY_MARGIN = 10 * 60
+# Extractors whose ids are only a file name, unique per URL rather than per site
+URL_KEYED_EXTRACTORS = ("Generic",)
+JOURNAL_PATH = APP_DATA_FOLDER / "jobs.sqlite3"
+JOURNAL_RETENTION = 7 * 24 * 3600
+LIBRARY_PATH = APP_DATA_FOLDER / "library.sqlite3"
+HOST_TUNING_PATH = APP_DATA_FOLDER / "host_tuning.json"
+HOST_TUNING_SMOOTHING = 0.5
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+HISTORY_PATH = APP_DATA_FOLDER / "history.jsonl"
+HISTORY_MAX_BYTES = 5 * 1024 * 1024
+HISTORY_BACKUPS = 3
+
+
+def canonical_url(url: str) -> str:
+    """Normalize a URL so trivially different spellings share a cache entry."""
+    parts = urlparse(url.strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    netloc = f"{host}:{parts.port}" if parts.port else host
+    return urlunparse((parts.scheme.lower(), netloc, parts.path.rstrip("/"), "", parts.query, ""))
+
+
+class InfoCache:
+    """Persistent, size-bounded LRU cache of yt-dlp extraction results."""
+
+    def __init__(self, path: Path = INFO_CACHE_PATH, ttl: float = INFO_CACHE_TTL,
+                 max_bytes: int = INFO_CACHE_MAX_BYTES):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                info BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed);
+            CREATE TABLE IF NOT EXISTS aliases (
+                url TEXT PRIMARY KEY,
+                key TEXT NOT NULL
+            );
+            -- Entries of URL-keyed extractors cached when they were keyed by id
+            DELETE FROM entries WHERE key GLOB 'Generic:*' AND key NOT GLOB 'Generic:*://*';
+            DELETE FROM aliases WHERE key GLOB 'Generic:*' AND key NOT GLOB 'Generic:*://*';
+        """)
+
+    @staticmethod
+    def key_for(info: Dict) -> Optional[str]:
+        """Cache key of an info dict: extractor plus video id, or plus URL for generic pages."""
+        extractor = info.get('extractor_key') or info.get('extractor')
+        if extractor in URL_KEYED_EXTRACTORS:
+            # The generic id is the file name, so every index.m3u8 would share a key
+            url = info.get('webpage_url') or info.get('original_url')
+            return f"{extractor}:{canonical_url(url)}" if url else None
+        if not extractor or not info.get('id'):
+            return None
+        return f"{extractor}:{info['id']}"
+
+    def get(self, url: str) -> Optional[Dict]:
+        """Return cached info for a URL if it is fresh and its format URLs are still valid."""
+        now = time.time()
+        with self.lock:
+            row = self.db.execute(
+                "SELECT e.key, e.info, e.created FROM aliases a JOIN entries e ON e.key = a.key "
+                "WHERE a.url = ?", (canonical_url(url),)
+            ).fetchone()
+            if row is None:
+                return None
+
+            key, blob, created = row
+            info = json.loads(zlib.decompress(blob))
+            if now - created > self.ttl or not self._formats_valid(info, now):
+                self._delete_locked(key)
+                return None
+
+            self.db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self.db.commit()
+        return info
+
+    def put(self, url: str, info: Dict) -> None:
+        """Store a sanitized, JSON-serializable info dict."""
+        key = self.key_for(info)
+        if key is None:
+            return
+
+        blob = zlib.compress(json.dumps(info).encode("utf-8"))
+        now = time.time()
+        aliases = {canonical_url(url)}
+        for alias in (info.get('webpage_url'), info.get('original_url')):
+            if alias:
+                aliases.add(canonical_url(alias))
+
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries (key, info, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?)", (key, blob, len(blob), now, now)
+            )
+            self.db.executemany("INSERT OR REPLACE INTO aliases (url, key) VALUES (?, ?)",
+                                [(alias, key) for alias in aliases])
+            self._evict_locked()
+            self.db.commit()
+
+    def invalidate(self, url: str) -> None:
+        """Drop the entry a URL points to."""
+        with self.lock:
+            row = self.db.execute("SELECT key FROM aliases WHERE url = ?",
+                                  (canonical_url(url),)).fetchone()
+            if row is not None:
+                self._delete_locked(row[0])
+                self.db.commit()
+
+    def close(self) -> None:
+        """Close the underlying database."""
+        with self.lock:
+            self.db.close()
+
+    def _delete_locked(self, key: str) -> None:
+        """Remove an entry and every alias pointing to it."""
+        self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self.db.execute("DELETE FROM aliases WHERE key = ?", (key,))
+
+    def _evict_locked(self) -> None:
+        """Drop least recently used entries until the cache fits max_bytes."""
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for key, size in self.db.execute(
+                "SELECT key, size FROM entries ORDER BY accessed").fetchall():
+            self._delete_locked(key)
+            total -= size
+            if total <= self.max_bytes:
+                break
+        logging.debug(f"Info cache evicted down to {total} bytes")
+
+    @staticmethod
+    def _formats_valid(info: Dict, now: float) -> bool:
+        """Check the signed 'expire' timestamps some sites embed in format URLs."""
+        for fmt in info.get('formats') or [info]:
+            url = fmt.get('url')
+            if not url:
+                continue
+            expire = parse_qs(urlparse(url).query).get('expire')
+            if expire and expire[0].isdigit() and int(expire[0]) < now + FORMAT_EXPIRY_MARGIN:
+                return False
+        return True
+
+
+class JobJournal:
+    """Crash-safe SQLite journal of download jobs, used to resume them after a restart."""
+
+    RESUMABLE = ("queued", "running", "postprocessing", "interrupted")
+
+    def __init__(self, path: Path = JOURNAL_PATH, retention: float = JOURNAL_RETENTION):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.db.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                media_type TEXT NOT NULL,
+                quality TEXT NOT NULL,
+                fmt TEXT NOT NULL,
+                no_audio INTEGER NOT NULL,
+                priority INTEGER NOT NULL,
+                options TEXT NOT NULL,
+                outputs TEXT NOT NULL DEFAULT '{}',
+                downloaded_bytes INTEGER NOT NULL DEFAULT 0,
+                total_bytes INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                message TEXT NOT NULL DEFAULT '',
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status);
+        """)
+        with self.lock:
+            placeholders = ",".join("?" * len(self.RESUMABLE))
+            self.db.execute(f"DELETE FROM jobs WHERE status NOT IN ({placeholders}) AND updated < ?",
+                            (*self.RESUMABLE, time.time() - retention))
+            self.db.commit()
+
+    def add(self, job, options: Dict) -> int:
+        """Record a newly queued job and return its journal id."""
+        now = time.time()
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO jobs (url, media_type, quality, fmt, no_audio, priority, options, "
+                "status, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.url, job.media_type, job.quality, job.fmt, int(job.no_audio), job.priority,
+                 json.dumps(options, default=str), job.status, now, now)
+            )
+            self.db.commit()
+            return cursor.lastrowid
+
+    def update(self, journal_id: int, status: str, downloaded_bytes: int, total_bytes: int,
+               outputs: Dict, message: str = "") -> None:
+        """Persist a job's status, progress and the files it has written so far."""
+        with self.lock:
+            self.db.execute(
+                "UPDATE jobs SET status = ?, downloaded_bytes = ?, total_bytes = ?, outputs = ?, "
+                "message = ?, updated = ? WHERE id = ?",
+                (status, downloaded_bytes, total_bytes, json.dumps(outputs), message,
+                 time.time(), journal_id)
+            )
+            self.db.commit()
+
+    def unfinished(self) -> List[Dict]:
+        """Jobs that were queued, running or interrupted when the app last stopped."""
+        placeholders = ",".join("?" * len(self.RESUMABLE))
+        with self.lock:
+            cursor = self.db.execute(
+                f"SELECT * FROM jobs WHERE status IN ({placeholders}) ORDER BY id", self.RESUMABLE
+            )
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        for row in rows:
+            row['no_audio'] = bool(row['no_audio'])
+            row['options'] = json.loads(row['options'])
+            row['outputs'] = json.loads(row['outputs'])
+        return rows
+
+    def close(self) -> None:
+        """Close the underlying database."""
+        with self.lock:
+            self.db.close()
+
+
+def file_checksum(path: Path) -> str:
+    """SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHECKSUM_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LibraryIndex:
+    """Persistent index of completed downloads, keyed by media and output variant."""
+
+    def __init__(self, path: Path = LIBRARY_PATH):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.db.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS media (
+                key TEXT NOT NULL,
+                variant TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                checksum TEXT NOT NULL,
+                created REAL NOT NULL,
+                url TEXT,
+                PRIMARY KEY (key, variant)
+            ) WITHOUT ROWID;
+            -- Generic pages indexed when they were keyed by file name
+            DELETE FROM media WHERE key GLOB 'Generic:*' AND key NOT GLOB 'Generic:*://*';
+        """)
+        # Indexes written before the source URL was recorded
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(media)")}
+        if "url" not in columns:
+            self.db.execute("ALTER TABLE media ADD COLUMN url TEXT")
+        self.db.commit()
+
+    def find(self, key: str, variant: str, url: str) -> Optional[Dict]:
+        """Return the indexed file for a variant if it came from url and is still on disk, unchanged in size."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT path, size, checksum, url FROM media WHERE key = ? AND variant = ?",
+                (key, variant)
+            ).fetchone()
+        if row is None:
+            return None
+
+        path, size, checksum, source = row
+        if source != canonical_url(url):
+            logging.debug(f"Library entry {key} came from {source}, not {url}")
+            return None
+        try:
+            intact = Path(path).stat().st_size == size
+        except OSError:
+            intact = False
+        if not intact:
+            self.remove(key, variant)
+            return None
+        return {"path": path, "size": size, "checksum": checksum}
+
+    def add(self, key: str, variant: str, path: Path, url: str) -> None:
+        """Index a finished file downloaded from url, hashing it first."""
+        path = Path(path)
+        size = path.stat().st_size
+        checksum = file_checksum(path)
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO media (key, variant, path, size, checksum, created, url) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, variant, str(path), size, checksum, time.time(), canonical_url(url))
+            )
+            self.db.commit()
+
+    def remove(self, key: str, variant: str) -> None:
+        """Forget one indexed file."""
+        with self.lock:
+            self.db.execute("DELETE FROM media WHERE key = ? AND variant = ?", (key, variant))
+            self.db.commit()
+
+    def close(self) -> None:
+        """Close the underlying database."""
+        with self.lock:
+            self.db.close()
+
+
+class HostTuning:
+    """Per-host throughput measured for each turbo level, persisted as JSON."""
+
+    def __init__(self, path: Path = HOST_TUNING_PATH, smoothing: float = HOST_TUNING_SMOOTHING):
+        self.path = Path(path)
+        self.smoothing = smoothing
+        self.lock = threading.Lock()
+        self.hosts: Dict[str, Dict[str, float]] = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                self.hosts = json.load(file)
+        except (OSError, ValueError):
+            pass
+
+    def get(self, host: str) -> Dict[int, float]:
+        """Measured bytes per second by level for a host."""
+        with self.lock:
+            return {int(level): speed for level, speed in self.hosts.get(host, {}).items()}
+
+    def record(self, host: str, level: int, speed: float) -> None:
+        """Blend a new measurement into the host's history and save it."""
+        with self.lock:
+            levels = self.hosts.setdefault(host, {})
+            previous = levels.get(str(level))
+            if previous is not None:
+                speed = previous + self.smoothing * (speed - previous)
+            levels[str(level)] = speed
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                temp_path = self.path.with_suffix(".tmp")
+                with open(temp_path, "w", encoding="utf-8") as file:
+                    json.dump(self.hosts, file)
+                temp_path.replace(self.path)
+            except OSError as e:
+                logging.warning(f"Error saving host tuning: {e}")
+
+
+class JobHistory:
+    """Rotating JSON-lines log of finished jobs dropped from the in-memory history."""
+
+    def __init__(self, path: Path = HISTORY_PATH, max_bytes: int = HISTORY_MAX_BYTES,
+                 backups: int = HISTORY_BACKUPS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.handler = logging.handlers.RotatingFileHandler(
+            self.path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True
+        )
+        self.handler.setFormatter(logging.Formatter("%(message)s"))
+        self.logger = logging.getLogger(f"Downloader.history.{id(self)}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(self.handler)
+
+    def append(self, records: List[Dict]) -> None:
+        """Write one line per job record."""
+        for record in records:
+            self.logger.info(json.dumps(record, ensure_ascii=False))
+
+    def close(self) -> None:
+        """Flush and close the log file."""
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
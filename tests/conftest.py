@@ -0,0 +1,34 @@
+import functools
+import http.server
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+# The modules live at the repository root, next to main.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    """Static file handler that keeps request logs out of the test output."""
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def media_server(tmp_path):
+    """Local HTTP server for files written to its root; yields (root, base_url)."""
+    root = tmp_path / "srv"
+    root.mkdir()
+    handler = functools.partial(QuietHandler, directory=str(root))
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield root, f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
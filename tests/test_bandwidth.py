@@ -0,0 +1,118 @@
+import datetime
+import os
+import threading
+import time
+
+import pytest
+
+from engine import (
+    PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, BandwidthManager, DownloadScheduler,
+    DownloadWorker, JobStatus, TokenBucket
+)
+
+
+class FakeJob:
+    """Just what BandwidthManager reads from a job."""
+
+    def __init__(self, job_id: int, priority: int):
+        self.job_id = job_id
+        self.priority = priority
+        self.ratelimit = None
+
+    def set_ratelimit(self, ratelimit):
+        self.ratelimit = ratelimit
+
+
+def test_bucket_without_rate_never_blocks():
+    bucket = TokenBucket()
+    start = time.monotonic()
+    bucket.consume(100 * 1024 * 1024)
+    assert time.monotonic() - start < 0.05
+
+
+def test_bucket_blocks_until_bytes_are_paid():
+    bucket = TokenBucket(rate=1_000_000, burst=0.1)
+    start = time.monotonic()
+    # The bucket starts empty, so 300 KB at 1 MB/s owe about 0.3 s
+    for _ in range(3):
+        bucket.consume(100_000)
+    elapsed = time.monotonic() - start
+    assert 0.25 <= elapsed < 0.6
+
+
+def test_bucket_rate_change_releases_waiter():
+    bucket = TokenBucket(rate=1000)
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (bucket.consume(1_000_000), done.set()))
+    thread.start()
+    time.sleep(0.05)
+    assert not done.is_set()
+    bucket.set_rate(None)
+    assert done.wait(1)
+    thread.join()
+
+
+def test_bucket_consume_stops_when_asked():
+    bucket = TokenBucket(rate=1000)
+    stop = threading.Event()
+    threading.Timer(0.1, stop.set).start()
+    start = time.monotonic()
+    bucket.consume(1_000_000, stop.is_set)
+    assert time.monotonic() - start < 0.5
+
+
+def test_current_limit_follows_schedule():
+    manager = BandwidthManager(limit=1000, schedule=[
+        (datetime.time(22), datetime.time(7), None),
+        (datetime.time(12), datetime.time(13), 500),
+    ])
+    try:
+        day = datetime.date(2024, 1, 1)
+        assert manager.current_limit(datetime.datetime.combine(day, datetime.time(10))) == 1000
+        assert manager.current_limit(datetime.datetime.combine(day, datetime.time(12, 30))) == 500
+        # Windows crossing midnight cover both sides of it
+        assert manager.current_limit(datetime.datetime.combine(day, datetime.time(23))) is None
+        assert manager.current_limit(datetime.datetime.combine(day, datetime.time(6, 59))) is None
+        assert manager.current_limit(datetime.datetime.combine(day, datetime.time(7))) == 1000
+    finally:
+        manager.close()
+
+
+def test_budget_is_split_by_priority():
+    manager = BandwidthManager(limit=700)
+    high, normal, low = FakeJob(1, PRIORITY_HIGH), FakeJob(2, PRIORITY_NORMAL), FakeJob(3, PRIORITY_LOW)
+    for job in (high, normal, low):
+        manager.attach(job)
+    assert (high.ratelimit, normal.ratelimit, low.ratelimit) == (400, 200, 100)
+
+    manager.detach(high)
+    assert high.ratelimit is None
+    assert normal.ratelimit == pytest.approx(700 * 2 / 3)
+
+    manager.set_limit(None)
+    assert normal.ratelimit is None and low.ratelimit is None
+    manager.close()
+
+
+def test_download_respects_global_limit(media_server, tmp_path):
+    pytest.importorskip("yt_dlp")
+    root, base_url = media_server
+    size = 1024 * 1024
+    (root / "clip.mp4").write_bytes(os.urandom(size))
+    rate = 512 * 1024
+
+    bandwidth = BandwidthManager(limit=rate)
+    scheduler = DownloadScheduler(max_workers=1, bandwidth=bandwidth)
+    job = DownloadWorker(f"{base_url}/clip.mp4", "Vídeo", "Melhor", "MP4", False, quiet=True,
+                         output_dir=tmp_path / "out", staging_dir=tmp_path / "staging")
+    start = time.monotonic()
+    scheduler.submit(job)
+    assert scheduler.wait(timeout=30)
+    elapsed = time.monotonic() - start
+    scheduler.shutdown()
+    bandwidth.close()
+
+    assert job.status == JobStatus.DONE, job.message
+    assert (tmp_path / "out" / "clip-NA.mp4").stat().st_size == size
+    # 1 MiB at 512 KiB/s, less the bucket's burst allowance
+    assert elapsed >= 1.5
@@ -0,0 +1,111 @@
+import threading
+import time
+
+from engine import (
+    VIDEO_QUALITIES, DownloadWorker, audio_target, max_height, offered_qualities,
+    select_audio_format, select_video_formats, stream_copy_formats
+)
+
+FORMATS = [
+    {"format_id": "18", "ext": "mp4", "vcodec": "avc1.42001E", "acodec": "mp4a.40.2", "height": 360},
+    {"format_id": "137", "ext": "mp4", "vcodec": "avc1.640028", "acodec": "none", "height": 1080,
+     "tbr": 4000},
+    {"format_id": "248", "ext": "webm", "vcodec": "vp9", "acodec": "none", "height": 1080, "tbr": 2500},
+    {"format_id": "136", "ext": "mp4", "vcodec": "avc1.4d401f", "acodec": "none", "height": 720},
+    {"format_id": "140", "ext": "m4a", "vcodec": "none", "acodec": "mp4a.40.2", "abr": 128},
+    {"format_id": "251", "ext": "webm", "vcodec": "none", "acodec": "opus", "abr": 160},
+    # Ids containing format spec operators cannot be pinned
+    {"format_id": "hls-1080+x", "ext": "mp4", "vcodec": "avc1", "acodec": "none", "height": 2160},
+]
+
+
+def test_max_height():
+    assert max_height("720p") == 720
+    assert max_height("2k") == 1440
+    assert max_height(VIDEO_QUALITIES[0]) is None
+
+
+def test_mp4_pairs_fitting_codecs():
+    selection = select_video_formats(FORMATS, "mp4", None, False)
+    assert selection.spec == "137+140"
+    assert selection.stream_copy
+
+
+def test_webm_prefers_codec_fit_over_bitrate():
+    selection = select_video_formats(FORMATS, "webm", None, False)
+    assert selection.spec == "248+251"
+    assert selection.stream_copy
+
+
+def test_height_cap_and_no_audio():
+    selection = select_video_formats(FORMATS, "mp4", 720, True)
+    assert selection.spec == "136"
+
+
+def test_progressive_file_wins_when_tall_enough():
+    formats = FORMATS + [{"format_id": "134", "ext": "mp4", "vcodec": "avc1.4d401e",
+                          "acodec": "none", "height": 360}]
+    selection = select_video_formats(formats, "mp4", 360, False)
+    assert selection.spec == "18"
+    assert "no merge" in selection.summary
+
+
+def test_unknown_codecs_leave_choice_to_yt_dlp():
+    assert select_video_formats([{"format_id": "0", "ext": "mp4"}], "mp4", None, False) is None
+    assert select_audio_format([{"format_id": "0", "ext": "mp3"}], [audio_target("mp3")]) is None
+
+
+def test_audio_prefers_stream_copy_then_bitrate():
+    selection = select_audio_format(FORMATS, [audio_target("m4a")], duration=600)
+    assert selection.spec == "140"
+    assert selection.stream_copy
+    assert selection.cpu_saved == 10.0
+
+    selection = select_audio_format(FORMATS, [audio_target("mp3")])
+    assert selection.spec == "251"
+    assert not selection.stream_copy
+
+
+def test_audio_picks_stream_most_targets_copy():
+    targets = [audio_target("opus"), audio_target("m4a"), audio_target("acc")]
+    assert select_audio_format(FORMATS, targets).spec == "140"
+
+
+def test_offered_qualities_and_stream_copy_formats():
+    assert offered_qualities(FORMATS) == [VIDEO_QUALITIES[0], "2160p", "1080p", "720p", "360p"]
+    assert stream_copy_formats(FORMATS, "Vídeo") == {"MP4", "MKV", "WEBM"}
+    assert stream_copy_formats(FORMATS, "Áudio") == {"ACC", "M4A", "OPUS"}
+
+
+def test_targets_sharing_an_output_file_are_dropped():
+    job = DownloadWorker("https://example.com/a", "Áudio", "128k", "M4A", False,
+                         targets=[("ACC", "128k"), ("MP3", "128k"), ("ACC", "192k")])
+    assert job.targets == [("m4a", "128k"), ("mp3", "128k"), ("acc", "192k")]
+
+
+def test_target_encodes_only_borrow_free_slots(tmp_path, monkeypatch):
+    job = DownloadWorker("https://example.com/a", "Áudio", "128k", "MP3", False,
+                         targets=[("opus", "128k"), ("flac", "128k"), ("ogg", "128k")])
+    job.cpu_slots = threading.Semaphore(2)
+    job.cpu_slots.acquire()  # held by the job's own postprocessing thread
+    lock, running, peak, encoded = threading.Lock(), [0], [0], []
+
+    def encode(source, info, fmt, quality):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+            encoded.append(fmt)
+
+    monkeypatch.setattr(job, "_transcode_target", encode)
+    source = tmp_path / "a.m4a"
+    source.write_bytes(b"audio")
+    job._transcode_targets({"filepath": str(source)})
+
+    assert sorted(encoded) == ["flac", "mp3", "ogg", "opus"]
+    assert peak[0] == 2
+    assert not source.exists()
+    # The borrowed slot is back
+    assert job.cpu_slots.acquire(blocking=False)
@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import Counter
+
+from engine import PRIORITY_HIGH, PRIORITY_LOW, DownloadScheduler, DownloadWorker, JobStatus, JobSummary
+
+
+class FakeJob(DownloadWorker):
+    """Job whose download stage only sleeps, recording how many ran per host at once."""
+
+    lock = threading.Lock()
+
+    def __init__(self, url: str, load: Counter, peaks: Counter, order: list, delay: float = 0.05,
+                 **kwargs):
+        super().__init__(url, "Vídeo", "Melhor", "MP4", False, quiet=True, **kwargs)
+        self.load, self.peaks, self.order, self.delay = load, peaks, order, delay
+
+    def download(self) -> bool:
+        with self.lock:
+            self.load[self.host] += 1
+            self.peaks[self.host] = max(self.peaks[self.host], self.load[self.host])
+            self.order.append(self.job_id)
+        time.sleep(self.delay)
+        with self.lock:
+            self.load[self.host] -= 1
+        self._emit_finished(True, "")
+        return False
+
+
+def make_jobs(urls, **kwargs):
+    load, peaks, order = Counter(), Counter(), []
+    return [FakeJob(url, load, peaks, order, **kwargs) for url in urls], peaks, order
+
+
+def test_per_host_limit():
+    scheduler = DownloadScheduler(max_workers=6, per_host_limit=2, reuse_sessions=False)
+    urls = [f"https://a.example/{i}" for i in range(6)] + [f"https://www.b.example/{i}" for i in range(3)]
+    jobs, peaks, _ = make_jobs(urls)
+    for job in jobs:
+        scheduler.submit(job)
+    assert scheduler.wait(timeout=10)
+    scheduler.shutdown()
+
+    assert all(job.status == JobStatus.DONE for job in jobs)
+    assert peaks == {"a.example": 2, "b.example": 2}
+
+
+def test_priority_order():
+    scheduler = DownloadScheduler(max_workers=1, reuse_sessions=False)
+    blocker, peaks, order = make_jobs(["https://a.example/blocker"], delay=0.2)
+    scheduler.submit(blocker[0])
+    time.sleep(0.05)
+    low = FakeJob("https://a.example/low", Counter(), peaks, order, priority=PRIORITY_LOW)
+    high = FakeJob("https://a.example/high", Counter(), peaks, order, priority=PRIORITY_HIGH)
+    scheduler.submit(low)
+    scheduler.submit(high)
+    assert scheduler.wait(timeout=10)
+    scheduler.shutdown()
+
+    assert order == [blocker[0].job_id, high.job_id, low.job_id]
+
+
+def test_cancel_queued_job():
+    scheduler = DownloadScheduler(max_workers=1, reuse_sessions=False)
+    (first, second), _, order = make_jobs(["https://a.example/1", "https://a.example/2"], delay=0.2)
+    scheduler.submit(first)
+    scheduler.submit(second)
+    scheduler.cancel(second.job_id)
+    assert scheduler.wait(timeout=10)
+    scheduler.shutdown()
+
+    assert second.status == JobStatus.CANCELLED
+    assert order == [first.job_id]
+
+
+def test_finished_jobs_are_bounded():
+    scheduler = DownloadScheduler(max_workers=2, reuse_sessions=False, history_limit=3)
+    jobs, _, _ = make_jobs([f"https://a.example/{i}" for i in range(8)], delay=0)
+    for job in jobs:
+        scheduler.submit(job)
+    assert scheduler.wait(timeout=10)
+    scheduler.shutdown()
+
+    # Listeners, and retiring, run just after the job stops counting as pending
+    deadline = time.monotonic() + 2
+    while len(scheduler.jobs()) > 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    remaining = scheduler.jobs()
+    assert len(remaining) == 3
+    assert all(isinstance(job, JobSummary) and job.status == JobStatus.DONE for job in remaining)
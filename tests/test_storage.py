@@ -0,0 +1,100 @@
+import sqlite3
+import time
+
+from storage import InfoCache, LibraryIndex, canonical_url
+
+
+def generic_info(url: str, **extra) -> dict:
+    """What the generic extractor reports for a direct file link."""
+    name = url.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    return {"extractor_key": "Generic", "id": name, "webpage_url": url, "url": url,
+            "title": name, **extra}
+
+
+def test_canonical_url():
+    assert canonical_url("HTTPS://www.Example.com/watch/?v=1#t=3") == "https://example.com/watch?v=1"
+    assert canonical_url("https://example.com:8080/a") == "https://example.com:8080/a"
+
+
+def test_aliases_share_one_entry(tmp_path):
+    cache = InfoCache(tmp_path / "cache.sqlite3")
+    info = {"extractor_key": "Youtube", "id": "abc", "title": "Video",
+            "webpage_url": "https://www.youtube.com/watch?v=abc"}
+    cache.put("https://youtu.be/abc", info)
+    assert cache.get("https://youtu.be/abc")["title"] == "Video"
+    assert cache.get("https://youtube.com/watch?v=abc")["title"] == "Video"
+
+    cache.invalidate("https://youtu.be/abc")
+    assert cache.get("https://www.youtube.com/watch?v=abc") is None
+    cache.close()
+
+
+def test_generic_entries_are_keyed_by_url(tmp_path):
+    cache = InfoCache(tmp_path / "cache.sqlite3")
+    cache.put("http://host/a.mp4", generic_info("http://host/a.mp4"))
+    cache.put("http://host/sub/a.mp4", generic_info("http://host/sub/a.mp4"))
+    assert cache.get("http://host/a.mp4")["url"] == "http://host/a.mp4"
+    assert cache.get("http://host/sub/a.mp4")["url"] == "http://host/sub/a.mp4"
+    cache.close()
+
+
+def test_stale_and_expired_entries_are_dropped(tmp_path):
+    cache = InfoCache(tmp_path / "cache.sqlite3", ttl=0.05)
+    cache.put("http://host/a.mp4", generic_info("http://host/a.mp4"))
+    time.sleep(0.1)
+    assert cache.get("http://host/a.mp4") is None
+    cache.close()
+
+    cache = InfoCache(tmp_path / "other.sqlite3")
+    expire = int(time.time()) + 60  # inside the safety margin
+    signed = f"http://cdn/b.mp4?expire={expire}"
+    cache.put("http://host/b.mp4", generic_info("http://host/b.mp4", formats=[{"url": signed}]))
+    assert cache.get("http://host/b.mp4") is None
+    cache.close()
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = InfoCache(tmp_path / "cache.sqlite3", max_bytes=1)
+    cache.put("http://host/a.mp4", generic_info("http://host/a.mp4"))
+    cache.put("http://host/b.mp4", generic_info("http://host/b.mp4"))
+    assert cache.get("http://host/a.mp4") is None
+    cache.close()
+
+
+def test_library_matches_key_variant_and_source(tmp_path):
+    library = LibraryIndex(tmp_path / "library.sqlite3")
+    path = tmp_path / "a.mp4"
+    path.write_bytes(b"video")
+    library.add("Generic:http://host/a.mp4", "Vídeo:mp4:Melhor:0", path, "http://host/a.mp4")
+
+    entry = library.find("Generic:http://host/a.mp4", "Vídeo:mp4:Melhor:0", "http://HOST/a.mp4")
+    assert entry["path"] == str(path) and entry["size"] == 5
+    assert library.find("Generic:http://host/a.mp4", "Vídeo:mp4:720p:0", "http://host/a.mp4") is None
+    assert library.find("Generic:http://host/a.mp4", "Vídeo:mp4:Melhor:0",
+                        "http://host/sub/a.mp4") is None
+
+    # A file changed on disk no longer counts as downloaded
+    path.write_bytes(b"edited video")
+    assert library.find("Generic:http://host/a.mp4", "Vídeo:mp4:Melhor:0", "http://host/a.mp4") is None
+    library.close()
+
+
+def test_library_upgrades_index_without_source(tmp_path):
+    path = tmp_path / "library.sqlite3"
+    db = sqlite3.connect(str(path))
+    db.execute("CREATE TABLE media (key TEXT NOT NULL, variant TEXT NOT NULL, path TEXT NOT NULL, "
+               "size INTEGER NOT NULL, checksum TEXT NOT NULL, created REAL NOT NULL, "
+               "PRIMARY KEY (key, variant)) WITHOUT ROWID")
+    db.execute("INSERT INTO media VALUES ('Youtube:abc', 'Vídeo:mp4:Melhor:0', 'a.mp4', 5, '', 0)")
+    db.commit()
+    db.close()
+
+    library = LibraryIndex(path)
+    # Entries without a recorded source never match, so the file is fetched again
+    assert library.find("Youtube:abc", "Vídeo:mp4:Melhor:0", "https://youtube.com/watch?v=abc") is None
+    video = tmp_path / "a.mp4"
+    video.write_bytes(b"video")
+    library.add("Youtube:abc", "Vídeo:mp4:Melhor:0", video, "https://youtube.com/watch?v=abc")
+    assert library.find("Youtube:abc", "Vídeo:mp4:Melhor:0",
+                        "https://www.youtube.com/watch?v=abc")["path"] == str(video)
+    library.close()
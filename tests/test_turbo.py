@@ -0,0 +1,44 @@
+import itertools
+
+from engine import TURBO_LEVELS, TURBO_START_LEVEL, TurboTuner
+from storage import HostTuning
+
+
+STORES = itertools.count()
+
+
+def make_tuner(tmp_path, speeds=None) -> TurboTuner:
+    store = HostTuning(tmp_path / f"host_tuning-{next(STORES)}.json")
+    for level, speed in (speeds or {}).items():
+        store.record("example.com", level, speed)
+    return TurboTuner(store)
+
+
+def test_unknown_host_starts_at_default_level(tmp_path):
+    assert make_tuner(tmp_path).choose("example.com") == TURBO_START_LEVEL
+
+
+def test_climbs_while_faster_and_probes_below(tmp_path):
+    assert make_tuner(tmp_path, {1: 100}).choose("example.com") == 2
+    assert make_tuner(tmp_path, {1: 100, 2: 200}).choose("example.com") == 3
+    # Top level reached, with the level below it measured and slower
+    assert make_tuner(tmp_path, {2: 100, 3: 200}).choose("example.com") == 3
+    # Nothing above the top level, so the one below is tried
+    assert make_tuner(tmp_path, {3: 200}).choose("example.com") == 2
+
+
+def test_settles_on_fastest_level(tmp_path):
+    tuner = make_tuner(tmp_path, {0: 90, 1: 100, 2: 101, 3: 50})
+    assert tuner.choose("example.com") == 2
+
+
+def test_measurements_are_smoothed_and_persisted(tmp_path):
+    path = tmp_path / "host_tuning.json"
+    HostTuning(path).record("example.com", 1, 100)
+    HostTuning(path).record("example.com", 1, 200)
+    assert HostTuning(path).get("example.com") == {1: 150}
+
+
+def test_levels_keep_disk_buffer():
+    for level in range(len(TURBO_LEVELS)):
+        assert 'buffersize' not in TurboTuner.options(level)